@@ -1,5 +1,37 @@
 import csv
 import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def print_table(rows, headers, count):
+    display_rows = rows[:count]
+
+    # Calculate dynamic column widths based on all data in the file
+    col_widths = {}
+    for h in headers:
+        # Find max length among headers and ALL data rows to prevent shifting
+        max_w = max([len(str(row[h])) for row in rows] + [len(h)])
+        col_widths[h] = max_w
+
+    # Print Header Row
+    header_str = " | ".join(f"{h:<{col_widths[h]}}" for h in headers)
+    print(header_str)
+    print("-" * len(header_str))
+
+    # Print Data Rows
+    for row in display_rows:
+        line = []
+        for h in headers:
+            val = row[h]
+            if isinstance(val, (int, float)):
+                # Right-justify numbers
+                line.append(f"{str(val):>{col_widths[h]}}")
+            else:
+                # Left-justify strings
+                line.append(f"{str(val):<{col_widths[h]}}")
+        print(" | ".join(line))
 
 def analyze_csv(filename, sort_field, reverse, count):
     try:
@@ -32,44 +64,75 @@ def analyze_csv(filename, sort_field, reverse, count):
                 print(f"Error: Field '{sort_field}' does not exist.")
                 return
 
-            display_rows = sorted_data[:count]
+            print_table(sorted_data, headers, count)
 
-            # Calculate dynamic column widths based on all data in the file
-            col_widths = {}
-            for h in headers:
-                # Find max length among headers and ALL data rows to prevent shifting
-                max_w = max([len(str(row[h])) for row in reader] + [len(h)])
-                col_widths[h] = max_w
+    except FileNotFoundError:
+        print(f"Error: File '{filename}' not found.")
 
-            # Print Header Row
-            header_str = " | ".join(f"{h:<{col_widths[h]}}" for h in headers)
-            print(header_str)
-            print("-" * len(header_str))
+def analyze_store(args, sort_field, reverse, count):
+    from tests.llama_results_utils import ResultsIndex
 
-            # Print Data Rows
-            for row in display_rows:
-                line = []
-                for h in headers:
-                    val = row[h]
-                    if isinstance(val, (int, float)):
-                        # Right-justify numbers
-                        line.append(f"{str(val):>{col_widths[h]}}")
-                    else:
-                        # Left-justify strings
-                        line.append(f"{str(val):<{col_widths[h]}}")
-                print(" | ".join(line))
+    index = ResultsIndex(args.store or None)
+    filters = dict(kind=args.kind, run=args.run, model=args.model, since=args.since)
+    if args.runs:
+        runs = index.runs(limit=count, **filters)
+        if not runs:
+            print("No matching runs.")
+            return
+        headers = ["run_id", "kind", "status", "started", "row_count", "git_sha",
+                   "model_hash", "host", "results_csv"]
+        for run in runs:
+            # Short hashes keep the table readable; prefixes work as filters.
+            sha = run["git_sha"] or ""
+            run["git_sha"] = sha[:12] + ("-dirty" if sha.endswith("-dirty") else "")
+            run["model_hash"] = (run["model_hash"] or "")[:12]
+            for h in headers:
+                run[h] = "" if run[h] is None else run[h]
+        print_table(runs, headers, count)
+        return
 
-    except FileNotFoundError:
-        print(f"Error: File '{filename}' not found.")
+    where = {}
+    for item in args.where:
+        key, sep, value = item.partition('=')
+        if not sep:
+            print(f"Error: --where expects column=value, got '{item}'.")
+            return
+        where[key] = value
+    rows = index.query_rows(sort_field, reverse, count, where=where, **filters)
+    if not rows:
+        print("No matching rows.")
+        return
+
+    if args.columns:
+        headers = [h.strip() for h in args.columns.split(',') if h.strip()]
+    else:
+        # Union of the columns of all runs, in first-seen order
+        headers = list(dict.fromkeys(key for row in rows for key in row))
+    for row in rows:
+        for h in headers:
+            if row.get(h) is None:
+                row[h] = ""
+    print_table(rows, headers, count)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Performance CSV Analyzer")
     parser.add_argument("--field", nargs="?", default="throughput_tps", help="Field to sort by")
     parser.add_argument("--order", nargs="?", default="desc", choices=["asc", "desc"], help="Sort order")
-    parser.add_argument("--file", required=True, help="Path to CSV file")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="Path to CSV file")
+    source.add_argument("--store", nargs="?", const="", help="Query every run in the results store (default: results/store)")
     parser.add_argument("--count", type=int, default=5, help="Number of results to show")
+    parser.add_argument("--kind", help="Store: only runs of this kind, e.g. full_sweep")
+    parser.add_argument("--run", help="Store: only runs whose id starts with this")
+    parser.add_argument("--model", help="Store: only runs whose model hash starts with this")
+    parser.add_argument("--since", help="Store: only runs started at or after this date (YYYY-MM-DD)")
+    parser.add_argument("--where", action="append", default=[], help="Store: column=value filter, repeatable")
+    parser.add_argument("--columns", help="Store: comma-separated columns to show")
+    parser.add_argument("--runs", action="store_true", help="Store: list runs instead of rows")
     
     args = parser.parse_args()
     
-    analyze_csv(args.file, args.field, args.order == "desc", args.count)
-
+    if args.file:
+        analyze_csv(args.file, args.field, args.order == "desc", args.count)
+    else:
+        analyze_store(args, args.field, args.order == "desc", args.count)
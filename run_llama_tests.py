@@ -17,6 +17,7 @@ TESTS = {
     "4": ("Sweeps: Threads (--threads/--threads-http)", ["tests/test_llama_server_threads_sweep.py"]),
     "5": ("Sweeps: Round-robin (max_tokens x concurrency)", ["scripts/round_robin_sweep.py"]),
     "6": ("Sweeps: Full (instances x parallel x concurrency)", ["scripts/full_sweep.py"]),
+    "7": ("Sweeps: Prefix cache (prefix x share x cache_prompt)", ["scripts/prefix_cache_sweep.py"]),
 }
 
 
@@ -27,12 +28,13 @@ def check_dependencies():
 
 
 def warn_if_missing_nginx():
-    if shutil.which("nginx"):
+    if shutil.which("nginx") or os.environ.get("LLAMA_PROXY", "").lower() == "python":
         return
     show_msg(
         "Missing nginx",
         "nginx was not found in PATH.\n"
-        "Round-robin tests/sweeps will fail until nginx is installed.",
+        "Round-robin tests/sweeps will fail until nginx is installed,\n"
+        "or set LLAMA_PROXY=python to use the built-in proxy.",
     )
 
 
@@ -0,0 +1,248 @@
+import csv
+import json
+import os
+import platform
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+# Suppress ResourceWarning for unclosed sockets in threaded urllib use (Python 3.12)
+warnings.filterwarnings("ignore", category=ResourceWarning, message="unclosed .*socket")
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from tests.llama_load_utils import (
+    client_ceiling_path,
+    run_batch_async,
+    run_batch_processes,
+    summarize_batch,
+)
+from tests.llama_monitor_utils import ResourceSampler
+from tests.llama_results_utils import tee_results_store
+from tests.llama_server_test_utils import get_http_pool, post_json, start_llama_server
+from tests.llama_sweep_utils import init_results_file, parse_bool_list, parse_int_list
+
+MOCK_SERVER = Path(__file__).resolve().parent.parent / "tests" / "mock_llama_server.py"
+
+BENCH_ENGINES = ("threads", "threads_unpooled", "async", "processes")
+
+
+def run_batch_threads(url, payloads, concurrency):
+    # The sweeps' threaded engine, without retries: the stub doesn't fail.
+    start_time = time.time()
+    results = []
+    errors = 0
+    last_error = None
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(post_json, url, payload) for payload in payloads]
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                errors += 1
+                last_error = exc
+    return summarize_batch(results, errors, last_error, time.time() - start_time)
+
+
+def run_engine(engine, url, payloads, concurrency):
+    if engine == "async":
+        return run_batch_async(url, payloads, concurrency)
+    if engine == "processes":
+        return run_batch_processes(url, payloads, concurrency)
+    pool = get_http_pool()
+    keep_alive = pool.keep_alive
+    pool.keep_alive = engine == "threads"
+    try:
+        return run_batch_threads(url, payloads, concurrency)
+    finally:
+        pool.keep_alive = keep_alive
+
+
+def _cpu_seconds():
+    # Includes reaped children, i.e. finished `processes` workers but not the
+    # still-running stub.
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def measure(engine, url, payloads, concurrency):
+    with ResourceSampler(interval_s=3600) as sampler:
+        cpu_start = _cpu_seconds()
+        result = run_engine(engine, url, payloads, concurrency)
+        cpu_s = _cpu_seconds() - cpu_start
+    completed = len(payloads) - result["errors"]
+    server_p50 = result.get("server_ms_p50")
+    latency_p50 = result.get("latency_ms_p50")
+    result.update(
+        {
+            "cpu_ms_per_request": cpu_s * 1000.0 / completed if completed else None,
+            "client_cpu_pct": (
+                cpu_s / result["elapsed"] * 100.0 if result["elapsed"] > 0 else None
+            ),
+            "stub_cpu_pct": sampler.fields.get("server_cpu_pct"),
+            "client_added_ms_p50": (
+                latency_p50 - server_p50
+                if latency_p50 is not None and server_p50 is not None
+                else None
+            ),
+        }
+    )
+    return result
+
+
+def _format(value, precision=3):
+    return "" if value is None else str(round(value, precision))
+
+
+def main():
+    engines = [
+        item.strip()
+        for item in os.environ.get(
+            "LLAMA_CLIENT_BENCH_ENGINES", ",".join(BENCH_ENGINES)
+        ).split(",")
+        if item.strip()
+    ]
+    for engine in engines:
+        if engine not in BENCH_ENGINES:
+            raise ValueError(
+                f"Unknown engine {engine!r}; "
+                f"expected one of {', '.join(BENCH_ENGINES)}."
+            )
+    concurrency_list = parse_int_list(
+        os.environ.get("LLAMA_CLIENT_BENCH_CONCURRENCY_LIST"), "1,4,16,64,256"
+    )
+    stream_list = parse_bool_list(
+        os.environ.get("LLAMA_CLIENT_BENCH_STREAM_LIST"), "0,1"
+    )
+    total_requests = int(os.environ.get("LLAMA_CLIENT_BENCH_REQUESTS", "2000"))
+    n_predict = int(os.environ.get("LLAMA_N_PREDICT", "16"))
+    prompt = os.environ.get("LLAMA_PROMPT", "Benchmark the client.")
+
+    # A zero-latency stub with a slot per request, so the client is the limit.
+    os.environ["LLAMA_SERVER_BIN"] = str(MOCK_SERVER)
+    os.environ["LLAMA_MODEL_PATH"] = str(MOCK_SERVER)
+    os.environ["LLAMA_PARALLEL"] = str(max(concurrency_list))
+    for name in (
+        "LLAMA_MOCK_TOKEN_MS",
+        "LLAMA_MOCK_PROMPT_TOKEN_MS",
+        "LLAMA_MOCK_BATCH_TOKEN_MS",
+        "LLAMA_MOCK_SLOTS",
+        "LLAMA_MOCK_QUEUE_LIMIT",
+        "LLAMA_MOCK_LOAD_S",
+    ):
+        os.environ.pop(name, None)
+
+    results_path = init_results_file("client_overhead_bench", "client_overhead_bench")
+    ceiling_path = client_ceiling_path()
+    print(f"results_file={results_path}")
+    print(f"ceiling_file={ceiling_path}")
+
+    header = [
+        "engine",
+        "stream",
+        "concurrency",
+        "requests",
+        "elapsed_s",
+        "rps",
+        "errors",
+        "cpu_ms_per_request",
+        "client_cpu_pct",
+        "stub_cpu_pct",
+        "latency_ms_p50",
+        "latency_ms_p99",
+        "client_added_ms_p50",
+    ]
+    ceilings = {}
+
+    def run_cell(url, engine, stream, concurrency):
+        key = f"{engine}+stream" if stream else engine
+        payload = {
+            "prompt": prompt,
+            "n_predict": n_predict,
+            "temperature": 0.0,
+            "stream": stream,
+        }
+        count = max(total_requests, concurrency * 4)
+        run_engine(engine, url, [payload] * concurrency, concurrency)
+        result = measure(engine, url, [payload] * count, concurrency)
+        rps = result["achieved_rps"]
+        writer.writerow(
+            [
+                engine,
+                int(stream),
+                concurrency,
+                count,
+                f"{result['elapsed']:.3f}",
+                f"{rps:.1f}",
+                result["errors"],
+                _format(result["cpu_ms_per_request"]),
+                _format(result["client_cpu_pct"], 1),
+                _format(result["stub_cpu_pct"], 1),
+                _format(result.get("latency_ms_p50")),
+                _format(result.get("latency_ms_p99")),
+                _format(result["client_added_ms_p50"]),
+            ]
+        )
+        results_file.flush()
+        print(
+            f"{key} concurrency={concurrency} rps={rps:.1f} "
+            f"cpu_ms_per_request={_format(result['cpu_ms_per_request'])} "
+            f"stub_cpu_pct={_format(result['stub_cpu_pct'], 1)} "
+            f"client_added_ms_p50={_format(result['client_added_ms_p50'])}"
+        )
+        if result["errors"]:
+            return
+        ceiling = ceilings.setdefault(key, {"max_rps": 0.0})
+        if rps > ceiling["max_rps"]:
+            ceiling.update(
+                max_rps=rps,
+                concurrency=concurrency,
+                cpu_ms_per_request=result["cpu_ms_per_request"],
+                stub_cpu_pct=result["stub_cpu_pct"],
+            )
+        # Added latency is cleanest at the lowest load, before queueing sets in.
+        ceiling.setdefault("client_added_ms_p50", result["client_added_ms_p50"])
+
+    with results_path.open("w", newline="", encoding="utf-8") as results_file:
+        writer = csv.writer(results_file)
+        writer.writerow(header)
+        writer = tee_results_store(
+            writer, "client_overhead_bench", header, results_path
+        )
+        with start_llama_server(extra_args=["--log-disable"]) as stub:
+            url = f"{stub['base_url']}/completion"
+            for stream in stream_list:
+                for engine in engines:
+                    for concurrency in sorted(concurrency_list):
+                        run_cell(url, engine, stream, concurrency)
+
+    # Shared by sweeps on this host; re-run after changing hardware or Python.
+    ceiling_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(ceiling_path, "w", encoding="utf-8") as handle:
+        json.dump(
+            {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "host": platform.node(),
+                "python": platform.python_version(),
+                "cpu_count": os.cpu_count(),
+                "n_predict": n_predict,
+                "results_file": str(results_path),
+                "ceilings": ceilings,
+            },
+            handle,
+            indent=2,
+        )
+    for key, ceiling in ceilings.items():
+        note = ""
+        if (ceiling.get("stub_cpu_pct") or 0) >= 90:
+            note = " (stub CPU-bound; the real client ceiling may be higher)"
+        print(
+            f"ceiling {key} max_rps={ceiling['max_rps']:.1f} "
+            f"concurrency={ceiling['concurrency']}{note}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,84 @@
+import contextlib
 import csv
 import os
 import sys
 import time
 import warnings
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
 
 # Suppress ResourceWarning for unclosed sockets in threaded urllib use (Python 3.12)
 warnings.filterwarnings("ignore", category=ResourceWarning, message="unclosed .*socket")
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+from tests.llama_load_utils import (
+    OPEN_LOOP_COLUMNS,
+    PERCENTILE_COLUMNS,
+    PHASE_COLUMNS,
+    STREAM_COLUMNS,
+    ClientCeiling,
+    client_engine_key,
+    completion_urls,
+    format_extra_columns,
+    format_phase_summary,
+    post_json_with_retry,
+    resolve_client_engine,
+    resolve_load_mode,
+    run_batch_async,
+    run_batch_processes,
+    run_open_loop_async,
+    summarize_batch,
+)
+from tests.llama_monitor_utils import (
+    METRICS_COLUMNS,
+    RESOURCE_COLUMNS,
+    SERVER_LOG_COLUMNS,
+    MetricsPoller,
+    ResourceSampler,
+    ServerLogCollector,
+    resource_sampling_enabled,
+)
+from tests.llama_proxy_utils import (
+    PROXY_COLUMNS,
+    PROXY_OVERHEAD_COLUMNS,
+    ProxyStatsCollector,
+    direct_base_urls,
+    format_overhead_summary,
+    proxy_overhead_enabled,
+    proxy_overhead_fields,
+    reload_round_robin_proxy,
+    resolve_proxy_kind,
+    start_round_robin_proxy,
+)
+from tests.llama_results_utils import tee_results_store
 from tests.llama_server_test_utils import (
-    extract_token_count,
+    NGINX_TUNING_COLUMNS,
+    LlamaServerPool,
+    nginx_tuning_fields,
     parse_comma_args,
-    post_json,
+    resolve_lb_strategy,
+    resolve_llama_server_bin,
+    resolve_model_path,
+    server_logs_enabled,
+    server_metrics_enabled,
     start_llama_servers,
-    start_nginx_round_robin,
 )
+from tests.llama_stats_utils import append_histograms
+from tests.llama_sweep_utils import (
+    PlateauTracker,
+    SweepState,
+    init_results_file,
+    nginx_tuning_grid,
+    nginx_tuning_label,
+    parse_float_list,
+    parse_int_list,
+    parse_optional_int_list,
+    refine_points,
+    resolve_sweep_mode,
+)
+from tests.llama_workload_utils import Workload, build_payloads
 
 
-def parse_int_list(value, default):
-    raw = value or default
-    parts = [item.strip() for item in raw.replace(",", " ").split()]
-    return [int(item) for item in parts if item]
-
-def parse_optional_int_list(value, default):
-    raw = value or default
-    parts = [item.strip() for item in raw.replace(",", " ").split()]
-    result = []
-    for item in parts:
-        if not item:
-            continue
-        if item.lower() == "default":
-            result.append(None)
-        else:
-            result.append(int(item))
-    return result or [None]
-
-
-def init_results_file(subdir, prefix):
-    base_dir = Path(os.environ.get("LLAMA_RESULTS_DIR", "results")).expanduser()
-    results_dir = base_dir / subdir
-    results_dir.mkdir(parents=True, exist_ok=True)
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    return results_dir / f"{prefix}_{timestamp}.csv"
-
 def build_server_args(base_args, parallel, batch_size, ubatch_size):
     args = parse_comma_args(base_args)
 
@@ -74,30 +107,6 @@ def build_server_args(base_args, parallel, batch_size, ubatch_size):
     return cleaned
 
 
-def post_json_with_retry(url, payload, timeout, max_attempts, base_sleep_s):
-    for attempt in range(max_attempts):
-        try:
-            return post_json(url, payload, timeout=timeout)
-        except RuntimeError as exc:
-            message = str(exc)
-            retryable = any(
-                code in message
-                for code in (
-                    "HTTP error 500",
-                    "HTTP error 502",
-                    "HTTP error 503",
-                    "HTTP error 504",
-                    "Loading model",
-                )
-            )
-            if retryable:
-                if attempt == max_attempts - 1:
-                    raise
-                time.sleep(base_sleep_s * (attempt + 1))
-                continue
-            raise
-
-
 def run_batch(
     base_url,
     prompt,
@@ -108,7 +117,34 @@ def run_batch(
     request_timeout,
     retry_attempts,
     retry_sleep_s,
+    engine="threads",
+    stream=False,
+    workload=None,
 ):
+    # base_url may be a list of backends to spread requests over directly.
+    payloads = build_payloads(
+        workload, prompt, n_predict, temperature, stream, total_requests
+    )
+    urls = completion_urls(base_url)
+    if engine == "async":
+        return run_batch_async(
+            urls,
+            payloads,
+            concurrency,
+            request_timeout,
+            retry_attempts,
+            retry_sleep_s,
+        )
+    if engine == "processes":
+        return run_batch_processes(
+            urls,
+            payloads,
+            concurrency,
+            request_timeout,
+            retry_attempts,
+            retry_sleep_s,
+        )
+
     start_time = time.time()
     results = []
     errors = 0
@@ -118,18 +154,13 @@ def run_batch(
         futures = [
             executor.submit(
                 post_json_with_retry,
-                f"{base_url}/completion",
-                {
-                    "prompt": prompt,
-                    "n_predict": n_predict,
-                    "temperature": temperature,
-                    "stream": False,
-                },
+                urls[index % len(urls)],
+                payload,
                 request_timeout,
                 retry_attempts,
                 retry_sleep_s,
             )
-            for _ in range(total_requests)
+            for index, payload in enumerate(payloads)
         ]
         for future in as_completed(futures):
             try:
@@ -139,16 +170,37 @@ def run_batch(
                 last_error = exc
 
     elapsed = time.time() - start_time
-    total_tokens = sum(extract_token_count(result) for result in results)
-    throughput = total_tokens / elapsed if elapsed > 0 else 0.0
-
-    return {
-        "throughput": throughput,
-        "total_tokens": total_tokens,
-        "elapsed": elapsed,
-        "errors": errors,
-        "last_error": last_error,
-    }
+    return summarize_batch(results, errors, last_error, elapsed)
+
+
+def run_open_loop(
+    base_url,
+    prompt,
+    n_predict,
+    rate_qps,
+    total_requests,
+    temperature,
+    request_timeout,
+    retry_attempts,
+    retry_sleep_s,
+    process="constant",
+    stream=False,
+    seed=None,
+    workload=None,
+):
+    payloads = build_payloads(
+        workload, prompt, n_predict, temperature, stream, total_requests
+    )
+    return run_open_loop_async(
+        completion_urls(base_url),
+        payloads,
+        rate_qps,
+        process,
+        request_timeout,
+        retry_attempts,
+        retry_sleep_s,
+        seed=seed,
+    )
 
 
 def main():
@@ -198,43 +250,169 @@ def main():
     }
     requests_multiplier = int(os.environ.get("LLAMA_REQUESTS_MULTIPLIER", "1"))
     total_requests_env = os.environ.get("LLAMA_NUM_REQUESTS")
+    client_engine = resolve_client_engine()
+    load_mode, arrival_process = resolve_load_mode()
+    arrival_rate_list = parse_float_list(
+        os.environ.get("LLAMA_ARRIVAL_RATE_LIST"),
+        "1,2,4,8,16,32",
+    )
+    open_loop_duration_s = float(os.environ.get("LLAMA_OPEN_LOOP_DURATION_S", "30"))
+    arrival_seed = os.environ.get("LLAMA_ARRIVAL_SEED")
+    if arrival_seed is not None:
+        arrival_seed = int(arrival_seed)
+    load_points = arrival_rate_list if load_mode == "open" else concurrency_list
+    stream = os.environ.get("LLAMA_STREAM", "0").lower() in {"1", "true", "yes"}
+    client_ceiling = ClientCeiling.from_env()
+    ceiling_key = client_engine_key(client_engine, load_mode, stream)
+    lb_strategy = resolve_lb_strategy()
+    proxy_kind = resolve_proxy_kind()
+    # nginx settings are an outer sweep axis; the Python proxy has none.
+    nginx_tunings = nginx_tuning_grid() if proxy_kind == "nginx" else [None]
+    tuning = nginx_tunings[0]
+    measure_overhead = proxy_overhead_enabled()
+    extra_header = (
+        ["lb_strategy"]
+        + NGINX_TUNING_COLUMNS
+        + OPEN_LOOP_COLUMNS
+        + STREAM_COLUMNS
+        + PHASE_COLUMNS
+        + PERCENTILE_COLUMNS
+        + RESOURCE_COLUMNS
+        + METRICS_COLUMNS
+        + SERVER_LOG_COLUMNS
+        + PROXY_COLUMNS
+        + (PROXY_OVERHEAD_COLUMNS if measure_overhead else [])
+    )
+    sample_resources = resource_sampling_enabled()
+    workload = Workload.from_env()
+    poll_metrics = server_metrics_enabled()
+    write_histograms = os.environ.get("LLAMA_HISTOGRAMS", "0").lower() in {
+        "1",
+        "true",
+        "yes",
+    }
+    sweep_mode = resolve_sweep_mode()
+    refine_top_k = int(os.environ.get("LLAMA_REFINE_TOP_K", "2"))
+    reuse_servers = os.environ.get("LLAMA_SERVER_POOL", "1").lower() not in {
+        "0",
+        "false",
+        "no",
+    }
+
+    resume = os.environ.get("LLAMA_RESUME", "1").lower() not in {"0", "false", "no"}
+    repeats = max(1, int(os.environ.get("LLAMA_SWEEP_REPEATS", "1")))
 
     if requests_multiplier < 1:
         requests_multiplier = 1
 
-    results_path = init_results_file("full_sweep", "full_sweep")
-    results_path.parent.mkdir(parents=True, exist_ok=True)
-    results_file = results_path.open("w", newline="", encoding="utf-8")
-    writer = csv.writer(results_file)
-    writer.writerow(
-        [
-            "instances",
-            "parallel",
-            "batch",
-            "ubatch",
-            "concurrency",
-            "throughput_tps",
-            "total_tokens",
-            "elapsed_s",
-            "errors",
-        ]
+    header = [
+        "instances",
+        "parallel",
+        "batch",
+        "ubatch",
+        "concurrency",
+        "throughput_tps",
+        "total_tokens",
+        "elapsed_s",
+        "errors",
+        *extra_header,
+    ]
+    # Everything that changes what a cell measures; the state file is keyed
+    # by its hash so only an identical rerun resumes. Repeats are left out so
+    # a finished sweep can be rerun with more samples per cell.
+    sweep_config = {
+        "columns": header,
+        "server_bin": resolve_llama_server_bin(),
+        "model_path": resolve_model_path(),
+        "server_args": base_args,
+        "ctxsize_per_session": os.environ.get("LLAMA_CTXSIZE_PER_SESSION"),
+        "prompt": prompt,
+        "workload": workload.describe() if workload else None,
+        "temperature": temperature,
+        "n_predict": n_predict,
+        "instances": instances_list,
+        "parallel": parallel_list,
+        "batch": batch_list,
+        "ubatch": ubatch_list,
+        "load_mode": load_mode,
+        "arrival_process": arrival_process,
+        "load_points": load_points,
+        "open_loop_duration_s": open_loop_duration_s,
+        "arrival_seed": arrival_seed,
+        "num_requests": total_requests_env,
+        "requests_multiplier": requests_multiplier,
+        "client_engine": client_engine,
+        "stream": stream,
+        "proxy": proxy_kind,
+        "lb_strategy": lb_strategy,
+        "nginx_tunings": nginx_tunings,
+        "proxy_overhead": measure_overhead,
+        "sweep_mode": sweep_mode,
+    }
+    new_results_path = init_results_file("full_sweep", "full_sweep")
+    state = SweepState.open(
+        new_results_path.parent,
+        "full_sweep",
+        sweep_config,
+        new_results_path,
+        resume=resume,
     )
+    results_path = state.results_path
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    if state.resumed:
+        results_file = results_path.open("a", newline="", encoding="utf-8")
+        writer = csv.writer(results_file)
+    else:
+        results_file = results_path.open("w", newline="", encoding="utf-8")
+        writer = csv.writer(results_file)
+        writer.writerow(header)
     results_file.flush()
+    writer = tee_results_store(
+        writer, "full_sweep", header, results_path, {"sweep": sweep_config}
+    )
 
     print(
         "instances,parallel,batch,ubatch,concurrency,throughput_tps,"
-        "total_tokens,elapsed_s,errors"
+        "total_tokens,elapsed_s,errors," + ",".join(extra_header)
     )
     print(f"results_file={results_path}")
+    log_dir = results_path.with_name(f"{results_path.stem}_logs")
+    capture_logs = server_logs_enabled()
+    if capture_logs:
+        # Servers started from here on log next to the CSV.
+        os.environ["LLAMA_SERVER_LOG_DIR"] = str(log_dir)
+        print(f"server_logs={log_dir}")
+    print(f"state_file={state.path}")
+    if state.resumed:
+        print(f"resuming: {state.recorded} samples already recorded")
+    histograms_path = results_path.with_name(f"{results_path.stem}_histograms.jsonl")
+    if write_histograms:
+        print(f"histograms_file={histograms_path}")
+    if load_mode == "open":
+        print(f"load_mode=open arrival_process={arrival_process}")
+    else:
+        print(f"client_engine={client_engine}")
+    print(
+        f"proxy={proxy_kind} lb_strategy={lb_strategy}"
+        + (" proxy_overhead=1" if measure_overhead else "")
+    )
+    if workload is not None:
+        described = workload.describe().items()
+        print("workload " + " ".join(f"{key}={value}" for key, value in described))
+    if sweep_mode == "adaptive":
+        # total_runs below is then an upper bound.
+        print(f"sweep_mode=adaptive refine_top_k={refine_top_k}")
 
     total_runs = (
         len(instances_list)
         * len(parallel_list)
         * len(batch_list)
         * len(ubatch_list)
-        * len(concurrency_list)
+        * len(load_points)
+        * len(nginx_tunings)
+        * repeats
     )
-    completed = 0
+    completed = state.recorded
     sweep_start = time.time()
 
     def record_row(
@@ -247,8 +425,14 @@ def main():
         total_tokens,
         elapsed,
         errors,
+        extra_columns=None,
+        load_point=None,
+        failed=False,
+        fields=None,
     ):
         nonlocal completed
+        if extra_columns is None:
+            extra_columns = [""] * len(extra_header)
         writer.writerow(
             [
                 instances,
@@ -260,9 +444,22 @@ def main():
                 total_tokens,
                 elapsed,
                 errors,
+                *extra_columns,
             ]
         )
         results_file.flush()
+        state.record(
+            cell_key(instances, parallel, batch_label, ubatch_label, load_point),
+            throughput,
+            errors,
+            failed,
+            instances=instances,
+            parallel=parallel,
+            batch=batch_label,
+            ubatch=ubatch_label,
+            concurrency=concurrency,
+            **(fields or {}),
+        )
         completed += 1
         if total_runs:
             elapsed_s = time.time() - sweep_start
@@ -286,169 +483,516 @@ def main():
         "batch": None,
         "ubatch": None,
         "concurrency": None,
+        "arrival_rate_qps": None,
+        "nginx": None,
     }
 
-    try:
-        for instances in instances_list:
-            for parallel in parallel_list:
-                for batch_size in batch_list:
-                    for ubatch_size in ubatch_list:
-                        server_args = build_server_args(
-                            base_args, parallel, batch_size, ubatch_size
+    def update_best(throughput, instances, parallel, batch, ubatch, concurrency, fields):
+        nonlocal best
+        if throughput > best["throughput"]:
+            best = {
+                "throughput": throughput,
+                "instances": instances,
+                "parallel": parallel,
+                "batch": batch,
+                "ubatch": ubatch,
+                "concurrency": concurrency,
+                "arrival_rate_qps": fields.get("arrival_rate_qps"),
+                "nginx": " ".join(
+                    f"{column}={fields[column]}"
+                    for column in NGINX_TUNING_COLUMNS
+                    if column in fields
+                ),
+            }
+
+    for record in state.records():
+        if not record["failed"]:
+            update_best(
+                record["throughput"],
+                record["instances"],
+                record["parallel"],
+                record["batch"],
+                record["ubatch"],
+                record["concurrency"],
+                record,
+            )
+
+    def cell_requests(load_point):
+        if total_requests_env:
+            return int(total_requests_env)
+        if load_mode == "open":
+            return max(1, round(load_point * open_loop_duration_s))
+        return max(1, load_point * requests_multiplier)
+
+    def proxy_fields():
+        fields = {"lb_strategy": lb_strategy}
+        if tuning is not None:
+            fields.update(nginx_tuning_fields(tuning))
+        return fields
+
+    def cell_key(*labels):
+        # Only multi-config nginx sweeps key cells by tuning, so state files of
+        # ordinary sweeps keep their keys.
+        if len(nginx_tunings) > 1:
+            labels += (nginx_tuning_label(tuning),)
+        return state.cell_key(*labels)
+
+    def cell_fields(load_point):
+        # Closed-loop cells are labelled by concurrency; open-loop cells by
+        # their target arrival rate (concurrency becomes the observed peak).
+        fields = proxy_fields()
+        if load_mode == "open":
+            return "", {**fields, "arrival_rate_qps": float(load_point)}
+        return load_point, fields
+
+    def cell_label(load_point):
+        if load_mode == "open":
+            return f"arrival_rate_qps={load_point}"
+        return f"concurrency={load_point}"
+
+    def record_failure(instances, parallel, batch_label, ubatch_label, load_point):
+        concurrency, fields = cell_fields(load_point)
+        record_row(
+            instances,
+            parallel,
+            batch_label,
+            ubatch_label,
+            concurrency,
+            "0.0",
+            "0",
+            "0.00",
+            str(cell_requests(load_point)),
+            format_extra_columns(fields, extra_header),
+            load_point=load_point,
+            failed=True,
+            fields=fields,
+        )
+
+    def drive(base_url, load_point, total_requests, cell_workload):
+        if load_mode == "open":
+            return run_open_loop(
+                base_url,
+                prompt,
+                n_predict,
+                load_point,
+                total_requests,
+                temperature,
+                request_timeout,
+                retry_attempts,
+                retry_sleep_s,
+                process=arrival_process,
+                stream=stream,
+                seed=arrival_seed,
+                workload=cell_workload,
+            )
+        return run_batch(
+            base_url,
+            prompt,
+            n_predict,
+            load_point,
+            total_requests,
+            temperature,
+            request_timeout,
+            retry_attempts,
+            retry_sleep_s,
+            engine=client_engine,
+            stream=stream,
+            workload=cell_workload,
+        )
+
+    def workload_for(*labels):
+        # Servers outlive a cell (load points share a deployment, and the pool
+        # keeps them across configs), so each cell and repeat gets its own
+        # requests instead of prompts the servers already have cached.
+        if workload is None:
+            return None
+        return workload.for_cell(*labels)
+
+    def measure_direct(result, proxy, label, load_point, total_requests, cell):
+        # Same cell again, with the client spreading requests over the backends.
+        # It draws its own requests too, so it is not served from the cache
+        # the proxied run just filled.
+        try:
+            direct = drive(
+                direct_base_urls(proxy["upstreams"]),
+                load_point,
+                total_requests,
+                workload_for(*cell, "direct"),
+            )
+        except Exception as exc:
+            print(f"error direct {label}: {exc}", file=sys.stderr)
+            return
+        result.update(proxy_overhead_fields(result, direct))
+        print(f"overhead {label} " + format_overhead_summary(result), file=sys.stderr)
+
+    def measure_cell(proxy, instances, parallel, batch_label, ubatch_label, load_point):
+        concurrency, fields = cell_fields(load_point)
+        total_requests = cell_requests(load_point)
+        key = cell_key(instances, parallel, batch_label, ubatch_label, load_point)
+        cell = (key, state.samples(key))
+        monitors = []
+        if sample_resources:
+            monitors.append(ResourceSampler())
+        if poll_metrics:
+            monitors.append(MetricsPoller())
+        if capture_logs:
+            monitors.append(ServerLogCollector(log_dir))
+        proxy_stats = None
+        if proxy_kind == "python":
+            proxy_stats = ProxyStatsCollector()
+            monitors.append(proxy_stats)
+        try:
+            with contextlib.ExitStack() as stack:
+                for monitor in monitors:
+                    stack.enter_context(monitor)
+                result = drive(
+                    proxy["base_url"], load_point, total_requests, workload_for(*cell)
+                )
+                if load_mode == "open":
+                    concurrency = result["peak_in_flight"]
+        except Exception as exc:
+            print(
+                "error "
+                f"instances={instances} "
+                f"parallel={parallel} "
+                f"batch={batch_label} "
+                f"ubatch={ubatch_label} "
+                f"{cell_label(load_point)}: {exc}",
+                file=sys.stderr,
+            )
+            if not continue_on_error:
+                raise
+            print(
+                "failing_row "
+                f"{instances},{parallel},{batch_label},"
+                f"{ubatch_label},{concurrency},"
+                "0.0,0,0.00,"
+                f"{total_requests}"
+            )
+            record_failure(instances, parallel, batch_label, ubatch_label, load_point)
+            if cell_pause_s > 0:
+                time.sleep(cell_pause_s)
+            return None
+
+        for monitor in monitors:
+            result.update(monitor.fields)
+        result.update(proxy_fields())
+        if measure_overhead and result["total_tokens"]:
+            measure_direct(
+                result,
+                proxy,
+                f"instances={instances} parallel={parallel} {cell_label(load_point)}",
+                load_point,
+                total_requests,
+                cell,
+            )
+        extra_columns = format_extra_columns(result, extra_header)
+        print(
+            f"{instances},{parallel},{batch_label},"
+            f"{ubatch_label},{concurrency},"
+            f"{result['throughput']:.1f},"
+            f"{result['total_tokens']},"
+            f"{result['elapsed']:.2f},"
+            f"{result['errors']},"
+            + ",".join(extra_columns)
+        )
+        phase_summary = format_phase_summary(result)
+        if phase_summary:
+            print(
+                f"phases instances={instances} parallel={parallel} "
+                f"{cell_label(load_point)} " + phase_summary,
+                file=sys.stderr,
+            )
+        warning = client_ceiling and client_ceiling.check(ceiling_key, result)
+        if warning:
+            print(
+                f"warning instances={instances} parallel={parallel} "
+                f"{cell_label(load_point)}: {warning}",
+                file=sys.stderr,
+            )
+        if proxy_stats is not None and proxy_stats.upstreams:
+            print(
+                f"upstreams instances={instances} parallel={parallel} "
+                f"{cell_label(load_point)} " + proxy_stats.summary(),
+                file=sys.stderr,
+            )
+        record_row(
+            instances,
+            parallel,
+            batch_label,
+            ubatch_label,
+            concurrency,
+            f"{result['throughput']:.1f}",
+            str(result["total_tokens"]),
+            f"{result['elapsed']:.2f}",
+            str(result["errors"]),
+            extra_columns,
+            load_point=load_point,
+            fields=fields,
+        )
+        if write_histograms:
+            append_histograms(
+                histograms_path,
+                {
+                    "instances": instances,
+                    "parallel": parallel,
+                    "batch": batch_label,
+                    "ubatch": ubatch_label,
+                    "concurrency": concurrency,
+                    **fields,
+                },
+                result["histograms"],
+            )
+        update_best(
+            result["throughput"],
+            instances,
+            parallel,
+            batch_label,
+            ubatch_label,
+            concurrency,
+            fields,
+        )
+        if cell_pause_s > 0:
+            time.sleep(cell_pause_s)
+        return result
+
+    server_pool = None
+    shared_proxy = contextlib.ExitStack()
+    proxy = None
+    proxy_pids = []
+    if reuse_servers:
+        server_pool = LlamaServerPool(
+            base_port,
+            ready_timeout_s=ready_timeout_s,
+            startup_delay_s=startup_delay_s,
+        )
+
+    def close_deployment():
+        nonlocal proxy
+        proxy = None
+        shared_proxy.close()
+        if server_pool is not None:
+            server_pool.close()
+
+    @contextlib.contextmanager
+    def deployment(instances, server_args):
+        """Yield a proxy (nginx or Python) in front of *instances* servers.
+
+        With the server pool enabled, servers and the proxy outlive the cell:
+        matching launch args reuse (or grow) the running instances and the
+        proxy is reloaded onto the new upstream set instead of restarted.
+        """
+        nonlocal proxy, proxy_pids
+        if server_pool is None:
+            with start_llama_servers(
+                instances,
+                base_port=base_port,
+                extra_args=server_args,
+                ready_timeout_s=ready_timeout_s,
+                startup_delay_s=startup_delay_s,
+            ) as servers:
+                upstreams = [(server["host"], server["port"]) for server in servers]
+                with start_round_robin_proxy(
+                    upstreams,
+                    listen_port=nginx_port,
+                    listen_host=servers[0]["host"],
+                    strategy=lb_strategy,
+                    tuning=tuning,
+                ) as cell_proxy:
+                    yield cell_proxy
+            return
+
+        try:
+            servers = server_pool.acquire(instances, server_args)
+            upstreams = [(server["host"], server["port"]) for server in servers]
+            pids = [server["process"].pid for server in servers]
+            if proxy is None:
+                proxy = shared_proxy.enter_context(
+                    start_round_robin_proxy(
+                        upstreams,
+                        listen_port=nginx_port,
+                        listen_host=servers[0]["host"],
+                        strategy=lb_strategy,
+                        tuning=tuning,
+                    )
+                )
+            else:
+                # A changed launch key restarts the servers on the same ports.
+                shared = min(len(pids), len(proxy_pids))
+                reload_round_robin_proxy(
+                    proxy,
+                    upstreams,
+                    tuning=tuning,
+                    relaunched=pids[:shared] != proxy_pids[:shared],
+                )
+            proxy_pids = pids
+            yield proxy
+        except Exception:
+            # A failed cell may leave servers wedged; start clean next time.
+            close_deployment()
+            raise
+
+    def run_config(
+        instances, parallel, batch_size, ubatch_size, points=None, tracker=None
+    ):
+        """Measure *points* (default: every load point) for one server config.
+
+        With a *tracker*, the load axis stops early once it reports a plateau
+        or a cell errors, and only the cell that was in progress is recorded
+        as failed if the deployment breaks. Points that already have
+        ``repeats`` samples in the sweep state are replayed from it instead of
+        re-measured, and servers are only started if something is left to
+        measure. Returns the tracker.
+        """
+        server_args = build_server_args(base_args, parallel, batch_size, ubatch_size)
+        batch_label = "default" if batch_size is None else str(batch_size)
+        ubatch_label = "default" if ubatch_size is None else str(ubatch_size)
+        remaining = list(load_points if points is None else points)
+
+        def next_point():
+            # Drop leading points that have all their samples, feeding their
+            # recorded outcome to the tracker, and return the next one to run.
+            while remaining:
+                key = cell_key(
+                    instances, parallel, batch_label, ubatch_label, remaining[0]
+                )
+                if state.samples(key) < repeats:
+                    return remaining[0]
+                load_point = remaining.pop(0)
+                if tracker is not None:
+                    throughput, failed = state.outcome(key)
+                    if tracker.update(throughput, key=load_point, failed=failed):
+                        remaining.clear()
+            return None
+
+        if next_point() is None:
+            return tracker
+        try:
+            os.environ["LLAMA_PARALLEL"] = str(parallel)
+            with deployment(instances, server_args) as cell_proxy:
+                if warmup_requests > 0:
+                    for _ in range(warmup_requests):
+                        post_json_with_retry(
+                            f"{cell_proxy['base_url']}/completion",
+                            {
+                                "prompt": "warmup",
+                                "n_predict": 8,
+                                "temperature": 0.0,
+                                "stream": False,
+                            },
+                            request_timeout,
+                            retry_attempts,
+                            retry_sleep_s,
                         )
-                        batch_label = (
-                            "default" if batch_size is None else str(batch_size)
+
+                while next_point() is not None:
+                    measure_cell(
+                        cell_proxy,
+                        instances,
+                        parallel,
+                        batch_label,
+                        ubatch_label,
+                        remaining[0],
+                    )
+        except Exception as exc:
+            print(
+                "error "
+                f"instances={instances} "
+                f"parallel={parallel} "
+                f"batch={batch_label} "
+                f"ubatch={ubatch_label}: {exc}",
+                file=sys.stderr,
+            )
+            if not continue_on_error:
+                raise
+            if tracker is not None:
+                tracker.update(0.0, failed=True)
+                del remaining[1:]
+            for load_point in remaining:
+                record_failure(instances, parallel, batch_label, ubatch_label, load_point)
+        return tracker
+
+    def run_adaptive():
+        """Prune dominated configs, then refine around the best ones.
+
+        Load points are walked upwards until throughput plateaus or errors
+        appear; the parallel axis of each instance count is pruned the same
+        way using each config's peak. Finally the top configs get extra cells
+        at the midpoints around their best load point.
+        """
+        configs = []
+        for batch_size in batch_list:
+            for ubatch_size in ubatch_list:
+                parallel_trackers = {
+                    instances: PlateauTracker.from_env() for instances in instances_list
+                }
+                # Instance count stays innermost so the server pool can grow.
+                for parallel in sorted(parallel_list):
+                    for instances in sorted(instances_list):
+                        if parallel_trackers[instances].stopped:
+                            continue
+                        tracker = run_config(
+                            instances,
+                            parallel,
+                            batch_size,
+                            ubatch_size,
+                            points=sorted(load_points),
+                            tracker=PlateauTracker.from_env(),
                         )
-                        ubatch_label = (
-                            "default" if ubatch_size is None else str(ubatch_size)
+                        parallel_trackers[instances].update(
+                            tracker.best or 0.0,
+                            key=parallel,
+                            failed=tracker.best is None,
                         )
-                        try:
-                            os.environ["LLAMA_PARALLEL"] = str(parallel)
-                            with start_llama_servers(
-                                instances,
-                                base_port=base_port,
-                                extra_args=server_args,
-                                ready_timeout_s=ready_timeout_s,
-                                startup_delay_s=startup_delay_s,
-                            ) as servers:
-                                upstreams = [
-                                    (server["host"], server["port"])
-                                    for server in servers
-                                ]
-                                with start_nginx_round_robin(
-                                    upstreams,
-                                    listen_port=nginx_port,
-                                    listen_host=servers[0]["host"],
-                                ) as proxy:
-                                    if warmup_requests > 0:
-                                        for _ in range(warmup_requests):
-                                            post_json_with_retry(
-                                                f"{proxy['base_url']}/completion",
-                                                {
-                                                    "prompt": "warmup",
-                                                    "n_predict": 8,
-                                                    "temperature": 0.0,
-                                                    "stream": False,
-                                                },
-                                                request_timeout,
-                                                retry_attempts,
-                                                retry_sleep_s,
-                                            )
-
-                                    for concurrency in concurrency_list:
-                                        if total_requests_env:
-                                            total_requests = int(total_requests_env)
-                                        else:
-                                            total_requests = max(
-                                                1, concurrency * requests_multiplier
-                                            )
-                                        try:
-                                            result = run_batch(
-                                                proxy["base_url"],
-                                                prompt,
-                                                n_predict,
-                                                concurrency,
-                                                total_requests,
-                                                temperature,
-                                                request_timeout,
-                                                retry_attempts,
-                                                retry_sleep_s,
-                                            )
-                                        except Exception as exc:
-                                            print(
-                                                "error "
-                                                f"instances={instances} "
-                                                f"parallel={parallel} "
-                                                f"batch={batch_label} "
-                                                f"ubatch={ubatch_label} "
-                                                f"concurrency={concurrency}: {exc}",
-                                                file=sys.stderr,
-                                            )
-                                            if not continue_on_error:
-                                                raise
-                                            print(
-                                                "failing_row "
-                                                f"{instances},{parallel},{batch_label},"
-                                                f"{ubatch_label},{concurrency},"
-                                                "0.0,0,0.00,"
-                                                f"{total_requests}"
-                                            )
-                                            record_row(
-                                                instances,
-                                                parallel,
-                                                batch_label,
-                                                ubatch_label,
-                                                concurrency,
-                                                "0.0",
-                                                "0",
-                                                "0.00",
-                                                str(total_requests),
-                                            )
-                                            if cell_pause_s > 0:
-                                                time.sleep(cell_pause_s)
-                                            continue
-
-                                        print(
-                                            f"{instances},{parallel},{batch_label},"
-                                            f"{ubatch_label},{concurrency},"
-                                            f"{result['throughput']:.1f},"
-                                            f"{result['total_tokens']},"
-                                            f"{result['elapsed']:.2f},"
-                                            f"{result['errors']}"
-                                        )
-                                        record_row(
-                                            instances,
-                                            parallel,
-                                            batch_label,
-                                            ubatch_label,
-                                            concurrency,
-                                            f"{result['throughput']:.1f}",
-                                            str(result["total_tokens"]),
-                                            f"{result['elapsed']:.2f}",
-                                            str(result["errors"]),
-                                        )
-                                        if result["throughput"] > best["throughput"]:
-                                            best = {
-                                                "throughput": result["throughput"],
-                                                "instances": instances,
-                                                "parallel": parallel,
-                                                "batch": batch_label,
-                                                "ubatch": ubatch_label,
-                                                "concurrency": concurrency,
-                                            }
-                                        if cell_pause_s > 0:
-                                            time.sleep(cell_pause_s)
-                        except Exception as exc:
-                            print(
-                                "error "
-                                f"instances={instances} "
-                                f"parallel={parallel} "
-                                f"batch={batch_label} "
-                                f"ubatch={ubatch_label}: {exc}",
-                                file=sys.stderr,
-                            )
-                            if not continue_on_error:
-                                raise
-                            for concurrency in concurrency_list:
-                                if total_requests_env:
-                                    total_requests = int(total_requests_env)
-                                else:
-                                    total_requests = max(
-                                        1, concurrency * requests_multiplier
-                                    )
-                                record_row(
+                        if tracker.best is not None:
+                            configs.append(
+                                (
+                                    tracker.best,
                                     instances,
                                     parallel,
-                                    batch_label,
-                                    ubatch_label,
-                                    concurrency,
-                                    "0.0",
-                                    "0",
-                                    "0.00",
-                                    str(total_requests),
+                                    batch_size,
+                                    ubatch_size,
+                                    tracker.best_key,
                                 )
-                            continue
+                            )
+
+        configs.sort(key=lambda item: item[0], reverse=True)
+        for config in configs[:refine_top_k]:
+            _, instances, parallel, batch_size, ubatch_size, best_point = config
+            points = refine_points(
+                load_points, best_point, integer=load_mode != "open"
+            )
+            if points:
+                run_config(instances, parallel, batch_size, ubatch_size, points=points)
+
+    def run_grid():
+        if server_pool is None:
+            for instances in instances_list:
+                for parallel in parallel_list:
+                    for batch_size in batch_list:
+                        for ubatch_size in ubatch_list:
+                            run_config(instances, parallel, batch_size, ubatch_size)
+        else:
+            # Vary the instance count innermost (ascending) so each step only
+            # adds servers to a pool already loaded with the same args.
+            for parallel in parallel_list:
+                for batch_size in batch_list:
+                    for ubatch_size in ubatch_list:
+                        for instances in sorted(instances_list):
+                            run_config(instances, parallel, batch_size, ubatch_size)
+
+    try:
+        # With the pool on, a new nginx config is applied by reload while the
+        # servers stay up.
+        for tuning in nginx_tunings:
+            if len(nginx_tunings) > 1:
+                print(f"nginx {nginx_tuning_label(tuning)}")
+            if sweep_mode == "adaptive":
+                run_adaptive()
+            else:
+                run_grid()
     finally:
+        close_deployment()
         results_file.close()
 
     print(
@@ -458,7 +1002,13 @@ def main():
         f"batch={best['batch']} "
         f"ubatch={best['ubatch']} "
         f"concurrency={best['concurrency']} "
-        f"throughput_tps={best['throughput']:.1f}"
+        + (
+            f"arrival_rate_qps={best['arrival_rate_qps']} "
+            if load_mode == "open"
+            else ""
+        )
+        + (f"{best['nginx']} " if len(nginx_tunings) > 1 and best["nginx"] else "")
+        + f"throughput_tps={best['throughput']:.1f}"
     )
 
 
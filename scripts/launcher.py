@@ -43,6 +43,10 @@ def build_commands(python_bin: str) -> Dict[str, Tuple[str, List[str]]]:
             "Full sweep (instances x parallel x concurrency)",
             [python_bin, "scripts/full_sweep.py"],
         ),
+        "7": (
+            "Prefix-cache sweep (prefix x share x cache_prompt)",
+            [python_bin, "scripts/prefix_cache_sweep.py"],
+        ),
     }
 
 
@@ -0,0 +1,263 @@
+import csv
+import os
+import re
+import statistics
+import sys
+import time
+import warnings
+from pathlib import Path
+
+# Suppress ResourceWarning for unclosed sockets in threaded urllib use (Python 3.12)
+warnings.filterwarnings("ignore", category=ResourceWarning, message="unclosed .*socket")
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from tests.llama_monitor_utils import (
+    ResourceSampler,
+    parse_server_log,
+    process_memory_mb,
+)
+from tests.llama_results_utils import tee_results_store
+from tests.llama_server_test_utils import (
+    parse_comma_args,
+    post_json,
+    resolve_model_path,
+    server_logs_enabled,
+    start_llama_server,
+)
+from tests.llama_sweep_utils import init_results_file, parse_str_list
+
+# Load flags per mode; mmap is llama.cpp's default.
+LOAD_MODES = {
+    "mmap": [],
+    "no-mmap": ["--no-mmap"],
+    "mlock": ["--mlock"],
+    "no-mmap+mlock": ["--no-mmap", "--mlock"],
+}
+LOAD_FLAGS = ("--mmap", "--no-mmap", "--mlock")
+CACHE_STATES = ("cold", "warm")
+
+_SPLIT_RE = re.compile(r"^(.*)-(\d{5})-of-(\d{5})\.gguf$")
+
+
+def model_files(model_path):
+    """Return *model_path* plus the other shards of a split GGUF."""
+    path = Path(model_path)
+    match = _SPLIT_RE.match(path.name)
+    if not match:
+        return [path]
+    stem, _, count = match.groups()
+    shards = [
+        path.with_name(f"{stem}-{index:05d}-of-{count}.gguf")
+        for index in range(1, int(count) + 1)
+    ]
+    return [shard for shard in shards if shard.is_file()]
+
+
+def evict_page_cache(paths, drop_caches=False):
+    """Drop *paths* from the page cache; return how, or "" if not permitted.
+
+    ``posix_fadvise(DONTNEED)`` only drops clean pages that no process has
+    mapped or locked, which holds here since every server is stopped first.
+    With *drop_caches* (root only) the whole page cache goes as well.
+    """
+    if drop_caches:
+        try:
+            os.sync()
+            with open("/proc/sys/vm/drop_caches", "w", encoding="ascii") as handle:
+                handle.write("1\n")
+            return "drop_caches"
+        except OSError:
+            pass
+    if not hasattr(os, "posix_fadvise"):
+        return ""
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return ""
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            return ""
+        finally:
+            os.close(fd)
+    return "fadvise"
+
+
+def warm_page_cache(paths, chunk_bytes=16 * 1024 * 1024):
+    buffer = bytearray(chunk_bytes)
+    for path in paths:
+        with open(path, "rb", buffering=0) as handle:
+            while handle.readinto(buffer):
+                pass
+
+
+def measure(extra_args, payload, requests):
+    start = time.monotonic()
+    with ResourceSampler(interval_s=0.05) as sampler:
+        with start_llama_server(extra_args=extra_args) as server:
+            first_completion_s = time.monotonic() - start
+            pid = server["process"].pid
+            ready = process_memory_mb(pid)
+            url = f"{server['base_url']}/completion"
+            for _ in range(requests):
+                post_json(url, payload)
+            served = process_memory_mb(pid)
+            watcher = server["log"]
+    startup = parse_server_log(watcher.startup)
+
+    def growth(key):
+        if key in ready and key in served:
+            return served[key] - ready[key]
+        return None
+
+    return {
+        "bind_s": watcher.bound_s,
+        "load_s": watcher.ready_s,
+        "first_completion_s": first_completion_s,
+        "rss_mb": ready.get("rss"),
+        "rss_file_mb": ready.get("rss_file"),
+        "rss_peak_mb": sampler.fields.get("server_rss_mb"),
+        "rss_growth_mb": growth("rss"),
+        "rss_file_growth_mb": growth("rss_file"),
+        "model_mib": startup.get("model_mib"),
+        "warnings": startup["warnings"],
+        "last_warning": startup.get("last_warning"),
+    }
+
+
+def _format(value, precision=3):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return str(round(value, precision))
+    return str(value)
+
+
+def main():
+    modes = parse_str_list(
+        os.environ.get("LLAMA_LOAD_BENCH_MODES"), ",".join(LOAD_MODES)
+    )
+    caches = parse_str_list(
+        os.environ.get("LLAMA_LOAD_BENCH_CACHE_LIST"), ",".join(CACHE_STATES)
+    )
+    for mode in modes:
+        if mode not in LOAD_MODES:
+            raise ValueError(
+                f"Unknown load mode {mode!r}; "
+                f"expected one of {', '.join(LOAD_MODES)}."
+            )
+    for cache in caches:
+        if cache not in CACHE_STATES:
+            raise ValueError(
+                f"Unknown cache state {cache!r}; "
+                f"expected one of {', '.join(CACHE_STATES)}."
+            )
+    repeats = int(os.environ.get("LLAMA_LOAD_BENCH_REPEATS", "3"))
+    requests = int(os.environ.get("LLAMA_LOAD_BENCH_REQUESTS", "8"))
+    drop_caches = os.environ.get("LLAMA_LOAD_BENCH_DROP_CACHES", "0").lower() in {
+        "1",
+        "true",
+        "yes",
+    }
+    payload = {
+        "prompt": os.environ.get("LLAMA_PROMPT", "Hello"),
+        "n_predict": int(os.environ.get("LLAMA_N_PREDICT", "16")),
+        "temperature": 0.0,
+        "stream": False,
+    }
+    # The mode decides the load flags, so drop any from LLAMA_SERVER_ARGS.
+    base_args = []
+    server_args = parse_comma_args(os.environ.get("LLAMA_SERVER_ARGS", ""))
+    for arg in server_args:
+        if arg.split("=", 1)[0] not in LOAD_FLAGS:
+            base_args.append(arg)
+    files = model_files(resolve_model_path())
+
+    results_path = init_results_file("model_load_bench", "model_load_bench")
+    print(f"results_file={results_path}")
+    if server_logs_enabled():
+        log_dir = results_path.with_name(f"{results_path.stem}_logs")
+        os.environ["LLAMA_SERVER_LOG_DIR"] = str(log_dir)
+        print(f"server_logs={log_dir}")
+    print(
+        f"modes={','.join(modes)} caches={','.join(caches)} repeats={repeats} "
+        f"model_files={len(files)} model_gb="
+        f"{sum(path.stat().st_size for path in files) / 1024 ** 3:.2f}"
+    )
+
+    columns = [
+        "bind_s",
+        "load_s",
+        "first_completion_s",
+        "rss_mb",
+        "rss_file_mb",
+        "rss_peak_mb",
+        "rss_growth_mb",
+        "rss_file_growth_mb",
+        "model_mib",
+        "warnings",
+        "last_warning",
+    ]
+    header = ["mode", "cache", "cache_evicted", "repeat", *columns, "error"]
+    timings = {}
+
+    with results_path.open("w", newline="", encoding="utf-8") as results_file:
+        writer = csv.writer(results_file)
+        writer.writerow(header)
+        writer = tee_results_store(writer, "model_load_bench", header, results_path)
+        for mode in modes:
+            for cache in caches:
+                for repeat in range(1, repeats + 1):
+                    evicted = ""
+                    if cache == "cold":
+                        evicted = evict_page_cache(files, drop_caches)
+                        if not evicted:
+                            print(
+                                f"warning mode={mode}: could not evict the model "
+                                "from the page cache; the cold run may be warm",
+                                file=sys.stderr,
+                            )
+                    else:
+                        warm_page_cache(files)
+                    label = f"mode={mode} cache={cache} repeat={repeat}"
+                    try:
+                        result = measure(base_args + LOAD_MODES[mode], payload, requests)
+                        error = ""
+                    except Exception as exc:
+                        print(f"error {label}: {exc}", file=sys.stderr)
+                        result, error = {}, str(exc).splitlines()[0]
+                    writer.writerow(
+                        [
+                            mode,
+                            cache,
+                            evicted,
+                            repeat,
+                            *(_format(result.get(column)) for column in columns),
+                            error,
+                        ]
+                    )
+                    results_file.flush()
+                    if error:
+                        continue
+                    timings.setdefault((mode, cache), []).append(result)
+                    print(
+                        f"{label} bind_s={_format(result['bind_s'])} "
+                        f"load_s={_format(result['load_s'])} "
+                        f"first_completion_s={_format(result['first_completion_s'])} "
+                        f"rss_mb={_format(result['rss_mb'], 1)} "
+                        f"rss_growth_mb={_format(result['rss_growth_mb'], 1)}"
+                    )
+
+    for (mode, cache), results in timings.items():
+        first = statistics.median(item["first_completion_s"] for item in results)
+        rss = [item["rss_mb"] for item in results if item["rss_mb"] is not None]
+        print(
+            f"median mode={mode} cache={cache} first_completion_s={first:.3f} "
+            f"rss_mb={_format(statistics.median(rss) if rss else None, 1)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+import contextlib
+import csv
+import math
+import os
+import random
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Suppress ResourceWarning for unclosed sockets in threaded urllib use (Python 3.12)
+warnings.filterwarnings("ignore", category=ResourceWarning, message="unclosed .*socket")
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from tests.llama_load_utils import (
+    PERCENTILE_COLUMNS,
+    PHASE_COLUMNS,
+    STREAM_COLUMNS,
+    ClientCeiling,
+    client_engine_key,
+    format_extra_columns,
+    format_phase_summary,
+    post_json_with_retry,
+    resolve_client_engine,
+    run_batch_async,
+    run_batch_processes,
+    summarize_batch,
+)
+from tests.llama_monitor_utils import (
+    METRICS_COLUMNS,
+    RESOURCE_COLUMNS,
+    SERVER_LOG_COLUMNS,
+    MetricsPoller,
+    ResourceSampler,
+    ServerLogCollector,
+    resource_sampling_enabled,
+)
+from tests.llama_proxy_utils import (
+    PROXY_COLUMNS,
+    ProxyStatsCollector,
+    resolve_proxy_kind,
+    start_round_robin_proxy,
+)
+from tests.llama_results_utils import tee_results_store
+from tests.llama_server_test_utils import (
+    parse_comma_args,
+    resolve_lb_strategy,
+    server_logs_enabled,
+    server_metrics_enabled,
+    start_llama_servers,
+)
+from tests.llama_sweep_utils import (
+    init_results_file,
+    parse_bool_list,
+    parse_float_list,
+    parse_int_list,
+)
+from tests.llama_workload_utils import synthesize_prompt
+
+GAIN_COLUMNS = ["throughput_gain_pct", "ttft_gain_pct"]
+
+
+def build_prefix_payloads(
+    count,
+    prefix_tokens,
+    share,
+    suffix_tokens,
+    n_predict,
+    temperature,
+    cache_prompt,
+    seed,
+):
+    """Requests whose prompts start with a common prefix at rate *share*.
+
+    Sharing requests are spread evenly through the batch. The others get a
+    private prefix of the same length, so every prompt is the same size and
+    only the reusable part changes. Each request ends in a unique suffix.
+    """
+    rng = random.Random(seed)
+    shared = synthesize_prompt(prefix_tokens, rng) if prefix_tokens else ""
+    payloads = []
+    for index in range(count):
+        if not prefix_tokens:
+            prefix = ""
+        elif math.floor((index + 1) * share) > math.floor(index * share):
+            prefix = shared
+        else:
+            prefix = synthesize_prompt(prefix_tokens, rng)
+        suffix = f"Request {index}: " + synthesize_prompt(suffix_tokens, rng)
+        payloads.append(
+            {
+                "prompt": f"{prefix}\n\n{suffix}" if prefix else suffix,
+                "n_predict": n_predict,
+                "temperature": temperature,
+                "cache_prompt": cache_prompt,
+                "stream": True,
+            }
+        )
+    return payloads
+
+
+def run_batch(url, payloads, concurrency, engine="threads"):
+    if engine == "async":
+        return run_batch_async(url, payloads, concurrency)
+    if engine == "processes":
+        return run_batch_processes(url, payloads, concurrency)
+
+    start_time = time.time()
+    results = []
+    errors = 0
+    last_error = None
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(post_json_with_retry, url, payload) for payload in payloads
+        ]
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                errors += 1
+                last_error = exc
+    total_time = time.time() - start_time
+    return summarize_batch(results, errors, last_error, total_time)
+
+
+def _gain_pct(new, old, lower_is_better=False):
+    if new is None or not old:
+        return None
+    if lower_is_better:
+        return (old - new) / old * 100.0
+    return (new - old) / old * 100.0
+
+
+def _format_value(value, suffix="", precision=1):
+    return "n/a" if value is None else f"{value:.{precision}f}{suffix}"
+
+
+def main():
+    temperature = float(os.environ.get("LLAMA_TEMPERATURE", "0.3"))
+    n_predict = int(os.environ.get("LLAMA_N_PREDICT", "64"))
+    base_port = int(os.environ.get("LLAMA_SERVER_BASE_PORT", "9000"))
+    nginx_port = int(os.environ.get("LLAMA_NGINX_PORT", "8088"))
+    ready_timeout_s = int(os.environ.get("LLAMA_READY_TIMEOUT", "180"))
+    startup_delay_s = float(os.environ.get("LLAMA_STARTUP_DELAY_S", "0.0"))
+    extra_args = parse_comma_args(os.environ.get("LLAMA_SERVER_ARGS", ""))
+
+    prefix_list = parse_int_list(
+        os.environ.get("LLAMA_PREFIX_TOKENS_LIST"),
+        "0,256,1024,2048",
+    )
+    share_list = parse_float_list(
+        os.environ.get("LLAMA_PREFIX_SHARE_LIST"),
+        "0.5,1.0",
+    )
+    suffix_tokens = int(os.environ.get("LLAMA_SUFFIX_TOKENS", "32"))
+    # cache_prompt=off runs first so each "on" row can report its gain.
+    cache_prompt_list = sorted(
+        set(parse_bool_list(os.environ.get("LLAMA_CACHE_PROMPT_LIST"), "0,1"))
+    )
+    instances_list = parse_int_list(
+        os.environ.get("LLAMA_INSTANCES_LIST"),
+        "1,2,4",
+    )
+    parallel_list = parse_int_list(
+        os.environ.get("LLAMA_PARALLEL_LIST"),
+        "1,4,16",
+    )
+    concurrency_list = parse_int_list(
+        os.environ.get("LLAMA_CONCURRENCY_LIST"),
+        "16",
+    )
+    lb_strategy_list = [
+        resolve_lb_strategy(item)
+        for item in (
+            os.environ.get("LLAMA_LB_STRATEGY_LIST") or resolve_lb_strategy()
+        ).replace(",", " ").split()
+    ]
+    total_requests_env = os.environ.get("LLAMA_NUM_REQUESTS")
+    requests_multiplier = int(os.environ.get("LLAMA_REQUESTS_MULTIPLIER", "4"))
+    seed = int(os.environ.get("LLAMA_WORKLOAD_SEED", "0"))
+    cell_pause_s = float(os.environ.get("LLAMA_CELL_PAUSE_S", "0.0"))
+    continue_on_error = os.environ.get("LLAMA_CONTINUE_ON_ERROR", "1").lower() not in {
+        "0",
+        "false",
+        "no",
+    }
+    warmup_requests = int(os.environ.get("LLAMA_WARMUP_REQUESTS", "2"))
+    client_engine = resolve_client_engine()
+    client_ceiling = ClientCeiling.from_env()
+    ceiling_key = client_engine_key(client_engine, stream=True)
+    proxy_kind = resolve_proxy_kind()
+    sample_resources = resource_sampling_enabled()
+    poll_metrics = server_metrics_enabled()
+    extra_header = (
+        STREAM_COLUMNS
+        + PHASE_COLUMNS
+        + GAIN_COLUMNS
+        + PERCENTILE_COLUMNS
+        + RESOURCE_COLUMNS
+        + METRICS_COLUMNS
+        + SERVER_LOG_COLUMNS
+        + PROXY_COLUMNS
+    )
+
+    if requests_multiplier < 1:
+        requests_multiplier = 1
+    share_list = [min(1.0, max(0.0, share)) for share in share_list]
+
+    # Each slot must hold the longest prompt plus its completion. Synthetic
+    # words are roughly one token each; leave headroom for tokenizer drift.
+    ctx_per_session = os.environ.get("LLAMA_CTXSIZE_PER_SESSION")
+    if not ctx_per_session:
+        needed = int((max(prefix_list) + suffix_tokens) * 1.5) + n_predict + 64
+        ctx_per_session = str(max(2048, -(-needed // 256) * 256))
+
+    results_path = init_results_file("prefix_cache_sweep", "prefix_cache_sweep")
+    results_file = results_path.open("w", newline="", encoding="utf-8")
+    header = [
+        "instances",
+        "lb_strategy",
+        "parallel",
+        "prefix_tokens",
+        "prefix_share",
+        "cache_prompt",
+        "concurrency",
+        "throughput_tps",
+        "total_tokens",
+        "elapsed_s",
+        "errors",
+        *extra_header,
+    ]
+    writer = csv.writer(results_file)
+    writer.writerow(header)
+    results_file.flush()
+    writer = tee_results_store(writer, "prefix_cache_sweep", header, results_path)
+
+    print(f"results_file={results_path}")
+    log_dir = results_path.with_name(f"{results_path.stem}_logs")
+    capture_logs = server_logs_enabled()
+    if capture_logs:
+        # Servers started from here on log next to the CSV.
+        os.environ["LLAMA_SERVER_LOG_DIR"] = str(log_dir)
+        print(f"server_logs={log_dir}")
+    print(
+        f"client_engine={client_engine} proxy={proxy_kind} "
+        f"ctx_per_session={ctx_per_session}"
+    )
+
+    def cell_shares(prefix_tokens):
+        # Without a prefix every share value produces the same requests.
+        return share_list[:1] if prefix_tokens == 0 else share_list
+
+    cells_per_deployment = (
+        sum(len(cell_shares(prefix)) for prefix in prefix_list)
+        * len(concurrency_list)
+        * len(cache_prompt_list)
+    )
+    deployments = sum(
+        1 if instances <= 1 else len(lb_strategy_list) for instances in instances_list
+    )
+    total_runs = len(parallel_list) * deployments * cells_per_deployment
+    completed = 0
+    cell_index = 0
+    sweep_start = time.time()
+    best = {"gain": None, "label": None}
+    recorded = set()
+
+    def record_row(labels, result):
+        nonlocal completed
+        recorded.add(tuple(labels))
+        writer.writerow(
+            [
+                *labels,
+                f"{result['throughput']:.1f}",
+                str(result["total_tokens"]),
+                f"{result['elapsed']:.2f}",
+                str(result["errors"]),
+                *format_extra_columns(result, extra_header),
+            ]
+        )
+        results_file.flush()
+        completed += 1
+        elapsed_s = time.time() - sweep_start
+        (
+            instances,
+            strategy,
+            parallel,
+            prefix_tokens,
+            share,
+            cache_prompt,
+            concurrency,
+        ) = labels
+        print(
+            "progress "
+            f"{completed}/{total_runs} "
+            f"({completed / total_runs * 100:.1f}%) "
+            f"elapsed={elapsed_s:.1f}s "
+            f"last=instances={instances} "
+            f"lb_strategy={strategy} "
+            f"parallel={parallel} "
+            f"prefix_tokens={prefix_tokens} "
+            f"share={share} "
+            f"cache_prompt={cache_prompt} "
+            f"concurrency={concurrency}",
+            file=sys.stderr,
+        )
+
+    def failed_result(total_requests, exc):
+        return {
+            "throughput": 0.0,
+            "total_tokens": 0,
+            "elapsed": 0.0,
+            "errors": total_requests,
+            "last_error": exc,
+        }
+
+    def cell_requests(concurrency):
+        if total_requests_env:
+            return int(total_requests_env)
+        return max(1, concurrency * requests_multiplier)
+
+    def record_zeros(instances, strategies, parallel, exc):
+        # Cells a failed deployment never got to still get a row, as errors.
+        for strategy in strategies:
+            for prefix_tokens in prefix_list:
+                for share in cell_shares(prefix_tokens):
+                    for concurrency in concurrency_list:
+                        for cache_prompt in cache_prompt_list:
+                            labels = [
+                                instances,
+                                strategy,
+                                parallel,
+                                prefix_tokens,
+                                share,
+                                int(cache_prompt),
+                                concurrency,
+                            ]
+                            if tuple(labels) in recorded:
+                                continue
+                            result = failed_result(cell_requests(concurrency), exc)
+                            record_row(labels, result)
+
+    def run_cells(base_url, instances, strategy, parallel):
+        nonlocal cell_index
+        for prefix_tokens in prefix_list:
+            for share in cell_shares(prefix_tokens):
+                for concurrency in concurrency_list:
+                    total_requests = cell_requests(concurrency)
+                    baseline = None
+                    for cache_prompt in cache_prompt_list:
+                        # A fresh prefix per cell keeps earlier cells' KV cache
+                        # from leaking hits into this one.
+                        cell_index += 1
+                        payloads = build_prefix_payloads(
+                            total_requests,
+                            prefix_tokens,
+                            share,
+                            suffix_tokens,
+                            n_predict,
+                            temperature,
+                            cache_prompt,
+                            seed + cell_index,
+                        )
+                        monitors = []
+                        if sample_resources:
+                            monitors.append(ResourceSampler())
+                        if poll_metrics:
+                            monitors.append(MetricsPoller())
+                        if capture_logs:
+                            monitors.append(ServerLogCollector(log_dir))
+                        if proxy_kind == "python":
+                            monitors.append(ProxyStatsCollector())
+                        try:
+                            with contextlib.ExitStack() as stack:
+                                for monitor in monitors:
+                                    stack.enter_context(monitor)
+                                result = run_batch(
+                                    f"{base_url}/completion",
+                                    payloads,
+                                    concurrency,
+                                    engine=client_engine,
+                                )
+                        except Exception as exc:
+                            if not continue_on_error:
+                                raise
+                            result = failed_result(total_requests, exc)
+                        for monitor in monitors:
+                            result.update(monitor.fields)
+                        if result["errors"] and result["last_error"]:
+                            print(
+                                "error "
+                                f"instances={instances} lb_strategy={strategy} "
+                                f"parallel={parallel} "
+                                f"prefix_tokens={prefix_tokens} share={share} "
+                                f"cache_prompt={int(cache_prompt)}: "
+                                f"{result['last_error']}",
+                                file=sys.stderr,
+                            )
+                        if cache_prompt and baseline is not None:
+                            result["throughput_gain_pct"] = _gain_pct(
+                                result["throughput"], baseline["throughput"]
+                            )
+                            result["ttft_gain_pct"] = _gain_pct(
+                                result.get("ttft_ms"),
+                                baseline.get("ttft_ms"),
+                                lower_is_better=True,
+                            )
+                        record_row(
+                            [
+                                instances,
+                                strategy,
+                                parallel,
+                                prefix_tokens,
+                                share,
+                                int(cache_prompt),
+                                concurrency,
+                            ],
+                            result,
+                        )
+                        phase_summary = format_phase_summary(result)
+                        if phase_summary:
+                            print(
+                                f"phases prefix_tokens={prefix_tokens} share={share} "
+                                f"cache_prompt={int(cache_prompt)} " + phase_summary,
+                                file=sys.stderr,
+                            )
+                        warning = client_ceiling and client_ceiling.check(
+                            ceiling_key, result
+                        )
+                        if warning:
+                            print(
+                                f"warning prefix_tokens={prefix_tokens} share={share} "
+                                f"cache_prompt={int(cache_prompt)}: {warning}",
+                                file=sys.stderr,
+                            )
+                        if not cache_prompt:
+                            baseline = result
+                        if cell_pause_s > 0:
+                            time.sleep(cell_pause_s)
+                    hit_rate = result.get("cache_hit_rate")
+                    print(
+                        f"prefix_tokens={prefix_tokens:<5} share={share:<4} "
+                        f"conc={concurrency:<4} "
+                        f"tps={_format_value(result['throughput'])} "
+                        f"ttft_ms={_format_value(result.get('ttft_ms'))} "
+                        f"cache_hit_rate={_format_value(hit_rate, precision=3)} "
+                        f"tps_gain={_format_value(result.get('throughput_gain_pct'), '%')} "
+                        f"ttft_gain={_format_value(result.get('ttft_gain_pct'), '%')}"
+                    )
+                    gain = result.get("throughput_gain_pct")
+                    if gain is not None and (best["gain"] is None or gain > best["gain"]):
+                        best["gain"] = gain
+                        best["label"] = (
+                            f"instances={instances} lb_strategy={strategy} "
+                            f"parallel={parallel} "
+                            f"prefix_tokens={prefix_tokens} share={share} "
+                            f"concurrency={concurrency}"
+                        )
+
+    def warm_up(base_url):
+        for _ in range(warmup_requests):
+            post_json_with_retry(
+                f"{base_url}/completion",
+                {
+                    "prompt": "warmup",
+                    "n_predict": 8,
+                    "temperature": 0.0,
+                    "stream": False,
+                },
+            )
+
+    try:
+        for parallel in parallel_list:
+            for instances in instances_list:
+                instances = max(1, instances)
+                os.environ["LLAMA_CTXSIZE_PER_SESSION"] = ctx_per_session
+                os.environ["LLAMA_PARALLEL"] = str(parallel)
+                try:
+                    with start_llama_servers(
+                        instances,
+                        base_port=base_port,
+                        ready_timeout_s=ready_timeout_s,
+                        startup_delay_s=startup_delay_s,
+                        extra_args=extra_args,
+                    ) as servers:
+                        # One instance is hit directly. With more, nginx spreads
+                        # requests per strategy and each backend has its own cache.
+                        if instances == 1:
+                            print(f"\ninstances=1 lb_strategy=direct parallel={parallel}")
+                            warm_up(servers[0]["base_url"])
+                            run_cells(servers[0]["base_url"], 1, "direct", parallel)
+                            continue
+                        upstreams = [(s["host"], s["port"]) for s in servers]
+                        for strategy in lb_strategy_list:
+                            print(
+                                f"\ninstances={instances} lb_strategy={strategy} "
+                                f"parallel={parallel}"
+                            )
+                            with start_round_robin_proxy(
+                                upstreams,
+                                listen_port=nginx_port,
+                                listen_host=servers[0]["host"],
+                                strategy=strategy,
+                            ) as proxy:
+                                warm_up(proxy["base_url"])
+                                run_cells(proxy["base_url"], instances, strategy, parallel)
+                except Exception as exc:
+                    print(
+                        f"error instances={instances} parallel={parallel}: {exc}",
+                        file=sys.stderr,
+                    )
+                    if not continue_on_error:
+                        raise
+                    strategies = ["direct"] if instances == 1 else lb_strategy_list
+                    record_zeros(instances, strategies, parallel, exc)
+    finally:
+        results_file.close()
+
+    if best["label"] is None:
+        print("best cache_prompt gain unavailable (no cache_prompt on/off pairs)")
+    else:
+        print(f"best {best['label']} throughput_gain_pct={best['gain']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
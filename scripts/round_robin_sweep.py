@@ -1,51 +1,74 @@
+import contextlib
 import csv
 import os
 import sys
 import time
 import warnings
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
 
 # Suppress ResourceWarning for unclosed sockets in threaded urllib use (Python 3.12)
 warnings.filterwarnings("ignore", category=ResourceWarning, message="unclosed .*socket")
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+from tests.llama_load_utils import (
+    OPEN_LOOP_COLUMNS,
+    PERCENTILE_COLUMNS,
+    PHASE_COLUMNS,
+    STREAM_COLUMNS,
+    ClientCeiling,
+    client_engine_key,
+    completion_urls,
+    format_extra_columns,
+    format_phase_summary,
+    post_json_with_retry,
+    resolve_client_engine,
+    resolve_load_mode,
+    run_batch_async,
+    run_batch_processes,
+    run_open_loop_async,
+    summarize_batch,
+)
+from tests.llama_monitor_utils import (
+    METRICS_COLUMNS,
+    RESOURCE_COLUMNS,
+    SERVER_LOG_COLUMNS,
+    MetricsPoller,
+    ResourceSampler,
+    ServerLogCollector,
+    resource_sampling_enabled,
+)
+from tests.llama_proxy_utils import (
+    PROXY_COLUMNS,
+    PROXY_OVERHEAD_COLUMNS,
+    ProxyStatsCollector,
+    direct_base_urls,
+    format_overhead_summary,
+    proxy_overhead_enabled,
+    proxy_overhead_fields,
+    resolve_proxy_kind,
+    start_round_robin_proxy,
+)
+from tests.llama_results_utils import tee_results_store
 from tests.llama_server_test_utils import (
-    extract_token_count,
+    NGINX_TUNING_COLUMNS,
+    nginx_tuning_fields,
     parse_comma_args,
-    post_json,
+    resolve_lb_strategy,
+    server_logs_enabled,
+    server_metrics_enabled,
     start_llama_servers,
-    start_nginx_round_robin,
 )
-
-
-def _parse_int_list(value, default):
-    raw = value or default
-    parts = [item.strip() for item in raw.replace(",", " ").split()]
-    return [int(item) for item in parts if item]
-
-
-def _parse_optional_int_list(value, default):
-    raw = value or default
-    parts = [item.strip() for item in raw.replace(",", " ").split()]
-    result = []
-    for item in parts:
-        if not item:
-            continue
-        if item.lower() == "default":
-            result.append(None)
-        else:
-            result.append(int(item))
-    return result or [None]
-
-
-def init_results_file(subdir, prefix):
-    base_dir = Path(os.environ.get("LLAMA_RESULTS_DIR", "results")).expanduser()
-    results_dir = base_dir / subdir
-    results_dir.mkdir(parents=True, exist_ok=True)
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    return results_dir / f"{prefix}_{timestamp}.csv"
+from tests.llama_stats_utils import append_histograms
+from tests.llama_sweep_utils import (
+    init_results_file,
+    nginx_tuning_grid,
+    nginx_tuning_label,
+    parse_float_list,
+    parse_int_list,
+    parse_optional_int_list,
+)
+from tests.llama_workload_utils import Workload, build_payloads
 
 
 def _format_cell(value, width):
@@ -54,31 +77,35 @@ def _format_cell(value, width):
     return f"{value:.1f}".rjust(width)
 
 
-def post_json_with_retry(url, payload, max_attempts=8, base_sleep_s=0.5):
-    for attempt in range(max_attempts):
-        try:
-            return post_json(url, payload)
-        except RuntimeError as exc:
-            message = str(exc)
-            retryable = any(
-                code in message
-                for code in (
-                    "HTTP error 500",
-                    "HTTP error 502",
-                    "HTTP error 503",
-                    "HTTP error 504",
-                    "Loading model",
-                )
-            )
-            if retryable:
-                if attempt == max_attempts - 1:
-                    raise
-                time.sleep(base_sleep_s * (attempt + 1))
-                continue
-            raise
-
+def run_batch(
+    base_url,
+    prompt,
+    n_predict,
+    concurrency,
+    total_requests,
+    temperature,
+    engine="threads",
+    stream=False,
+    workload=None,
+):
+    # base_url may be a list of backends to spread requests over directly.
+    payloads = build_payloads(
+        workload, prompt, n_predict, temperature, stream, total_requests
+    )
+    urls = completion_urls(base_url)
+    if engine == "async":
+        return run_batch_async(
+            urls,
+            payloads,
+            concurrency,
+        )
+    if engine == "processes":
+        return run_batch_processes(
+            urls,
+            payloads,
+            concurrency,
+        )
 
-def run_batch(base_url, prompt, n_predict, concurrency, total_requests, temperature):
     start_time = time.time()
     results = []
     errors = 0
@@ -87,15 +114,10 @@ def run_batch(base_url, prompt, n_predict, concurrency, total_requests, temperat
         futures = [
             executor.submit(
                 post_json_with_retry,
-                f"{base_url}/completion",
-                {
-                    "prompt": prompt,
-                    "n_predict": n_predict,
-                    "temperature": temperature,
-                    "stream": False,
-                },
+                urls[index % len(urls)],
+                payload,
             )
-            for _ in range(total_requests)
+            for index, payload in enumerate(payloads)
         ]
         for future in as_completed(futures):
             try:
@@ -104,16 +126,31 @@ def run_batch(base_url, prompt, n_predict, concurrency, total_requests, temperat
                 errors += 1
                 last_error = exc
     total_time = time.time() - start_time
-
-    total_tokens = sum(extract_token_count(result) for result in results)
-    throughput = total_tokens / total_time if total_time > 0 else 0.0
-    return {
-        "throughput": throughput,
-        "total_tokens": total_tokens,
-        "elapsed": total_time,
-        "errors": errors,
-        "last_error": last_error,
-    }
+    return summarize_batch(results, errors, last_error, total_time)
+
+
+def run_open_loop(
+    base_url,
+    prompt,
+    n_predict,
+    rate_qps,
+    total_requests,
+    temperature,
+    process="constant",
+    stream=False,
+    seed=None,
+    workload=None,
+):
+    payloads = build_payloads(
+        workload, prompt, n_predict, temperature, stream, total_requests
+    )
+    return run_open_loop_async(
+        completion_urls(base_url),
+        payloads,
+        rate_qps,
+        process,
+        seed=seed,
+    )
 
 
 def _build_server_args(base_args, batch_size, ubatch_size):
@@ -154,7 +191,7 @@ def main():
 
     # n_predict ≤ threshold: one server run with ctx = 2048 * parallel. n_predict > threshold: restart per value.
     CTXSIZE_THRESHOLD = 2048
-    max_tokens_list = _parse_int_list(
+    max_tokens_list = parse_int_list(
         os.environ.get("LLAMA_MAX_TOKENS_LIST"),
         "128,256,512,1024",
     )
@@ -162,15 +199,15 @@ def main():
     max_tokens_high = [m for m in max_tokens_list if m > CTXSIZE_THRESHOLD]
     parallel = int(os.environ.get("LLAMA_PARALLEL", "1"))
 
-    batch_list = _parse_optional_int_list(
+    batch_list = parse_optional_int_list(
         os.environ.get("LLAMA_BATCH_LIST"),
         "default",
     )
-    ubatch_list = _parse_optional_int_list(
+    ubatch_list = parse_optional_int_list(
         os.environ.get("LLAMA_UBATCH_LIST"),
         "default",
     )
-    concurrency_list = _parse_int_list(
+    concurrency_list = parse_int_list(
         os.environ.get("LLAMA_CONCURRENCY_LIST"),
         "1,2,4,8,16,32,64,128,256,512,1024",
     )
@@ -185,6 +222,46 @@ def main():
     }
 
     warmup_requests = int(os.environ.get("LLAMA_WARMUP_REQUESTS", "2"))
+    client_engine = resolve_client_engine()
+    load_mode, arrival_process = resolve_load_mode()
+    arrival_rate_list = parse_float_list(
+        os.environ.get("LLAMA_ARRIVAL_RATE_LIST"),
+        "1,2,4,8,16,32",
+    )
+    open_loop_duration_s = float(os.environ.get("LLAMA_OPEN_LOOP_DURATION_S", "30"))
+    arrival_seed = os.environ.get("LLAMA_ARRIVAL_SEED")
+    if arrival_seed is not None:
+        arrival_seed = int(arrival_seed)
+    load_points = arrival_rate_list if load_mode == "open" else concurrency_list
+    stream = os.environ.get("LLAMA_STREAM", "0").lower() in {"1", "true", "yes"}
+    lb_strategy = resolve_lb_strategy()
+    proxy_kind = resolve_proxy_kind()
+    measure_overhead = proxy_overhead_enabled()
+    client_ceiling = ClientCeiling.from_env()
+    ceiling_key = client_engine_key(client_engine, load_mode, stream)
+    nginx_tunings = nginx_tuning_grid() if proxy_kind == "nginx" else [None]
+    tuning = nginx_tunings[0]
+    extra_header = (
+        ["lb_strategy"]
+        + NGINX_TUNING_COLUMNS
+        + OPEN_LOOP_COLUMNS
+        + STREAM_COLUMNS
+        + PHASE_COLUMNS
+        + PERCENTILE_COLUMNS
+        + RESOURCE_COLUMNS
+        + METRICS_COLUMNS
+        + SERVER_LOG_COLUMNS
+        + PROXY_COLUMNS
+        + (PROXY_OVERHEAD_COLUMNS if measure_overhead else [])
+    )
+    sample_resources = resource_sampling_enabled()
+    workload = Workload.from_env()
+    poll_metrics = server_metrics_enabled()
+    write_histograms = os.environ.get("LLAMA_HISTOGRAMS", "0").lower() in {
+        "1",
+        "true",
+        "yes",
+    }
 
     if instance_count < 1:
         instance_count = 1
@@ -194,25 +271,50 @@ def main():
     results_path = init_results_file("round_robin_sweep", "round_robin_sweep")
     results_path.parent.mkdir(parents=True, exist_ok=True)
     results_file = results_path.open("w", newline="", encoding="utf-8")
+    header = [
+        "batch",
+        "ubatch",
+        "max_tokens",
+        "concurrency",
+        "throughput_tps",
+        "total_tokens",
+        "elapsed_s",
+        "errors",
+        *extra_header,
+    ]
     writer = csv.writer(results_file)
-    writer.writerow(
-        [
-            "batch",
-            "ubatch",
-            "max_tokens",
-            "concurrency",
-            "throughput_tps",
-            "total_tokens",
-            "elapsed_s",
-            "errors",
-        ]
-    )
+    writer.writerow(header)
     results_file.flush()
+    writer = tee_results_store(writer, "round_robin_sweep", header, results_path)
 
     print(f"results_file={results_path}")
-
-    total_runs = len(batch_list) * len(ubatch_list) * len(max_tokens_list) * len(
-        concurrency_list
+    log_dir = results_path.with_name(f"{results_path.stem}_logs")
+    capture_logs = server_logs_enabled()
+    if capture_logs:
+        # Servers started from here on log next to the CSV.
+        os.environ["LLAMA_SERVER_LOG_DIR"] = str(log_dir)
+        print(f"server_logs={log_dir}")
+    histograms_path = results_path.with_name(f"{results_path.stem}_histograms.jsonl")
+    if write_histograms:
+        print(f"histograms_file={histograms_path}")
+    if load_mode == "open":
+        print(f"load_mode=open arrival_process={arrival_process}")
+    else:
+        print(f"client_engine={client_engine}")
+    print(
+        f"proxy={proxy_kind} lb_strategy={lb_strategy}"
+        + (" proxy_overhead=1" if measure_overhead else "")
+    )
+    if workload is not None:
+        described = workload.describe().items()
+        print("workload " + " ".join(f"{key}={value}" for key, value in described))
+
+    total_runs = (
+        len(batch_list)
+        * len(ubatch_list)
+        * len(max_tokens_list)
+        * len(load_points)
+        * len(nginx_tunings)
     )
     completed = 0
     sweep_start = time.time()
@@ -226,8 +328,11 @@ def main():
         total_tokens,
         elapsed,
         errors,
+        extra_columns=None,
     ):
         nonlocal completed
+        if extra_columns is None:
+            extra_columns = [""] * len(extra_header)
         writer.writerow(
             [
                 batch_label,
@@ -238,6 +343,7 @@ def main():
                 total_tokens,
                 elapsed,
                 errors,
+                *extra_columns,
             ]
         )
         results_file.flush()
@@ -262,31 +368,123 @@ def main():
         "concurrency": None,
         "batch": None,
         "ubatch": None,
+        "nginx": None,
     }
 
+    def cell_requests(load_point):
+        if total_requests_env:
+            return int(total_requests_env)
+        if load_mode == "open":
+            return max(1, round(load_point * open_loop_duration_s))
+        return max(1, load_point * requests_multiplier)
+
+    def proxy_fields():
+        fields = {"lb_strategy": lb_strategy}
+        if tuning is not None:
+            fields.update(nginx_tuning_fields(tuning))
+        return fields
+
+    def cell_fields(load_point):
+        # Open-loop cells are labelled by target rate; concurrency becomes the observed peak.
+        fields = proxy_fields()
+        if load_mode == "open":
+            return "", {**fields, "arrival_rate_qps": float(load_point)}
+        return load_point, fields
+
+    def drive(base_url, max_tokens, load_point, total_requests, cell_workload):
+        if load_mode == "open":
+            return run_open_loop(
+                base_url,
+                prompt,
+                max_tokens,
+                load_point,
+                total_requests,
+                temperature,
+                process=arrival_process,
+                stream=stream,
+                seed=arrival_seed,
+                workload=cell_workload,
+            )
+        return run_batch(
+            base_url,
+            prompt,
+            max_tokens,
+            load_point,
+            total_requests,
+            temperature,
+            engine=client_engine,
+            stream=stream,
+            workload=cell_workload,
+        )
+
+    def workload_for(*labels):
+        # Cells share their servers, so each draws its own requests instead of
+        # prompts an earlier cell left in the prompt cache.
+        if workload is None:
+            return None
+        return workload.for_cell(*labels)
+
+    def measure_direct(result, proxy, max_tokens, load_point, total_requests, cell):
+        # Same cell again, with the client spreading requests over the backends.
+        direct_urls = direct_base_urls(proxy["upstreams"])
+        try:
+            direct = drive(
+                direct_urls,
+                max_tokens,
+                load_point,
+                total_requests,
+                workload_for(*cell, "direct"),
+            )
+        except Exception as exc:
+            print(
+                f"error direct max_tokens={max_tokens} load={load_point}: {exc}",
+                file=sys.stderr,
+            )
+            return
+        result.update(proxy_overhead_fields(result, direct))
+        print(
+            f"overhead max_tokens={max_tokens} load={load_point} "
+            + format_overhead_summary(result),
+            file=sys.stderr,
+        )
+
     def run_cells(proxy, batch_label, ubatch_label, tokens_subset, col_width):
         """Run sweep cells for given max_tokens list; return normally (exceptions propagate)."""
         for max_tokens in tokens_subset:
             row = [str(max_tokens).rjust(15)]
-            for concurrency in concurrency_list:
-                if total_requests_env:
-                    total_requests = int(total_requests_env)
-                else:
-                    total_requests = max(1, concurrency * requests_multiplier)
+            for load_point in load_points:
+                concurrency, fields = cell_fields(load_point)
+                total_requests = cell_requests(load_point)
+                cell = (batch_label, ubatch_label, max_tokens, load_point)
+                monitors = []
+                if sample_resources:
+                    monitors.append(ResourceSampler())
+                if poll_metrics:
+                    monitors.append(MetricsPoller())
+                if capture_logs:
+                    monitors.append(ServerLogCollector(log_dir))
+                proxy_stats = None
+                if proxy_kind == "python":
+                    proxy_stats = ProxyStatsCollector()
+                    monitors.append(proxy_stats)
                 try:
-                    result = run_batch(
-                        proxy["base_url"],
-                        prompt,
-                        max_tokens,
-                        concurrency,
-                        total_requests,
-                        temperature,
-                    )
+                    with contextlib.ExitStack() as stack:
+                        for monitor in monitors:
+                            stack.enter_context(monitor)
+                        result = drive(
+                            proxy["base_url"],
+                            max_tokens,
+                            load_point,
+                            total_requests,
+                            workload_for(*cell),
+                        )
+                        if load_mode == "open":
+                            concurrency = result["peak_in_flight"]
                 except Exception as exc:
                     print(
                         "error "
                         f"batch={batch_label} ubatch={ubatch_label} "
-                        f"max_tokens={max_tokens} concurrency={concurrency}: {exc}",
+                        f"max_tokens={max_tokens} load={load_point}: {exc}",
                         file=sys.stderr,
                     )
                     if not continue_on_error:
@@ -297,12 +495,20 @@ def main():
                         "elapsed": 0.0,
                         "errors": total_requests,
                         "last_error": exc,
+                        **fields,
                     }
+                for monitor in monitors:
+                    result.update(monitor.fields)
+                result.update(proxy_fields())
+                if measure_overhead and result["total_tokens"]:
+                    measure_direct(
+                        result, proxy, max_tokens, load_point, total_requests, cell
+                    )
                 if result["errors"] and result["last_error"]:
                     print(
                         "error "
                         f"batch={batch_label} ubatch={ubatch_label} "
-                        f"max_tokens={max_tokens} concurrency={concurrency}: "
+                        f"max_tokens={max_tokens} load={load_point}: "
                         f"{result['last_error']}",
                         file=sys.stderr,
                     )
@@ -315,13 +521,46 @@ def main():
                     str(result["total_tokens"]),
                     f"{result['elapsed']:.2f}",
                     str(result["errors"]),
+                    format_extra_columns(result, extra_header),
                 )
+                phase_summary = format_phase_summary(result)
+                if phase_summary:
+                    print(
+                        f"phases max_tokens={max_tokens} load={load_point} "
+                        + phase_summary,
+                        file=sys.stderr,
+                    )
+                warning = client_ceiling and client_ceiling.check(ceiling_key, result)
+                if warning:
+                    print(
+                        f"warning max_tokens={max_tokens} load={load_point}: {warning}",
+                        file=sys.stderr,
+                    )
+                if proxy_stats is not None and proxy_stats.upstreams:
+                    print(
+                        f"upstreams max_tokens={max_tokens} load={load_point} "
+                        + proxy_stats.summary(),
+                        file=sys.stderr,
+                    )
+                if write_histograms and "histograms" in result:
+                    append_histograms(
+                        histograms_path,
+                        {
+                            "batch": batch_label,
+                            "ubatch": ubatch_label,
+                            "max_tokens": max_tokens,
+                            "concurrency": concurrency,
+                            **fields,
+                        },
+                        result["histograms"],
+                    )
                 if result["throughput"] > best["throughput"]:
                     best["throughput"] = result["throughput"]
                     best["tokens"] = max_tokens
-                    best["concurrency"] = concurrency
+                    best["concurrency"] = load_point
                     best["batch"] = batch_label
                     best["ubatch"] = ubatch_label
+                    best["nginx"] = tuning and nginx_tuning_label(tuning)
                 row.append(_format_cell(result["throughput"], col_width))
                 if cell_pause_s > 0:
                     time.sleep(cell_pause_s)
@@ -329,96 +568,110 @@ def main():
 
     def record_zeros(batch_label, ubatch_label, tokens_subset):
         for max_tokens in tokens_subset:
-            for concurrency in concurrency_list:
-                n = int(total_requests_env) if total_requests_env else max(1, concurrency * requests_multiplier)
-                record_row(batch_label, ubatch_label, max_tokens, concurrency, "0.0", "0", "0.00", str(n))
+            for load_point in load_points:
+                concurrency, fields = cell_fields(load_point)
+                n = cell_requests(load_point)
+                record_row(
+                    batch_label, ubatch_label, max_tokens, concurrency, "0.0", "0", "0.00", str(n),
+                    format_extra_columns(fields, extra_header),
+                )
 
     try:
-        for batch_size in batch_list:
-            for ubatch_size in ubatch_list:
-                extra_args = _build_server_args(base_args, batch_size, ubatch_size)
-                batch_label = "default" if batch_size is None else str(batch_size)
-                ubatch_label = "default" if ubatch_size is None else str(ubatch_size)
-                col_width = max(7, max(len(str(c)) for c in concurrency_list))
-                header = ["max_tokens \\ conc".rjust(15)] + [str(c).rjust(col_width) for c in concurrency_list]
-
-                # --- Low tokens (≤2048): one server run, ctx = 2048 * parallel ---
-                if max_tokens_low:
-                    try:
-                        os.environ["LLAMA_CTXSIZE_PER_SESSION"] = "2048"
-                        os.environ["LLAMA_PARALLEL"] = str(parallel)
-                        with start_llama_servers(
-                            instance_count,
-                            base_port=base_port,
-                            ready_timeout_s=ready_timeout_s,
-                            startup_delay_s=startup_delay_s,
-                            extra_args=extra_args,
-                        ) as servers:
-                            upstreams = [(s["host"], s["port"]) for s in servers]
-                            with start_nginx_round_robin(
-                                upstreams,
-                                listen_port=nginx_port,
-                                listen_host=servers[0]["host"],
-                            ) as proxy:
-                                if warmup_requests > 0:
-                                    for _ in range(warmup_requests):
-                                        post_json_with_retry(
-                                            f"{proxy['base_url']}/completion",
-                                            {"prompt": "warmup", "n_predict": 8, "temperature": 0.0, "stream": False},
-                                        )
-                                print(f"\nbatch={batch_label} ubatch={ubatch_label} (ctx=2048*parallel, max_tokens<=2048)")
-                                print(" ".join(header))
-                                print("-" * (len(header) * (col_width + 1)))
-                                run_cells(proxy, batch_label, ubatch_label, max_tokens_low, col_width)
-                    except Exception as exc:
-                        print(f"error batch={batch_label} ubatch={ubatch_label}: {exc}", file=sys.stderr)
-                        if not continue_on_error:
-                            raise
-                        record_zeros(batch_label, ubatch_label, max_tokens_low)
-
-                # --- High tokens (>2048): restart server per max_tokens, ctx = max_tokens * parallel ---
-                for max_tokens in max_tokens_high:
-                    try:
-                        os.environ["LLAMA_CTXSIZE_PER_SESSION"] = str(max_tokens)
-                        os.environ["LLAMA_PARALLEL"] = str(parallel)
-                        with start_llama_servers(
-                            instance_count,
-                            base_port=base_port,
-                            ready_timeout_s=ready_timeout_s,
-                            startup_delay_s=startup_delay_s,
-                            extra_args=extra_args,
-                        ) as servers:
-                            upstreams = [(s["host"], s["port"]) for s in servers]
-                            with start_nginx_round_robin(
-                                upstreams,
-                                listen_port=nginx_port,
-                                listen_host=servers[0]["host"],
-                            ) as proxy:
-                                if warmup_requests > 0:
-                                    for _ in range(warmup_requests):
-                                        post_json_with_retry(
-                                            f"{proxy['base_url']}/completion",
-                                            {"prompt": "warmup", "n_predict": 8, "temperature": 0.0, "stream": False},
-                                        )
-                                print(f"\nbatch={batch_label} ubatch={ubatch_label} (ctx={max_tokens}*parallel)")
-                                print(" ".join(header))
-                                print("-" * (len(header) * (col_width + 1)))
-                                run_cells(proxy, batch_label, ubatch_label, [max_tokens], col_width)
-                    except Exception as exc:
-                        print(f"error batch={batch_label} ubatch={ubatch_label} max_tokens={max_tokens}: {exc}", file=sys.stderr)
-                        if not continue_on_error:
-                            raise
-                        record_zeros(batch_label, ubatch_label, [max_tokens])
+        for tuning in nginx_tunings:
+            if len(nginx_tunings) > 1:
+                print(f"\nnginx {nginx_tuning_label(tuning)}")
+            for batch_size in batch_list:
+                for ubatch_size in ubatch_list:
+                    extra_args = _build_server_args(base_args, batch_size, ubatch_size)
+                    batch_label = "default" if batch_size is None else str(batch_size)
+                    ubatch_label = "default" if ubatch_size is None else str(ubatch_size)
+                    col_width = max(7, max(len(str(c)) for c in load_points))
+                    axis = "qps" if load_mode == "open" else "conc"
+                    header = [f"max_tokens \\ {axis}".rjust(15)] + [str(c).rjust(col_width) for c in load_points]
+
+                    # --- Low tokens (≤2048): one server run, ctx = 2048 * parallel ---
+                    if max_tokens_low:
+                        try:
+                            os.environ["LLAMA_CTXSIZE_PER_SESSION"] = "2048"
+                            os.environ["LLAMA_PARALLEL"] = str(parallel)
+                            with start_llama_servers(
+                                instance_count,
+                                base_port=base_port,
+                                ready_timeout_s=ready_timeout_s,
+                                startup_delay_s=startup_delay_s,
+                                extra_args=extra_args,
+                            ) as servers:
+                                upstreams = [(s["host"], s["port"]) for s in servers]
+                                with start_round_robin_proxy(
+                                    upstreams,
+                                    listen_port=nginx_port,
+                                    listen_host=servers[0]["host"],
+                                    strategy=lb_strategy,
+                                    tuning=tuning,
+                                ) as proxy:
+                                    if warmup_requests > 0:
+                                        for _ in range(warmup_requests):
+                                            post_json_with_retry(
+                                                f"{proxy['base_url']}/completion",
+                                                {"prompt": "warmup", "n_predict": 8, "temperature": 0.0, "stream": False},
+                                            )
+                                    print(f"\nbatch={batch_label} ubatch={ubatch_label} (ctx=2048*parallel, max_tokens<=2048)")
+                                    print(" ".join(header))
+                                    print("-" * (len(header) * (col_width + 1)))
+                                    run_cells(proxy, batch_label, ubatch_label, max_tokens_low, col_width)
+                        except Exception as exc:
+                            print(f"error batch={batch_label} ubatch={ubatch_label}: {exc}", file=sys.stderr)
+                            if not continue_on_error:
+                                raise
+                            record_zeros(batch_label, ubatch_label, max_tokens_low)
+
+                    # --- High tokens (>2048): restart server per max_tokens, ctx = max_tokens * parallel ---
+                    for max_tokens in max_tokens_high:
+                        try:
+                            os.environ["LLAMA_CTXSIZE_PER_SESSION"] = str(max_tokens)
+                            os.environ["LLAMA_PARALLEL"] = str(parallel)
+                            with start_llama_servers(
+                                instance_count,
+                                base_port=base_port,
+                                ready_timeout_s=ready_timeout_s,
+                                startup_delay_s=startup_delay_s,
+                                extra_args=extra_args,
+                            ) as servers:
+                                upstreams = [(s["host"], s["port"]) for s in servers]
+                                with start_round_robin_proxy(
+                                    upstreams,
+                                    listen_port=nginx_port,
+                                    listen_host=servers[0]["host"],
+                                    strategy=lb_strategy,
+                                    tuning=tuning,
+                                ) as proxy:
+                                    if warmup_requests > 0:
+                                        for _ in range(warmup_requests):
+                                            post_json_with_retry(
+                                                f"{proxy['base_url']}/completion",
+                                                {"prompt": "warmup", "n_predict": 8, "temperature": 0.0, "stream": False},
+                                            )
+                                    print(f"\nbatch={batch_label} ubatch={ubatch_label} (ctx={max_tokens}*parallel)")
+                                    print(" ".join(header))
+                                    print("-" * (len(header) * (col_width + 1)))
+                                    run_cells(proxy, batch_label, ubatch_label, [max_tokens], col_width)
+                        except Exception as exc:
+                            print(f"error batch={batch_label} ubatch={ubatch_label} max_tokens={max_tokens}: {exc}", file=sys.stderr)
+                            if not continue_on_error:
+                                raise
+                            record_zeros(batch_label, ubatch_label, [max_tokens])
     finally:
         results_file.close()
 
     print(
         "best "
         f"max_tokens={best['tokens']} "
-        f"concurrency={best['concurrency']} "
+        + ("arrival_rate_qps" if load_mode == "open" else "concurrency")
+        + f"={best['concurrency']} "
         f"batch={best['batch']} "
         f"ubatch={best['ubatch']} "
-        f"throughput_tps={best['throughput']:.1f}"
+        + (f"{best['nginx']} " if len(nginx_tunings) > 1 and best["nginx"] else "")
+        + f"throughput_tps={best['throughput']:.1f}"
     )
 
 
@@ -26,6 +26,15 @@ LLAMA_SERVER_ARGS="${LLAMA_SERVER_ARGS:-}"
 
 NGINX_BIN="${NGINX_BIN:-nginx}"
 NGINX_PORT="${LLAMA_NGINX_PORT:-8088}"
+# round_robin, least_conn, random_two, hash_header or hash_prefix.
+LB_STRATEGY="${LLAMA_LB_STRATEGY:-round_robin}"
+LB_HASH_HEADER="${LLAMA_LB_HASH_HEADER:-X-Session-Id}"
+LB_HASH_PREFIX_CHARS="${LLAMA_LB_HASH_PREFIX_CHARS:-256}"
+NGINX_WORKERS="${LLAMA_NGINX_WORKERS:-1}"
+NGINX_WORKER_CONNECTIONS="${LLAMA_NGINX_WORKER_CONNECTIONS:-1024}"
+# Idle upstream connections kept per worker; 0 disables upstream keepalive.
+NGINX_KEEPALIVE="${LLAMA_NGINX_KEEPALIVE:-0}"
+NGINX_BUFFERING="${LLAMA_NGINX_BUFFERING:-on}"
 
 RUN_DIR="${RUN_DIR:-/tmp/llama-rr}"
 ENV_STATE_FILE="$RUN_DIR/llama-rr.env"
@@ -123,20 +132,56 @@ start() {
     echo $! > "$RUN_DIR/llama-${port}.pid"
   done
 
+  http_lines=""
   upstream_lines=""
+  case "${LB_STRATEGY//-/_}" in
+    round_robin) ;;
+    least_conn) upstream_lines="    least_conn;\n" ;;
+    random_two) upstream_lines="    random two least_conn;\n" ;;
+    hash_header)
+      header_var="$(echo "$LB_HASH_HEADER" | tr '[:upper:]-' '[:lower:]_')"
+      upstream_lines="    hash \$http_${header_var} consistent;\n"
+      ;;
+    hash_prefix)
+      # Key on the start of the JSON prompt; $request_body needs the whole
+      # body buffered in memory.
+      http_lines="  client_body_buffer_size 16m;\n  client_max_body_size 16m;\n"
+      http_lines="${http_lines}  map \$request_body \$llama_prompt_prefix {\n"
+      http_lines="${http_lines}    \"~\\\\\"prompt\\\\\"\\\\s*:\\\\s*\\\\\"(?<llama_key>(?:[^\\\"\\\\\\\\\\\\\\\\]|\\\\\\\\\\\\\\\\.){1,${LB_HASH_PREFIX_CHARS}})\" \$llama_key;\n"
+      http_lines="${http_lines}    default \"\";\n  }\n"
+      upstream_lines="    hash \$llama_prompt_prefix consistent;\n"
+      ;;
+    *)
+      echo "unknown LLAMA_LB_STRATEGY: $LB_STRATEGY" >&2
+      exit 1
+      ;;
+  esac
+  if [ "$NGINX_KEEPALIVE" -gt 0 ]; then
+    upstream_lines="${upstream_lines}    keepalive ${NGINX_KEEPALIVE};\n"
+  fi
   for ((i = 0; i < INSTANCES; i++)); do
     port=$((BASE_PORT + i))
     upstream_lines="${upstream_lines}    server ${HOST}:${port};\n"
   done
+  case "$(echo "$NGINX_BUFFERING" | tr '[:upper:]' '[:lower:]')" in
+    0|false|no|off) buffering=off ;;
+    *) buffering=on ;;
+  esac
+  nofile=$((NGINX_WORKER_CONNECTIONS * 2))
+  if [ "$nofile" -lt 1024 ]; then
+    nofile=1024
+  fi
 
   conf="$RUN_DIR/nginx.conf"
   {
-    printf "worker_processes 1;\n"
+    printf "worker_processes %s;\n" "$NGINX_WORKERS"
+    printf "worker_rlimit_nofile %s;\n" "$nofile"
     printf "pid %s/nginx.pid;\n" "$RUN_DIR"
     printf "error_log %s/nginx-error.log;\n" "$RUN_DIR"
-    printf "events { worker_connections 1024; }\n"
+    printf "events { worker_connections %s; }\n" "$NGINX_WORKER_CONNECTIONS"
     printf "http {\n"
     printf "  access_log %s/nginx-access.log;\n" "$RUN_DIR"
+    printf "%b" "$http_lines"
     printf "  upstream llama_backend {\n%b  }\n" "$upstream_lines"
     printf "  server {\n"
     printf "    listen %s:%s;\n" "$HOST" "$NGINX_PORT"
@@ -144,6 +189,7 @@ start() {
     printf "      proxy_pass http://llama_backend;\n"
     printf "      proxy_http_version 1.1;\n"
     printf "      proxy_set_header Connection \"\";\n"
+    printf "      proxy_buffering %s;\n" "$buffering"
     printf "    }\n  }\n}\n"
   } > "$conf"
 
@@ -157,7 +203,7 @@ BASE_PORT=$BASE_PORT
 NGINX_PORT=$NGINX_PORT
 EOF
 
-  echo "Started ${INSTANCES} llama-server instances and nginx on http://${HOST}:${NGINX_PORT}"
+  echo "Started ${INSTANCES} llama-server instances and nginx (${LB_STRATEGY}) on http://${HOST}:${NGINX_PORT}"
 }
 
 stop() {
@@ -0,0 +1,875 @@
+"""Load-generation engines shared by the sweep scripts."""
+import asyncio
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import random
+import time
+import urllib.parse
+from pathlib import Path
+
+from tests.llama_server_test_utils import (
+    StreamCollector,
+    extract_prompt_token_count,
+    extract_token_count,
+    get_http_pool,
+    post_json,
+)
+from tests.llama_stats_utils import (
+    LatencyHistogram,
+    percentile_columns,
+    percentile_fields,
+)
+
+CLIENT_ENGINES = ("threads", "async", "processes")
+
+LOAD_MODES = ("closed", "open")
+
+ARRIVAL_PROCESSES = ("constant", "poisson")
+
+RETRYABLE_ERROR_MARKERS = (
+    "HTTP error 500",
+    "HTTP error 502",
+    "HTTP error 503",
+    "HTTP error 504",
+    "Loading model",
+)
+
+
+def resolve_client_engine():
+    engine = os.environ.get("LLAMA_CLIENT_ENGINE", "threads").strip().lower()
+    if engine not in CLIENT_ENGINES:
+        raise ValueError(
+            f"Unknown LLAMA_CLIENT_ENGINE={engine!r}; "
+            f"expected one of {', '.join(CLIENT_ENGINES)}."
+        )
+    return engine
+
+
+def resolve_load_mode():
+    """Return ``(load_mode, arrival_process)`` from the environment."""
+    load_mode = os.environ.get("LLAMA_LOAD_MODE", "closed").strip().lower()
+    if load_mode not in LOAD_MODES:
+        raise ValueError(
+            f"Unknown LLAMA_LOAD_MODE={load_mode!r}; "
+            f"expected one of {', '.join(LOAD_MODES)}."
+        )
+    arrival = os.environ.get("LLAMA_ARRIVAL_PROCESS", "constant").strip().lower()
+    if arrival not in ARRIVAL_PROCESSES:
+        raise ValueError(
+            f"Unknown LLAMA_ARRIVAL_PROCESS={arrival!r}; "
+            f"expected one of {', '.join(ARRIVAL_PROCESSES)}."
+        )
+    return load_mode, arrival
+
+
+def client_ceiling_path():
+    """Where ``client_overhead_bench.py`` writes, and sweeps read, client ceilings."""
+    path = os.environ.get("LLAMA_CLIENT_CEILING_FILE")
+    if path:
+        return Path(path).expanduser()
+    base = Path(os.environ.get("LLAMA_RESULTS_DIR", "results")).expanduser()
+    return base / "client_overhead_bench" / "client_ceiling.json"
+
+
+def client_engine_key(engine, load_mode="closed", stream=False):
+    """Ceiling key for the engine a sweep generates load with."""
+    if load_mode == "open":
+        engine = "async"
+    elif engine == "threads" and not get_http_pool().keep_alive:
+        engine = "threads_unpooled"
+    return f"{engine}+stream" if stream else engine
+
+
+class ClientCeiling:
+    """Peak request rates measured by ``scripts/client_overhead_bench.py``.
+
+    A sweep cell whose ``achieved_rps`` reaches ``warn_fraction`` of its
+    engine's ceiling may be measuring the load generator, not the server.
+    """
+
+    def __init__(self, ceilings, warn_fraction=0.8):
+        self.ceilings = ceilings
+        self.warn_fraction = warn_fraction
+
+    @classmethod
+    def from_env(cls):
+        """Load :func:`client_ceiling_path`; None if absent or warnings are off.
+
+        ``LLAMA_CLIENT_CEILING_WARN`` sets the fraction (``0`` disables).
+        """
+        warn_fraction = float(os.environ.get("LLAMA_CLIENT_CEILING_WARN", "0.8"))
+        path = client_ceiling_path()
+        if warn_fraction <= 0 or not path.is_file():
+            return None
+        with open(path, encoding="utf-8") as handle:
+            return cls(json.load(handle).get("ceilings") or {}, warn_fraction)
+
+    def check(self, key, result):
+        """Return a warning when *result*'s rate is near the *key* ceiling."""
+        ceiling = (self.ceilings.get(key) or {}).get("max_rps")
+        rate = result.get("achieved_rps")
+        if not ceiling or not rate or rate < ceiling * self.warn_fraction:
+            return None
+        return (
+            f"achieved_rps={rate:.1f} is {rate / ceiling * 100:.0f}% of the {key} "
+            f"client ceiling ({ceiling:.1f} rps); the client may be the bottleneck"
+        )
+
+
+def is_retryable_error(exc):
+    message = str(exc)
+    return any(marker in message for marker in RETRYABLE_ERROR_MARKERS)
+
+
+def post_json_with_retry(url, payload, timeout=120, max_attempts=8, base_sleep_s=0.5):
+    """:func:`post_json`, retried with linear backoff on retryable errors."""
+    for attempt in range(max_attempts):
+        try:
+            return post_json(url, payload, timeout=timeout)
+        except RuntimeError as exc:
+            if is_retryable_error(exc):
+                if attempt == max_attempts - 1:
+                    raise
+                time.sleep(base_sleep_s * (attempt + 1))
+                continue
+            raise
+
+
+OPEN_LOOP_COLUMNS = ["arrival_rate_qps", "achieved_rps", "peak_in_flight"]
+
+STREAM_COLUMNS = ["ttft_ms", "itl_ms", "latency_ms"]
+
+# Prompt-processing vs generation split, from each response's ``timings``.
+PHASE_COLUMNS = ["prompt_tokens", "prefill_tps", "decode_tps", "cache_hit_rate"]
+
+HISTOGRAM_NAMES = ("latency_ms", "server_ms", "ttft_ms", "itl_ms")
+
+PERCENTILE_COLUMNS = [
+    column for name in HISTOGRAM_NAMES for column in percentile_columns(name)
+]
+
+
+def _phase_totals(results):
+    totals = dict.fromkeys(
+        ("prompt_n", "prompt_ms", "predicted_n", "predicted_ms", "cache_n"), 0.0
+    )
+    for result in results:
+        timings = result.get("timings") or {}
+        for key in totals:
+            totals[key] += float(timings.get(key) or 0.0)
+    return totals
+
+
+def _rate(tokens, ms):
+    return tokens / (ms / 1000.0) if ms > 0 else None
+
+
+def _record_histograms(histograms, result):
+    client = result.get("client_timings") or {}
+    histograms["latency_ms"].record(client.get("latency_ms"))
+    histograms["ttft_ms"].record(client.get("ttft_ms"))
+    for gap in client.get("itl_ms") or ():
+        histograms["itl_ms"].record(gap)
+    timings = result.get("timings") or {}
+    if "prompt_ms" in timings or "predicted_ms" in timings:
+        histograms["server_ms"].record(
+            float(timings.get("prompt_ms") or 0.0)
+            + float(timings.get("predicted_ms") or 0.0)
+        )
+
+
+def _new_histograms():
+    return {name: LatencyHistogram() for name in HISTOGRAM_NAMES}
+
+
+def summarize_batch(results, errors, last_error, elapsed, histograms=None):
+    """Aggregate per-request responses into the dict the sweep CSV writers use.
+
+    Per-request client wall time, server-reported ``prompt_ms + predicted_ms``
+    and (for streamed requests) TTFT and inter-token gaps are folded into
+    ``histograms``; their means and p50/p90/p99 are exposed as flat keys that
+    are ``None`` when no request reported them.
+
+    Server ``timings`` are also summed per phase: ``prefill_tps`` and
+    ``decode_tps`` are evaluated/generated tokens over the server time spent
+    in each phase, and ``cache_hit_rate`` is the share of prompt tokens
+    served from the prompt cache (``cache_n``).
+
+    Pass *histograms* when they were already recorded elsewhere (e.g. by
+    the worker processes); *results* then only feed the token counts.
+    """
+    total_tokens = sum(extract_token_count(result) for result in results)
+    prompt_tokens = sum(extract_prompt_token_count(result) for result in results)
+    phases = _phase_totals(results)
+    throughput = total_tokens / elapsed if elapsed > 0 else 0.0
+
+    if histograms is None:
+        histograms = _new_histograms()
+        for result in results:
+            _record_histograms(histograms, result)
+
+    summary = {
+        "throughput": throughput,
+        "total_tokens": total_tokens,
+        "prompt_tokens": prompt_tokens,
+        "prefill_tps": _rate(phases["prompt_n"], phases["prompt_ms"]),
+        "decode_tps": _rate(phases["predicted_n"], phases["predicted_ms"]),
+        "cache_hit_rate": (
+            phases["cache_n"] / (phases["cache_n"] + phases["prompt_n"])
+            if phases["cache_n"] + phases["prompt_n"] > 0
+            else None
+        ),
+        "elapsed": elapsed,
+        "errors": errors,
+        "last_error": last_error,
+        "achieved_rps": len(results) / elapsed if elapsed > 0 else 0.0,
+        "ttft_ms": histograms["ttft_ms"].mean,
+        "itl_ms": histograms["itl_ms"].mean,
+        "latency_ms": histograms["latency_ms"].mean,
+        "histograms": histograms,
+    }
+    for name, histogram in histograms.items():
+        summary.update(percentile_fields(name, histogram))
+    return summary
+
+
+def format_extra_columns(result, columns):
+    """Format optional result fields for CSV output, blank when unavailable."""
+    values = []
+    for column in columns:
+        value = result.get(column)
+        if value is None:
+            values.append("")
+        elif isinstance(value, float):
+            values.append(str(round(value, 3)))
+        else:
+            values.append(str(value))
+    return values
+
+
+def format_phase_summary(result):
+    """One-line ``prefill_tps=... decode_tps=... cache_hit_rate=...`` summary."""
+    parts = []
+    for column in PHASE_COLUMNS[1:]:
+        value = result.get(column)
+        if value is not None:
+            precision = 3 if column == "cache_hit_rate" else 1
+            parts.append(f"{column}={value:.{precision}f}")
+    return " ".join(parts)
+
+
+def raise_nofile_limit(minimum):
+    """Best-effort bump of RLIMIT_NOFILE so high concurrency doesn't hit EMFILE."""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = minimum + 256
+    if soft == resource.RLIM_INFINITY or soft >= wanted:
+        return
+    if hard != resource.RLIM_INFINITY:
+        wanted = min(wanted, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+    except (ValueError, OSError):
+        pass
+
+
+class _StaleConnection(ConnectionResetError):
+    """The request on a kept-alive connection never reached the server."""
+
+
+class _AsyncConnection:
+    """One keep-alive HTTP/1.1 connection driven from the event loop."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+    async def post(self, path, body, timeout, new_sink=None):
+        """Send one request and return ``(status, body)``.
+
+        ``new_sink`` is called once per attempt and returns the callback a
+        successful streamed body is passed to as it arrives, so a resent
+        request never feeds a half-used collector.
+        """
+        # A reused connection may have been closed by the server while idle;
+        # retry once on a fresh socket if the request provably never ran.
+        for _ in range(2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), timeout
+                )
+            on_data = new_sink() if new_sink is not None else None
+            try:
+                return await asyncio.wait_for(
+                    self._roundtrip(path, body, on_data), timeout
+                )
+            except _StaleConnection:
+                self.close()
+                if not reused:
+                    raise
+            except BaseException:
+                self.close()
+                raise
+
+    async def _roundtrip(self, path, body, on_data):
+        try:
+            self.writer.write(
+                (
+                    f"POST {path} HTTP/1.1\r\n"
+                    f"Host: {self.host}:{self.port}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: keep-alive\r\n"
+                    "\r\n"
+                ).encode("latin-1")
+                + body
+            )
+            await self.writer.drain()
+        except ConnectionError as exc:
+            raise _StaleConnection(str(exc)) from exc
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            # Closed before a single response byte: the server dropped the
+            # idle connection as the request went out, so it never ran. Any
+            # later failure may come after the server did the work, and
+            # resending would double-submit it.
+            raise _StaleConnection("Server closed the connection")
+        parts = status_line.decode("latin-1").split(" ", 2)
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # Successful streamed bodies go to on_data as they arrive instead of
+        # being buffered.
+        chunks = []
+        sink = on_data if on_data is not None and status == 200 else chunks.append
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await self.reader.readline()
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                sink(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+        elif "content-length" in headers:
+            sink(await self.reader.readexactly(int(headers["content-length"])))
+        else:
+            while True:
+                chunk = await self.reader.read(65536)
+                if not chunk:
+                    break
+                sink(chunk)
+            self.close()
+        data = b"".join(chunks)
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, data
+
+
+async def _post_json_async(conn, path, payload, timeout):
+    body = json.dumps(payload).encode("utf-8")
+    start = time.perf_counter()
+    collectors = []
+    new_sink = None
+    if payload.get("stream"):
+
+        def new_sink():
+            collector = StreamCollector(start)
+            collectors.append(collector)
+            return lambda chunk: collector.feed(chunk, time.perf_counter())
+
+    try:
+        status, data = await conn.post(path, body, timeout, new_sink)
+    except asyncio.TimeoutError as exc:
+        raise TimeoutError(f"Request timed out after {timeout}s") from exc
+    if status != 200:
+        text = data.decode("utf-8", errors="replace")
+        raise RuntimeError(f"HTTP error {status}: {text}")
+    if collectors:
+        return collectors[-1].finish(time.perf_counter())
+    response = json.loads(data.decode("utf-8"))
+    response["client_timings"] = {
+        "latency_ms": (time.perf_counter() - start) * 1000.0,
+    }
+    return response
+
+
+async def _post_json_async_with_retry(
+    conn, path, payload, timeout, max_attempts, base_sleep_s
+):
+    for attempt in range(max_attempts):
+        try:
+            return await _post_json_async(conn, path, payload, timeout)
+        except RuntimeError as exc:
+            if is_retryable_error(exc):
+                if attempt == max_attempts - 1:
+                    raise
+                await asyncio.sleep(base_sleep_s * (attempt + 1))
+                continue
+            raise
+
+
+def _split_url(url):
+    parsed = urllib.parse.urlsplit(url)
+    path = parsed.path or "/"
+    if parsed.query:
+        path += f"?{parsed.query}"
+    return parsed.hostname, parsed.port or 80, path
+
+
+def _url_list(url):
+    return [url] if isinstance(url, str) else list(url)
+
+
+def completion_urls(base_url):
+    """``/completion`` URLs for one base URL or a list of them."""
+    return [f"{url}/completion" for url in _url_list(base_url)]
+
+
+async def _run_batch_async(
+    url,
+    payloads,
+    concurrency,
+    request_timeout,
+    retry_attempts,
+    retry_sleep_s,
+    on_result=None,
+    on_error=None,
+):
+    # on_result/on_error, when given, receive each outcome as it completes
+    # (instead of it being kept for the summary).
+    targets = [_split_url(item) for item in _url_list(url)]
+    pending = iter(enumerate(payloads))
+    results = []
+    errors = 0
+    last_error = None
+
+    async def worker():
+        nonlocal errors, last_error
+        # One keep-alive connection per target this worker has sent to.
+        conns = {}
+        try:
+            for index, payload in pending:
+                host, port, path = targets[index % len(targets)]
+                conn = conns.get((host, port))
+                if conn is None:
+                    conn = conns[(host, port)] = _AsyncConnection(host, port)
+                try:
+                    result = await _post_json_async_with_retry(
+                        conn,
+                        path,
+                        payload,
+                        request_timeout,
+                        retry_attempts,
+                        retry_sleep_s,
+                    )
+                except Exception as exc:
+                    errors += 1
+                    last_error = exc
+                    if on_error is not None:
+                        on_error(exc)
+                    continue
+                if on_result is not None:
+                    on_result(result)
+                else:
+                    results.append(result)
+        finally:
+            for conn in conns.values():
+                conn.close()
+
+    workers = max(1, min(concurrency, len(payloads)))
+    start_time = time.time()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    elapsed = time.time() - start_time
+    return summarize_batch(results, errors, last_error, elapsed)
+
+
+def run_batch_async(
+    url,
+    payloads,
+    concurrency,
+    request_timeout=120,
+    retry_attempts=8,
+    retry_sleep_s=0.5,
+):
+    """Drive *payloads* against *url* from one event loop.
+
+    ``concurrency`` workers each hold a keep-alive connection and pull the
+    next payload as soon as their previous request finishes, matching the
+    closed-loop behaviour of the threaded engine without one OS thread per
+    in-flight request. ``url`` may also be a list of URLs, in which case
+    requests are spread over them round-robin.
+    """
+    raise_nofile_limit(concurrency)
+    return asyncio.run(
+        _run_batch_async(
+            url,
+            list(payloads),
+            concurrency,
+            request_timeout,
+            retry_attempts,
+            retry_sleep_s,
+        )
+    )
+
+
+def parse_cpu_list(value):
+    """Parse a ``taskset``-style CPU list such as ``"0-3,8"``."""
+    cpus = []
+    for part in (value or "").replace(" ", "").split(","):
+        if not part:
+            continue
+        if "-" in part:
+            low, high = part.split("-", 1)
+            cpus.extend(range(int(low), int(high) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def _split_evenly(total, parts):
+    return [total // parts + (index < total % parts) for index in range(parts)]
+
+
+def _process_worker(
+    index,
+    url,
+    payloads,
+    concurrency,
+    request_timeout,
+    retry_attempts,
+    retry_sleep_s,
+    cpus,
+    events,
+    start,
+):
+    """Entry point of one ``processes``-engine worker (runs in a child).
+
+    Events on the queue are ``(index, kind, value)`` tuples. Latencies are
+    recorded into local histograms, sent once at the end, so responses go
+    to the parent without their per-token gaps.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    raise_nofile_limit(concurrency)
+
+    histograms = _new_histograms()
+
+    def on_result(result):
+        _record_histograms(histograms, result)
+        client = result.get("client_timings")
+        if client and "itl_ms" in client:
+            client = {key: value for key, value in client.items() if key != "itl_ms"}
+            result = dict(result, client_timings=client)
+        events.put((index, "result", result))
+
+    def on_error(exc):
+        events.put((index, "error", f"{type(exc).__name__}: {exc}"))
+
+    events.put((index, "ready", None))
+    start.wait()
+    try:
+        asyncio.run(
+            _run_batch_async(
+                url,
+                payloads,
+                concurrency,
+                request_timeout,
+                retry_attempts,
+                retry_sleep_s,
+                on_result=on_result,
+                on_error=on_error,
+            )
+        )
+    except BaseException as exc:
+        events.put((index, "failed", f"{type(exc).__name__}: {exc}"))
+        raise
+    finally:
+        events.put((index, "histograms", histograms))
+        events.put((index, "done", None))
+
+
+def run_batch_processes(
+    url,
+    payloads,
+    concurrency,
+    request_timeout=120,
+    retry_attempts=8,
+    retry_sleep_s=0.5,
+    processes=None,
+    cpus=None,
+):
+    """Shard a closed-loop batch across worker processes.
+
+    Concurrency and payloads are split evenly over ``processes`` workers
+    (``LLAMA_CLIENT_PROCESSES``, default: CPU count) started with the
+    ``spawn`` method, each running the asyncio engine. Workers are optionally
+    pinned to ``cpus`` (``LLAMA_CLIENT_CPUS``, e.g. ``"0-3"``) and stream
+    every response back over a queue, so the parent returns the same
+    summary as :func:`run_batch_async`. The clock starts once all workers
+    are up, so interpreter startup is not counted. Requests a worker never
+    reported, because it failed or died, are counted as errors.
+    """
+    payloads = list(payloads)
+    urls = _url_list(url)
+    if processes is None:
+        processes = int(os.environ.get("LLAMA_CLIENT_PROCESSES", "0"))
+        processes = processes or os.cpu_count() or 1
+    if cpus is None:
+        cpus = parse_cpu_list(os.environ.get("LLAMA_CLIENT_CPUS"))
+    processes = max(1, min(processes, concurrency, len(payloads) or 1))
+
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    start = context.Event()
+    workers = []
+    shard_sizes = []
+    offset = 0
+    for share, worker_payloads in zip(
+        _split_evenly(concurrency, processes),
+        _split_evenly(len(payloads), processes),
+    ):
+        shard = payloads[offset:offset + worker_payloads]
+        # Rotate the targets so each shard continues the global round-robin.
+        turn = offset % len(urls)
+        shard_urls = urls[turn:] + urls[:turn]
+        offset += worker_payloads
+        worker = context.Process(
+            target=_process_worker,
+            args=(
+                len(workers),
+                shard_urls,
+                shard,
+                share,
+                request_timeout,
+                retry_attempts,
+                retry_sleep_s,
+                cpus,
+                events,
+                start,
+            ),
+            daemon=True,
+        )
+        worker.start()
+        workers.append(worker)
+        shard_sizes.append(len(shard))
+
+    results = []
+    errors = 0
+    last_error = None
+    histograms = _new_histograms()
+    # Responses of workers whose histograms have not arrived (yet).
+    unmerged = [[] for _ in workers]
+    reported = [0] * len(workers)
+    failures = [None] * len(workers)
+    ready = set()
+    finished = set()
+
+    def finish(index, reason):
+        nonlocal errors, last_error
+        finished.add(index)
+        missing = shard_sizes[index] - reported[index]
+        if missing > 0:
+            errors += missing
+            last_error = RuntimeError(
+                f"load worker {index} {failures[index] or reason}; "
+                f"{missing} requests not completed"
+            )
+
+    def handle(index, kind, value):
+        nonlocal errors, last_error
+        if kind == "ready":
+            ready.add(index)
+        elif kind == "result":
+            reported[index] += 1
+            results.append(value)
+            if unmerged[index] is not None:
+                unmerged[index].append(value)
+        elif kind == "histograms":
+            for name, histogram in value.items():
+                histograms[name].merge(histogram)
+            unmerged[index] = None
+        elif kind == "error":
+            reported[index] += 1
+            errors += 1
+            last_error = RuntimeError(value)
+        elif kind == "failed":
+            failures[index] = f"failed: {value}"
+        elif kind == "done" and index not in finished:
+            finish(index, "stopped early")
+
+    sentinels = {worker.sentinel: index for index, worker in enumerate(workers)}
+    try:
+        start_time = None
+        while len(finished) < len(workers):
+            try:
+                handle(*events.get(timeout=0.1))
+            except queue.Empty:
+                pass
+            # One poll over the process handles; a worker that dies never
+            # sends "done", so check after every event, not only when the
+            # queue goes quiet.
+            dead = [
+                sentinels[sentinel]
+                for sentinel in multiprocessing.connection.wait(list(sentinels), 0)
+            ]
+            if dead:
+                # Whatever a dead worker sent is already in the pipe; read it
+                # all before counting the rest of its shard as failed.
+                while True:
+                    try:
+                        handle(*events.get_nowait())
+                    except queue.Empty:
+                        break
+                for index in dead:
+                    del sentinels[workers[index].sentinel]
+                    if index not in finished:
+                        finish(index, f"exited with code {workers[index].exitcode}")
+                    ready.add(index)
+            if start_time is None and len(ready) == len(workers):
+                start_time = time.time()
+                start.set()
+        elapsed = time.time() - start_time
+    finally:
+        start.set()
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+    # A worker that died sent no histograms; fall back to its responses
+    # (which lack the inter-token gaps).
+    for pending in unmerged:
+        for result in pending or ():
+            _record_histograms(histograms, result)
+    return summarize_batch(results, errors, last_error, elapsed, histograms)
+
+
+def arrival_offsets(count, rate_qps, process="constant", seed=None):
+    """Return *count* request start offsets (seconds) for a target rate."""
+    if rate_qps <= 0:
+        raise ValueError("rate_qps must be > 0")
+    if process == "constant":
+        return [index / rate_qps for index in range(count)]
+    rng = random.Random(seed)
+    offsets = []
+    now = 0.0
+    for _ in range(count):
+        offsets.append(now)
+        now += rng.expovariate(rate_qps)
+    return offsets
+
+
+async def _run_open_loop_async(
+    url, payloads, offsets, request_timeout, retry_attempts, retry_sleep_s
+):
+    targets = [_split_url(item) for item in _url_list(url)]
+    idle = {target: [] for target in targets}
+    results = []
+    errors = 0
+    last_error = None
+    in_flight = 0
+    peak_in_flight = 0
+
+    async def fire(payload, target):
+        nonlocal errors, last_error, in_flight
+        host, port, path = target
+        pool = idle[target]
+        conn = pool.pop() if pool else _AsyncConnection(host, port)
+        try:
+            results.append(
+                await _post_json_async_with_retry(
+                    conn,
+                    path,
+                    payload,
+                    request_timeout,
+                    retry_attempts,
+                    retry_sleep_s,
+                )
+            )
+        except Exception as exc:
+            errors += 1
+            last_error = exc
+        finally:
+            in_flight -= 1
+            pool.append(conn)
+
+    loop = asyncio.get_running_loop()
+    tasks = []
+    start_time = time.time()
+    start = loop.time()
+    for index, (payload, offset) in enumerate(zip(payloads, offsets)):
+        delay = start + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        target = targets[index % len(targets)]
+        tasks.append(asyncio.ensure_future(fire(payload, target)))
+    await asyncio.gather(*tasks)
+    elapsed = time.time() - start_time
+    for pool in idle.values():
+        for conn in pool:
+            conn.close()
+
+    summary = summarize_batch(results, errors, last_error, elapsed)
+    summary["peak_in_flight"] = peak_in_flight
+    return summary
+
+
+def run_open_loop_async(
+    url,
+    payloads,
+    rate_qps,
+    process="constant",
+    request_timeout=120,
+    retry_attempts=8,
+    retry_sleep_s=0.5,
+    seed=None,
+):
+    """Fire *payloads* at *rate_qps* regardless of how fast they complete.
+
+    Arrivals are evenly spaced (``constant``) or exponentially distributed
+    (``poisson``). Unlike the closed-loop engines, a slow server doesn't
+    throttle the offered load, so queueing collapse past the saturation
+    point shows up as rising latency and a falling ``achieved_rps``.
+    ``url`` may be a list, as for :func:`run_batch_async`.
+    """
+    payloads = list(payloads)
+    offsets = arrival_offsets(len(payloads), rate_qps, process, seed)
+    raise_nofile_limit(len(payloads))
+    summary = asyncio.run(
+        _run_open_loop_async(
+            url,
+            payloads,
+            offsets,
+            request_timeout,
+            retry_attempts,
+            retry_sleep_s,
+        )
+    )
+    summary["arrival_rate_qps"] = float(rate_qps)
+    return summary
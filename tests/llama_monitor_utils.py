@@ -0,0 +1,550 @@
+"""Background /proc sampling of the llama-server and nginx processes."""
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+from tests.llama_server_test_utils import (
+    managed_processes,
+    managed_server_logs,
+    managed_server_urls,
+)
+
+RESOURCE_COLUMNS = [
+    "server_cpu_pct",
+    "server_rss_mb",
+    "server_ctx_switches",
+    "nginx_cpu_pct",
+    "nginx_rss_mb",
+    "system_cpu_pct",
+    "system_iowait_pct",
+    "loadavg_1m",
+]
+
+METRICS_COLUMNS = [
+    "deferred_avg",
+    "deferred_peak",
+    "kv_cache_usage_avg",
+    "kv_cache_usage_peak",
+    "busy_slots_avg",
+    "busy_slots_peak",
+]
+
+SERVER_LOG_COLUMNS = [
+    "server_log",
+    "log_load_s",
+    "log_model_mib",
+    "log_kv_cache_mib",
+    "log_n_ctx",
+    "log_n_batch",
+    "log_n_ubatch",
+    "log_n_slots",
+    "log_tasks",
+    "log_slots_peak",
+    "log_batch_tokens_avg",
+    "log_warnings",
+    "log_errors",
+    "log_last_warning",
+]
+
+_ROLE_PREFIX = {"llama-server": "server", "nginx": "nginx"}
+
+_MEMORY_KEYS = {"VmRSS": "rss", "RssAnon": "rss_anon", "RssFile": "rss_file"}
+
+_CTX_SWITCH_KEYS = ("voluntary_ctxt_switches:", "nonvoluntary_ctxt_switches:")
+
+
+def resource_sampling_enabled():
+    enabled = os.environ.get("LLAMA_RESOURCE_SAMPLING", "1").lower() not in {
+        "0",
+        "false",
+        "no",
+    }
+    return enabled and os.path.isdir("/proc/self")
+
+
+def _read(path):
+    try:
+        with open(path, encoding="ascii", errors="replace") as handle:
+            return handle.read()
+    except OSError:
+        return None
+
+
+def _proc_stat(pid):
+    """Return ``(ppid, cpu_ticks)`` from /proc/<pid>/stat, or None."""
+    raw = _read(f"/proc/{pid}/stat")
+    if not raw:
+        return None
+    # comm may contain spaces/parens; the remaining fields follow the last ')'.
+    fields = raw[raw.rfind(")") + 2:].split()
+    return int(fields[1]), int(fields[11]) + int(fields[12])
+
+
+def _proc_rss_kb(pid):
+    raw = _read(f"/proc/{pid}/status")
+    if raw:
+        for line in raw.splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def process_memory_mb(pid):
+    """Return ``{"rss": ..., "rss_anon": ..., "rss_file": ...}`` in MB, or {}.
+
+    ``rss_file`` is the file-backed share, i.e. an mmap'd model's resident
+    pages.
+    """
+    raw = _read(f"/proc/{pid}/status")
+    memory = {}
+    for line in (raw or "").splitlines():
+        key, _, value = line.partition(":")
+        if key in _MEMORY_KEYS:
+            memory[_MEMORY_KEYS[key]] = int(value.split()[0]) / 1024.0
+    return memory
+
+
+def _proc_ctx_switches(pid):
+    """Voluntary + involuntary context switches summed over all threads."""
+    total = 0
+    try:
+        tids = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return 0
+    for tid in tids:
+        raw = _read(f"/proc/{pid}/task/{tid}/status")
+        if not raw:
+            continue
+        for line in raw.splitlines():
+            if line.startswith(_CTX_SWITCH_KEYS):
+                total += int(line.split()[1])
+    return total
+
+
+def _system_cpu():
+    """Return ``(busy, iowait, total)`` jiffies from the aggregate /proc/stat line."""
+    raw = _read("/proc/stat")
+    if not raw:
+        return None
+    values = [int(value) for value in raw.splitlines()[0].split()[1:]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    iowait = values[4] if len(values) > 4 else 0
+    # guest time is already counted in user/nice.
+    total = sum(values[:8])
+    return total - idle, iowait, total
+
+
+def _loadavg():
+    raw = _read("/proc/loadavg")
+    return float(raw.split()[0]) if raw else None
+
+
+def _children(parents):
+    """Map pid -> ppid for every process whose parent is in *parents*."""
+    found = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        stat = _proc_stat(int(entry))
+        if stat and stat[0] in parents:
+            found[int(entry)] = stat[0]
+    return found
+
+
+class ResourceSampler:
+    """Sample CPU, RSS and context switches of managed processes in a thread.
+
+    Tracks every process registered by :func:`start_llama_server` and
+    :func:`start_nginx_round_robin` (plus their children, i.e. nginx
+    workers) and the system-wide CPU split. The processes are looked up once
+    when sampling starts, so each sample only reads their own /proc files.
+    CPU and context switches are deltas over the sampling window; RSS is the
+    peak of the per-role sum and load average the mean of the samples. Use
+    as a context manager around one sweep cell and read :attr:`fields`
+    afterwards.
+    """
+
+    def __init__(self, interval_s=None):
+        if interval_s is None:
+            interval_s = float(os.environ.get("LLAMA_RESOURCE_SAMPLE_S", "0.5"))
+        self.interval_s = max(0.05, interval_s)
+        self.fields = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._first = {}
+        self._last = {}
+        self._roles = {}
+        self._pids = {}
+        self._peak_rss_kb = {}
+        self._loadavg = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self._start_time = time.monotonic()
+        self._start_system = _system_cpu()
+        self._pids = self._resolve_pids()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    @staticmethod
+    def _resolve_pids():
+        roots = {pid: role for role, pid in managed_processes()}
+        pids = dict(roots)
+        for child, parent in _children(set(roots)).items():
+            pids[child] = roots[parent]
+        return pids
+
+    def _sample(self):
+        rss_kb = {}
+        for pid, role in self._pids.items():
+            stat = _proc_stat(pid)
+            if stat is None:
+                continue
+            snapshot = (stat[1], _proc_ctx_switches(pid))
+            self._first.setdefault(pid, snapshot)
+            self._last[pid] = snapshot
+            self._roles[pid] = role
+            rss_kb[role] = rss_kb.get(role, 0) + _proc_rss_kb(pid)
+        for role, value in rss_kb.items():
+            self._peak_rss_kb[role] = max(self._peak_rss_kb.get(role, 0), value)
+        loadavg = _loadavg()
+        if loadavg is not None:
+            self._loadavg.append(loadavg)
+
+    def stop(self):
+        if self._thread is None:
+            return self.fields
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._sample()
+        elapsed = max(time.monotonic() - self._start_time, 1e-6)
+        ticks_per_s = os.sysconf("SC_CLK_TCK")
+
+        fields = {}
+        for role, prefix in _ROLE_PREFIX.items():
+            pids = [pid for pid, owner in self._roles.items() if owner == role]
+            if not pids:
+                continue
+            cpu_ticks = sum(self._last[pid][0] - self._first[pid][0] for pid in pids)
+            fields[f"{prefix}_cpu_pct"] = cpu_ticks / ticks_per_s / elapsed * 100.0
+            fields[f"{prefix}_rss_mb"] = self._peak_rss_kb.get(role, 0) / 1024.0
+            if prefix == "server":
+                fields["server_ctx_switches"] = sum(
+                    self._last[pid][1] - self._first[pid][1] for pid in pids
+                )
+
+        end_system = _system_cpu()
+        if self._start_system and end_system:
+            busy, iowait, total = (
+                end - start for end, start in zip(end_system, self._start_system)
+            )
+            if total > 0:
+                fields["system_cpu_pct"] = busy / total * 100.0
+                fields["system_iowait_pct"] = iowait / total * 100.0
+        if self._loadavg:
+            fields["loadavg_1m"] = sum(self._loadavg) / len(self._loadavg)
+        self.fields = fields
+        return fields
+
+
+def parse_prometheus_text(text):
+    """Return ``{metric: value}`` for the unlabelled samples in *text*.
+
+    llama-server prefixes its metrics with ``llamacpp:``; the prefix is
+    dropped so callers can use the bare names.
+    """
+    values = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split()
+        if len(parts) < 2:
+            continue
+        name = parts[0].split("{", 1)[0]
+        if ":" in name:
+            name = name.split(":", 1)[1]
+        try:
+            values[name] = float(parts[1])
+        except ValueError:
+            continue
+    return values
+
+
+def _busy_slots(slots):
+    busy = 0
+    for slot in slots:
+        if "is_processing" in slot:
+            busy += bool(slot["is_processing"])
+        else:
+            # Older servers report state 0 (idle) / 1 (processing).
+            busy += slot.get("state", 0) != 0
+    return busy
+
+
+def _time_weighted(samples):
+    """Mean of a step function sampled as ``[(t, value), ...]``."""
+    if len(samples) == 1:
+        return samples[0][1]
+    span = samples[-1][0] - samples[0][0]
+    if span <= 0:
+        return sum(value for _, value in samples) / len(samples)
+    area = sum(
+        value * (next_t - t) for (t, value), (next_t, _) in zip(samples, samples[1:])
+    )
+    return area / span
+
+
+class MetricsPoller:
+    """Scrape ``/metrics`` and ``/slots`` of every backend during a cell.
+
+    Each tick records the summed deferred requests and busy slots across
+    backends and the mean and max ``kv_cache_usage_ratio``. On stop,
+    :attr:`fields` holds the time-weighted average and peak of each.
+    ``/metrics`` needs ``--metrics`` (see ``LLAMA_SERVER_METRICS``); when
+    ``/slots`` is disabled, busy slots fall back to ``requests_processing``.
+    """
+
+    def __init__(self, base_urls=None, interval_s=None, timeout_s=2.0):
+        if interval_s is None:
+            interval_s = float(os.environ.get("LLAMA_METRICS_INTERVAL_S", "1.0"))
+        self.base_urls = base_urls
+        self.interval_s = max(0.05, interval_s)
+        self.timeout_s = timeout_s
+        self.fields = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._slots_unavailable = set()
+        self._samples = {"deferred": [], "kv_avg": [], "kv_max": [], "busy": []}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        if self.base_urls is None:
+            self.base_urls = managed_server_urls()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self._sample()
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def _get(self, url):
+        with urllib.request.urlopen(url, timeout=self.timeout_s) as resp:
+            return resp.read().decode("utf-8", errors="replace")
+
+    def _scrape(self, base_url):
+        try:
+            metrics = parse_prometheus_text(self._get(f"{base_url}/metrics"))
+        except (OSError, urllib.error.URLError):
+            metrics = {}
+        busy = metrics.get("requests_processing")
+        if base_url not in self._slots_unavailable:
+            try:
+                busy = _busy_slots(json.loads(self._get(f"{base_url}/slots")))
+            except urllib.error.HTTPError:
+                self._slots_unavailable.add(base_url)
+            except (OSError, urllib.error.URLError, ValueError):
+                pass
+        return metrics, busy
+
+    def _sample(self):
+        now = time.monotonic()
+        deferred = busy = 0.0
+        kv = []
+        seen = False
+        for base_url in self.base_urls:
+            metrics, slots_busy = self._scrape(base_url)
+            if metrics or slots_busy is not None:
+                seen = True
+            deferred += metrics.get("requests_deferred", 0.0)
+            if "kv_cache_usage_ratio" in metrics:
+                kv.append(metrics["kv_cache_usage_ratio"])
+            busy += slots_busy or 0
+        if not seen:
+            return
+        self._samples["deferred"].append((now, deferred))
+        self._samples["busy"].append((now, busy))
+        if kv:
+            self._samples["kv_avg"].append((now, sum(kv) / len(kv)))
+            self._samples["kv_max"].append((now, max(kv)))
+
+    def stop(self):
+        if self._thread is None:
+            return self.fields
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._sample()
+
+        fields = {}
+        for prefix, avg_key, peak_key in (
+            ("deferred", "deferred", "deferred"),
+            ("kv_cache_usage", "kv_avg", "kv_max"),
+            ("busy_slots", "busy", "busy"),
+        ):
+            if self._samples[avg_key]:
+                fields[f"{prefix}_avg"] = _time_weighted(self._samples[avg_key])
+                fields[f"{prefix}_peak"] = max(v for _, v in self._samples[peak_key])
+        self.fields = fields
+        return fields
+
+
+# Lines written by ServerLogWatcher start with the seconds since launch.
+_LOG_STAMP_RE = re.compile(r"^\[\s*(\d+(?:\.\d+)?)\] ?(.*)$")
+_LOG_VALUE_RES = {
+    "model_mib": re.compile(r"model buffer size\s*=\s*([\d.]+) MiB"),
+    "kv_cache_mib": re.compile(r"KV buffer size\s*=\s*([\d.]+) MiB"),
+    "n_ctx": re.compile(r"\bn_ctx\s*=\s*(\d+)"),
+    "n_batch": re.compile(r"\bn_batch\s*=\s*(\d+)"),
+    "n_ubatch": re.compile(r"\bn_ubatch\s*=\s*(\d+)"),
+    "n_slots": re.compile(r"\bn_slots\s*=\s*(\d+)"),
+}
+_LOG_BATCH_RE = re.compile(r"decoding batch, n_tokens\s*=\s*(\d+)")
+_LOG_RELEASE_RE = re.compile(r"release: +id\b")
+_LOG_WARNING_RE = re.compile(r"\bwarn(ing)?\b", re.IGNORECASE)
+_LOG_ERROR_RE = re.compile(r"\berror\b|\bfailed\b", re.IGNORECASE)
+
+# Stats describing what the server loaded, taken from its startup lines.
+_LOG_LOAD_KEYS = (
+    "load_s",
+    "model_mib",
+    "kv_cache_mib",
+    "n_ctx",
+    "n_batch",
+    "n_ubatch",
+    "n_slots",
+)
+
+
+def parse_server_log(lines):
+    """Extract load, KV-cache, slot and batch stats from llama-server log lines.
+
+    Model and KV buffers are summed over devices; ``load_s`` is the launch
+    stamp of the ``model loaded`` line, when lines carry stamps.
+    ``slots_peak`` is the most tasks in flight at once, ``tasks`` the number
+    that finished. Unknown lines are ignored, so any llama.cpp version parses.
+    """
+    stats = {"tasks": 0, "warnings": 0, "errors": 0}
+    in_flight = 0
+    batch_tokens = []
+    for raw in lines:
+        match = _LOG_STAMP_RE.match(raw)
+        stamp, line = (float(match.group(1)), match.group(2)) if match else (None, raw)
+        for key, pattern in _LOG_VALUE_RES.items():
+            found = pattern.search(line)
+            if not found:
+                continue
+            value = float(found.group(1))
+            if key.endswith("_mib"):
+                stats[key] = stats.get(key, 0.0) + value
+            else:
+                stats.setdefault(key, int(value))
+        if "model loaded" in line and stamp is not None:
+            stats.setdefault("load_s", stamp)
+        if "launch_slot_" in line:
+            in_flight += 1
+            stats["slots_peak"] = max(stats.get("slots_peak", 0), in_flight)
+        elif _LOG_RELEASE_RE.search(line):
+            in_flight = max(0, in_flight - 1)
+        if "print_timing" in line:
+            stats["tasks"] += 1
+        found = _LOG_BATCH_RE.search(line)
+        if found:
+            batch_tokens.append(int(found.group(1)))
+        if _LOG_WARNING_RE.search(line):
+            stats["warnings"] += 1
+            stats["last_warning"] = line.strip()[:200]
+        elif _LOG_ERROR_RE.search(line):
+            stats["errors"] += 1
+    if batch_tokens:
+        stats["batch_tokens_avg"] = sum(batch_tokens) / len(batch_tokens)
+    return stats
+
+
+def _read_log_lines(path):
+    try:
+        with open(path, encoding="utf-8", errors="replace") as handle:
+            return handle.read().splitlines()
+    except OSError:
+        return []
+
+
+class ServerLogCollector:
+    """Capture every llama-server's log for one sweep cell and parse it.
+
+    While entered, each running server also writes its log to
+    ``<log_dir>/cell_NNNN/llama-server-<port>.log`` (capped by
+    ``LLAMA_SERVER_LOG_CELL_MAX_MB``). On exit :attr:`fields` holds the
+    :data:`SERVER_LOG_COLUMNS`: what each server loaded comes from its
+    startup lines (the largest instance wins), slot, batch and warning
+    counts from the cell's lines, summed over servers. ``server_log`` is the
+    cell directory relative to the CSV.
+    """
+
+    def __init__(self, log_dir):
+        self.log_dir = Path(log_dir)
+        self.cell_dir = None
+        self.fields = {}
+        self._servers = []
+
+    def __enter__(self):
+        self._servers = managed_server_logs()
+        if not self._servers:
+            return self
+        index = 1
+        while (self.log_dir / f"cell_{index:04d}").exists():
+            index += 1
+        self.cell_dir = self.log_dir / f"cell_{index:04d}"
+        for base_url, watcher in self._servers:
+            port = urllib.parse.urlsplit(base_url).port
+            watcher.begin_segment(self.cell_dir / f"llama-server-{port}.log")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._servers:
+            return
+        fields = {"server_log": f"{self.log_dir.name}/{self.cell_dir.name}"}
+        batch_sizes = []
+        for _, watcher in self._servers:
+            segment = watcher.end_segment()
+            startup = parse_server_log(watcher.startup)
+            cell = parse_server_log(_read_log_lines(segment.path) if segment else [])
+            for key in _LOG_LOAD_KEYS:
+                if key in startup:
+                    column = f"log_{key}"
+                    fields[column] = max(fields.get(column, startup[key]), startup[key])
+            for key in ("tasks", "slots_peak", "warnings", "errors"):
+                fields[f"log_{key}"] = fields.get(f"log_{key}", 0) + cell.get(key, 0)
+            if "batch_tokens_avg" in cell:
+                batch_sizes.append(cell["batch_tokens_avg"])
+            if "last_warning" in cell:
+                fields["log_last_warning"] = cell["last_warning"]
+        if batch_sizes:
+            fields["log_batch_tokens_avg"] = sum(batch_sizes) / len(batch_sizes)
+        self.fields = fields
+
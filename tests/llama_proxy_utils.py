@@ -0,0 +1,693 @@
+"""In-process asyncio reverse proxy that can stand in for the nginx front end."""
+import asyncio
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+import zlib
+
+from tests.llama_server_test_utils import (
+    DEFAULT_HOST,
+    reload_nginx_round_robin,
+    resolve_lb_strategy,
+    start_nginx_round_robin,
+)
+from tests.llama_stats_utils import LatencyHistogram, percentile_columns
+
+PROXY_KINDS = ("nginx", "python")
+
+PROXY_COLUMNS = [
+    "proxy_requests_min",
+    "proxy_requests_max",
+    "proxy_errors",
+    "proxy_queue_ms_avg",
+    "proxy_queue_ms_p99",
+    "proxy_queue_ms_max",
+]
+
+_OVERHEAD_PERCENTILES = percentile_columns("latency_ms") + percentile_columns("ttft_ms")
+
+# Proxied minus direct, so the proxy's cost shows up as a negative throughput
+# delta and positive latency deltas.
+PROXY_OVERHEAD_COLUMNS = [
+    "direct_throughput_tps",
+    "direct_errors",
+    "proxy_tps_delta",
+    "proxy_tps_delta_pct",
+] + [f"proxy_{column}_delta" for column in _OVERHEAD_PERCENTILES]
+
+# Hop-by-hop headers are rewritten per connection rather than forwarded.
+_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection"}
+
+_active_proxies = []
+_active_proxies_lock = threading.Lock()
+
+
+def proxy_overhead_enabled():
+    return os.environ.get("LLAMA_PROXY_OVERHEAD", "0").lower() in {"1", "true", "yes"}
+
+
+def direct_base_urls(upstreams):
+    """Backend base URLs, for load that bypasses the proxy."""
+    return [f"http://{host}:{port}" for host, port in upstreams]
+
+
+def proxy_overhead_fields(proxied, direct):
+    """:data:`PROXY_OVERHEAD_COLUMNS` for a cell run through the proxy and direct."""
+    fields = {
+        "direct_throughput_tps": direct["throughput"],
+        "direct_errors": direct["errors"],
+        "proxy_tps_delta": proxied["throughput"] - direct["throughput"],
+        "proxy_tps_delta_pct": (
+            (proxied["throughput"] - direct["throughput"]) / direct["throughput"] * 100.0
+            if direct["throughput"]
+            else None
+        ),
+    }
+    for column in _OVERHEAD_PERCENTILES:
+        via, bypass = proxied.get(column), direct.get(column)
+        fields[f"proxy_{column}_delta"] = (
+            via - bypass if via is not None and bypass is not None else None
+        )
+    return fields
+
+
+def format_overhead_summary(fields):
+    """One-line ``tps_delta=... latency_ms_p50_delta=...`` summary."""
+    parts = []
+    for column in PROXY_OVERHEAD_COLUMNS[2:]:
+        value = fields.get(column)
+        if value is not None:
+            parts.append(f"{column[len('proxy_'):]}={value:.1f}")
+    return " ".join(parts)
+
+
+def resolve_proxy_kind():
+    kind = os.environ.get("LLAMA_PROXY", "nginx").strip().lower() or "nginx"
+    if kind not in PROXY_KINDS:
+        raise ValueError(
+            f"Unknown LLAMA_PROXY={kind!r}; expected one of {', '.join(PROXY_KINDS)}"
+        )
+    return kind
+
+
+class ProxyRequest:
+    def __init__(self, method, target, headers, body):
+        self.method = method
+        self.target = target
+        self.headers = headers
+        self.body = body
+
+
+class RoundRobinPolicy:
+    def __init__(self):
+        self._next = 0
+
+    def choose(self, upstreams, request):
+        upstream = upstreams[self._next % len(upstreams)]
+        self._next += 1
+        return upstream
+
+
+class LeastConnPolicy(RoundRobinPolicy):
+    def choose(self, upstreams, request):
+        # Rotate the start so ties are spread like round-robin.
+        start = self._next % len(upstreams)
+        self._next += 1
+        ordered = upstreams[start:] + upstreams[:start]
+        return min(ordered, key=lambda upstream: upstream.active)
+
+
+class RandomTwoPolicy:
+    def __init__(self, seed=None):
+        self._rng = random.Random(seed)
+
+    def choose(self, upstreams, request):
+        if len(upstreams) == 1:
+            return upstreams[0]
+        first, second = self._rng.sample(upstreams, 2)
+        return first if first.active <= second.active else second
+
+
+class _HashPolicy:
+    """Rendezvous hashing, so keys only move when their upstream goes away.
+
+    *key* maps a :class:`ProxyRequest` to the string that is hashed.
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def choose(self, upstreams, request):
+        key = self.key(request)
+        return max(
+            upstreams,
+            key=lambda upstream: zlib.crc32(f"{key}|{upstream.name}".encode("utf-8")),
+        )
+
+
+class HashHeaderPolicy(_HashPolicy):
+    def __init__(self, header="X-Session-Id"):
+        self.header = header.lower()
+        super().__init__(self._header_key)
+
+    def _header_key(self, request):
+        return request.headers.get(self.header, "")
+
+
+class HashPrefixPolicy(_HashPolicy):
+    def __init__(self, chars=256):
+        self.chars = chars
+        super().__init__(self._prefix_key)
+
+    def _prefix_key(self, request):
+        try:
+            prompt = json.loads(request.body).get("prompt", "")
+        except (ValueError, AttributeError):
+            return ""
+        return prompt[: self.chars] if isinstance(prompt, str) else ""
+
+
+def make_policy(strategy=None):
+    """Build the balancing policy for one of ``LB_STRATEGIES``.
+
+    Hash policies read ``LLAMA_LB_HASH_HEADER`` and
+    ``LLAMA_LB_HASH_PREFIX_CHARS`` like the nginx config does.
+    """
+    strategy = resolve_lb_strategy(strategy)
+    if strategy == "least_conn":
+        return LeastConnPolicy()
+    if strategy == "random_two":
+        return RandomTwoPolicy()
+    if strategy == "hash_header":
+        return HashHeaderPolicy(os.environ.get("LLAMA_LB_HASH_HEADER", "X-Session-Id"))
+    if strategy == "hash_prefix":
+        return HashPrefixPolicy(int(os.environ.get("LLAMA_LB_HASH_PREFIX_CHARS", "256")))
+    return RoundRobinPolicy()
+
+
+class _Upstream:
+    """One backend with its idle keep-alive connections and counters."""
+
+    def __init__(self, host, port, max_connections=0):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.active = 0
+        self.requests = 0
+        self.errors = 0
+        self.queue_ms_total = 0.0
+        self.queue_ms_max = 0.0
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections) if max_connections > 0 else None
+
+    async def acquire(self, fresh=False):
+        if self._slots is not None:
+            await self._slots.acquire()
+        try:
+            if fresh:
+                self.close_idle()
+            while self._idle:
+                reader, writer = self._idle.pop()
+                # A backend that closed (or restarted) leaves the socket
+                # half-open with EOF already buffered.
+                if not writer.is_closing() and not reader.at_eof():
+                    return reader, writer, True
+                writer.close()
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            return reader, writer, False
+        except BaseException:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+
+    def release(self, reader, writer, reusable):
+        if reusable and not writer.is_closing():
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        if self._slots is not None:
+            self._slots.release()
+
+    def close_idle(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+def _parse_headers(lines):
+    headers = {}
+    for line in lines:
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def _error_response(status, reason):
+    body = f"{status} {reason}\n".encode("ascii")
+    return (
+        f"HTTP/1.1 {status} {reason}\r\n"
+        "Content-Type: text/plain\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n"
+        "\r\n"
+    ).encode("ascii") + body
+
+
+class PythonProxy:
+    """Threaded asyncio HTTP/1.1 reverse proxy with pluggable balancing.
+
+    Client connections are kept alive and each request is forwarded to the
+    upstream picked by ``policy`` (any object with ``choose(upstreams,
+    request)``) over a pooled keep-alive connection; streamed responses are
+    relayed chunk by chunk. ``max_connections`` caps the connections per
+    upstream (0 = unlimited), so excess requests queue in the proxy.
+
+    Per upstream it counts requests, errors and queue time, i.e. the time
+    from a request being read to it being written upstream (connection wait
+    and connect included). :meth:`stats` returns the totals; observers added
+    with :meth:`add_observer` see every request as it completes.
+    """
+
+    def __init__(
+        self, upstreams, listen_host, listen_port, policy=None, max_connections=0
+    ):
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.policy = policy if policy is not None else RoundRobinPolicy()
+        self.max_connections = max_connections
+        self._initial_upstreams = list(upstreams)
+        self._upstreams = []
+        self._observers = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._clients = {}
+
+    def start(self):
+        started = threading.Event()
+        failure = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._loop = loop
+            try:
+                self._set_upstreams(self._initial_upstreams)
+                self._server = loop.run_until_complete(
+                    asyncio.start_server(
+                        self._serve_client,
+                        self.listen_host,
+                        self.listen_port,
+                        reuse_address=True,
+                        backlog=4096,
+                    )
+                )
+            except BaseException as exc:
+                failure.append(exc)
+                started.set()
+                loop.close()
+                return
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                loop.run_until_complete(self._shutdown())
+                loop.close()
+
+        self._thread = threading.Thread(target=run, name="llama-proxy", daemon=True)
+        self._thread.start()
+        started.wait()
+        if failure:
+            self._thread.join()
+            raise failure[0]
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    async def _shutdown(self):
+        self._server.close()
+        tasks = list(self._clients.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for upstream in self._upstreams:
+            upstream.close_idle()
+        await self._server.wait_closed()
+
+    def set_upstreams(self, upstreams):
+        """Swap the backend set; counters of backends that stay are kept."""
+        future = asyncio.run_coroutine_threadsafe(
+            self._async_set_upstreams(list(upstreams)), self._loop
+        )
+        future.result()
+
+    async def _async_set_upstreams(self, upstreams):
+        self._set_upstreams(upstreams)
+
+    def _set_upstreams(self, upstreams):
+        if not upstreams:
+            raise ValueError("proxy needs at least one upstream")
+        existing = {(up.host, up.port): up for up in self._upstreams}
+        updated = []
+        for host, port in upstreams:
+            upstream = existing.pop((host, port), None)
+            if upstream is None:
+                upstream = _Upstream(host, port, self.max_connections)
+            updated.append(upstream)
+        for upstream in existing.values():
+            upstream.close_idle()
+        self._upstreams = updated
+
+    def close_idle(self):
+        """Drop pooled upstream connections, e.g. after the backends restarted."""
+        future = asyncio.run_coroutine_threadsafe(self._async_close_idle(), self._loop)
+        future.result()
+
+    async def _async_close_idle(self):
+        for upstream in self._upstreams:
+            upstream.close_idle()
+
+    def add_observer(self, callback):
+        """Call ``callback(upstream_name, queue_ms, ok)`` after each request."""
+        with self._lock:
+            self._observers.append(callback)
+
+    def remove_observer(self, callback):
+        with self._lock:
+            if callback in self._observers:
+                self._observers.remove(callback)
+
+    def stats(self):
+        """Per-upstream ``requests``, ``errors``, ``active`` and queue times."""
+        stats = {}
+        with self._lock:
+            for upstream in self._upstreams:
+                stats[upstream.name] = {
+                    "requests": upstream.requests,
+                    "errors": upstream.errors,
+                    "active": upstream.active,
+                    "queue_ms_avg": (
+                        upstream.queue_ms_total / upstream.requests
+                        if upstream.requests
+                        else None
+                    ),
+                    "queue_ms_max": upstream.queue_ms_max,
+                }
+        return stats
+
+    def _record(self, upstream, queue_ms, ok):
+        with self._lock:
+            upstream.requests += 1
+            upstream.errors += not ok
+            if queue_ms is not None:
+                upstream.queue_ms_total += queue_ms
+                upstream.queue_ms_max = max(upstream.queue_ms_max, queue_ms)
+            observers = list(self._observers)
+        for callback in observers:
+            callback(upstream.name, queue_ms, ok)
+
+    async def _serve_client(self, reader, writer):
+        self._clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError):
+                    break
+                received = time.perf_counter()
+                lines = head.split(b"\r\n")[:-2]
+                method, target, version = lines[0].decode("latin-1").split(" ", 2)
+                headers = _parse_headers(lines[1:])
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    writer.write(_error_response(411, "Length Required"))
+                    await writer.drain()
+                    break
+                length = int(headers.get("content-length") or 0)
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and (
+                    headers.get("connection", "").lower() != "close"
+                )
+                request = ProxyRequest(method, target, headers, body)
+                raw_headers = [
+                    line
+                    for line in lines[1:]
+                    if line.split(b":", 1)[0].strip().lower().decode("latin-1")
+                    not in _HOP_HEADERS
+                ]
+                upstream_request = (
+                    f"{method} {target} HTTP/1.1\r\n".encode("latin-1")
+                    + b"".join(line + b"\r\n" for line in raw_headers)
+                    + b"Connection: keep-alive\r\n\r\n"
+                    + body
+                )
+                if not await self._forward(request, upstream_request, writer, received):
+                    break
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        except asyncio.CancelledError:
+            # Proxy shutdown; finish quietly so the stream callback does not
+            # log the cancellation.
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    async def _forward(self, request, upstream_request, client, received):
+        """Relay one request; return False when the client socket must close."""
+        upstream = self.policy.choose(self._upstreams, request)
+        upstream.active += 1
+        queue_ms = None
+        responded = False
+        try:
+            # An idle pooled connection may have been closed by the backend.
+            # Then the others likely were too (it restarted), so drop them
+            # all and retry once on a fresh connection.
+            for attempt in range(2):
+                reader, writer, reused = await upstream.acquire(fresh=attempt > 0)
+                queue_ms = (time.perf_counter() - received) * 1000.0
+                try:
+                    writer.write(upstream_request)
+                    await writer.drain()
+                    status_line = await reader.readline()
+                    if not status_line:
+                        raise ConnectionResetError("upstream closed the connection")
+                except (ConnectionError, OSError):
+                    upstream.release(reader, writer, False)
+                    if reused:
+                        continue
+                    raise
+                break
+            try:
+                responded = True
+                status, reusable, client_keep = await self._relay_response(
+                    request, status_line, reader, client
+                )
+            except BaseException:
+                upstream.release(reader, writer, False)
+                raise
+            upstream.release(reader, writer, reusable)
+        except (asyncio.IncompleteReadError, OSError, ValueError):
+            self._record(upstream, queue_ms, False)
+            if not responded:
+                client.write(_error_response(502, "Bad Gateway"))
+                with contextlib.suppress(OSError):
+                    await client.drain()
+            return False
+        finally:
+            upstream.active -= 1
+        # A relayed 5xx still means the backend failed the request.
+        self._record(upstream, queue_ms, status < 500)
+        return client_keep
+
+    async def _relay_response(self, request, status_line, upstream, client):
+        """Copy one response to *client*.
+
+        Returns ``(status, upstream_reusable, client_keep)``.
+        """
+        head = [status_line]
+        while True:
+            line = await upstream.readline()
+            head.append(line)
+            if line in (b"\r\n", b"\n", b""):
+                break
+        headers = _parse_headers(line.rstrip(b"\r\n") for line in head[1:-1])
+        client.write(b"".join(head))
+        status = int(status_line.split(b" ", 2)[1])
+        reusable = headers.get("connection", "").lower() != "close"
+
+        if request.method == "HEAD" or status in (204, 304) or status < 200:
+            pass
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                size_line = await upstream.readline()
+                client.write(size_line)
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    while True:
+                        trailer = await upstream.readline()
+                        client.write(trailer)
+                        if trailer in (b"\r\n", b"\n", b""):
+                            break
+                    break
+                client.write(await upstream.readexactly(size + 2))
+                # Flush each chunk so streamed tokens are not held back.
+                await client.drain()
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining:
+                chunk = await upstream.read(min(remaining, 65536))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                client.write(chunk)
+                remaining -= len(chunk)
+                await client.drain()
+        else:
+            # Body runs to EOF; the client has to see the close too.
+            while True:
+                chunk = await upstream.read(65536)
+                if not chunk:
+                    break
+                client.write(chunk)
+                await client.drain()
+            await client.drain()
+            return status, False, False
+        await client.drain()
+        return status, reusable, True
+
+
+def active_python_proxies():
+    with _active_proxies_lock:
+        return list(_active_proxies)
+
+
+@contextlib.contextmanager
+def start_python_round_robin(upstreams, listen_port, listen_host=None, strategy=None):
+    """In-process replacement for :func:`start_nginx_round_robin`.
+
+    ``strategy`` is a ``LB_STRATEGIES`` name (default ``LLAMA_LB_STRATEGY``)
+    or a policy object. ``LLAMA_PROXY_UPSTREAM_CONNECTIONS`` caps the pooled
+    connections per upstream (default 0, unlimited). The yielded dict has
+    the nginx keys plus ``balancer``, the running :class:`PythonProxy`.
+    """
+    if listen_host is None:
+        listen_host = DEFAULT_HOST
+    if strategy is None or isinstance(strategy, str):
+        strategy = resolve_lb_strategy(strategy)
+        policy = make_policy(strategy)
+    else:
+        policy, strategy = strategy, type(strategy).__name__
+    max_connections = int(os.environ.get("LLAMA_PROXY_UPSTREAM_CONNECTIONS", "0"))
+    balancer = PythonProxy(
+        upstreams, listen_host, listen_port, policy, max_connections
+    ).start()
+    with _active_proxies_lock:
+        _active_proxies.append(balancer)
+    try:
+        yield {
+            "host": listen_host,
+            "port": listen_port,
+            "base_url": f"http://{listen_host}:{listen_port}",
+            "process": None,
+            "upstreams": list(upstreams),
+            "strategy": strategy,
+            "kind": "python",
+            "balancer": balancer,
+        }
+    finally:
+        with _active_proxies_lock:
+            _active_proxies.remove(balancer)
+        balancer.stop()
+
+
+def start_round_robin_proxy(
+    upstreams, listen_port, listen_host=None, strategy=None, tuning=None
+):
+    """Start the front end selected by ``LLAMA_PROXY`` (``nginx`` or ``python``).
+
+    ``tuning`` (see :func:`nginx_tuning`) only applies to nginx.
+    """
+    if resolve_proxy_kind() == "python":
+        return start_python_round_robin(upstreams, listen_port, listen_host, strategy)
+    return start_nginx_round_robin(upstreams, listen_port, listen_host, strategy, tuning)
+
+
+def reload_round_robin_proxy(proxy, upstreams, tuning=None, relaunched=False):
+    """Point a running proxy from :func:`start_round_robin_proxy` at *upstreams*.
+
+    Pass ``relaunched=True`` when servers were restarted on the same ports so
+    the Python proxy drops its keep-alive connections to the old processes
+    (nginx already evicts pooled connections that the backend closed).
+    """
+    if proxy.get("kind") != "python":
+        return reload_nginx_round_robin(proxy, upstreams, tuning=tuning)
+    upstreams = list(upstreams)
+    if upstreams != proxy["upstreams"]:
+        proxy["balancer"].set_upstreams(upstreams)
+        proxy["upstreams"] = upstreams
+    if relaunched:
+        proxy["balancer"].close_idle()
+    return proxy
+
+
+class ProxyStatsCollector:
+    """Per-cell request spread and queue time of the running Python proxies.
+
+    Use as a context manager around one sweep cell, like the monitors in
+    ``llama_monitor_utils``; :attr:`fields` then holds the
+    :data:`PROXY_COLUMNS` values and :attr:`upstreams` the per-upstream
+    request counts. Fields stay empty when no Python proxy is running.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.upstreams = {}
+        self._proxies = []
+        self._lock = threading.Lock()
+        self._errors = 0
+        self._queue = LatencyHistogram()
+
+    def __enter__(self):
+        self._proxies = active_python_proxies()
+        for balancer in self._proxies:
+            for name in balancer.stats():
+                self.upstreams.setdefault(name, 0)
+            balancer.add_observer(self._observe)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for balancer in self._proxies:
+            balancer.remove_observer(self._observe)
+        if not self.upstreams:
+            return
+        counts = list(self.upstreams.values())
+        self.fields = {
+            "proxy_requests_min": min(counts),
+            "proxy_requests_max": max(counts),
+            "proxy_errors": self._errors,
+            "proxy_queue_ms_avg": self._queue.mean,
+            "proxy_queue_ms_p99": self._queue.percentile(99),
+            "proxy_queue_ms_max": self._queue.max,
+        }
+
+    def _observe(self, name, queue_ms, ok):
+        with self._lock:
+            self.upstreams[name] = self.upstreams.get(name, 0) + 1
+            self._errors += not ok
+            self._queue.record(queue_ms)
+
+    def summary(self):
+        """``host:port=requests`` for each upstream, for progress output."""
+        return " ".join(
+            f"{name}={count}" for name, count in sorted(self.upstreams.items())
+        )
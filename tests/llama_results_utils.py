@@ -0,0 +1,537 @@
+"""Cross-run results store: columnar files per run plus a sqlite index."""
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from tests.llama_server_test_utils import REPO_ROOT, resolve_model_path
+from tests.llama_sweep_utils import config_hash
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Optional: without pyarrow, runs are stored as gzipped column JSON.
+    pa = pq = None
+
+# Constant per run, added to every stored row.
+RUN_TAG_COLUMNS = ["run_id", "run_kind", "git_sha", "model_hash", "host"]
+
+# Row fields copied into real ``rows`` columns (with their SQL type), so
+# sorting and filtering on them can use an index instead of parsing JSON.
+INDEXED_COLUMNS = {
+    "throughput_tps": "REAL",
+    "errors": "INTEGER",
+    "concurrency": "INTEGER",
+    "parallel": "INTEGER",
+    "instances": "INTEGER",
+}
+
+# Bytes hashed from each end of the model file; multi-GB GGUFs stay cheap.
+_MODEL_HASH_SAMPLE_BYTES = 4 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started TEXT NOT NULL,
+    finished TEXT,
+    pid INTEGER,
+    host TEXT,
+    host_info TEXT,
+    git_sha TEXT,
+    model_path TEXT,
+    model_hash TEXT,
+    config_hash TEXT,
+    config TEXT,
+    results_csv TEXT,
+    data_path TEXT,
+    row_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_kind_started ON runs (kind, started);
+CREATE INDEX IF NOT EXISTS runs_model_hash ON runs (model_hash);
+CREATE INDEX IF NOT EXISTS runs_config_hash ON runs (config_hash);
+CREATE TABLE IF NOT EXISTS rows (
+    run_id TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (run_id, row_index)
+);
+CREATE TABLE IF NOT EXISTS model_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+"""
+
+
+def results_store_enabled():
+    return os.environ.get("LLAMA_RESULTS_STORE", "1").lower() not in {
+        "0",
+        "false",
+        "no",
+    }
+
+
+def results_store_dir():
+    default = Path(os.environ.get("LLAMA_RESULTS_DIR", "results")) / "store"
+    return Path(os.environ.get("LLAMA_RESULTS_STORE_DIR") or default).expanduser()
+
+
+def columnar_format():
+    """``parquet`` when pyarrow is installed, else gzipped column JSON."""
+    return "parquet" if pq is not None else "json.gz"
+
+
+def git_revision():
+    """Return the harness checkout's HEAD sha (``-dirty`` if modified), or ""."""
+    try:
+        sha = subprocess.run(
+            ["git", "-C", str(REPO_ROOT), "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=10,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "-C", str(REPO_ROOT), "diff", "--quiet", "HEAD", "--"],
+            capture_output=True,
+            timeout=30,
+        ).returncode
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return f"{sha}-dirty" if dirty == 1 else sha
+
+
+def model_fingerprint(path):
+    """sha256 over the size and the first and last 4 MiB of the model file."""
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode("ascii"))
+    with open(path, "rb") as handle:
+        digest.update(handle.read(_MODEL_HASH_SAMPLE_BYTES))
+        if size > 2 * _MODEL_HASH_SAMPLE_BYTES:
+            handle.seek(size - _MODEL_HASH_SAMPLE_BYTES)
+            digest.update(handle.read(_MODEL_HASH_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def _mem_total_mb():
+    try:
+        with open("/proc/meminfo", encoding="ascii") as handle:
+            for line in handle:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def host_info():
+    return {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "mem_total_mb": _mem_total_mb(),
+        "python": platform.python_version(),
+    }
+
+
+def harness_env():
+    """The ``LLAMA_*`` / ``NGINX_*`` variables, i.e. the harness configuration."""
+    return {
+        key: value
+        for key, value in sorted(os.environ.items())
+        if key.startswith(("LLAMA_", "NGINX_"))
+    }
+
+
+def _coerce(value):
+    """Turn a formatted CSV cell back into a number where it is one."""
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class ResultsIndex:
+    """The sqlite index of every stored run and row.
+
+    ``runs`` holds one line per run with its tags and config; ``rows`` every
+    row as JSON, with the :data:`INDEXED_COLUMNS` also stored as indexed
+    columns for the common queries. Safe to share between processes.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root is not None else results_store_dir()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.path = self.root / "index.sqlite"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.executescript(_SCHEMA)
+            self._add_indexed_columns()
+
+    def _add_indexed_columns(self):
+        # Also upgrades stores created before a column was indexed.
+        present = {row["name"] for row in self._db.execute("PRAGMA table_info(rows)")}
+        for column, sql_type in INDEXED_COLUMNS.items():
+            if column not in present:
+                self._db.execute(f"ALTER TABLE rows ADD COLUMN {column} {sql_type}")
+                self._db.execute(
+                    f"UPDATE rows SET {column} = json_extract(data, ?)",
+                    (f'$."{column}"',),
+                )
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS rows_{column} ON rows ({column})"
+            )
+
+    def close(self):
+        self._db.close()
+
+    def execute(self, sql, params=()):
+        with self._lock, self._db:
+            return self._db.execute(sql, params).fetchall()
+
+    def execute_all(self, statements):
+        """Run ``(sql, params)`` pairs in a single transaction."""
+        with self._lock, self._db:
+            for sql, params in statements:
+                self._db.execute(sql, params)
+
+    def cached_model_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        rows = self.execute(
+            "SELECT hash FROM model_hashes"
+            " WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns),
+        )
+        if rows:
+            return rows[0]["hash"]
+        digest = model_fingerprint(path)
+        self.execute(
+            "INSERT OR REPLACE INTO model_hashes VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, digest),
+        )
+        return digest
+
+    def runs(self, kind=None, run=None, model=None, since=None, limit=None):
+        """Return run records, newest first, filtered by the given prefixes."""
+        clauses, params = self._run_clauses(kind, run, model, since)
+        sql = "SELECT * FROM runs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY started DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self.execute(sql, params)]
+
+    @staticmethod
+    def _run_clauses(kind, run, model, since, prefix=""):
+        clauses, params = [], []
+        if kind:
+            clauses.append(f"{prefix}kind = ?")
+            params.append(kind)
+        if run:
+            clauses.append(f"{prefix}run_id LIKE ?")
+            params.append(f"{run}%")
+        if model:
+            clauses.append(f"{prefix}model_hash LIKE ?")
+            params.append(f"{model}%")
+        if since:
+            clauses.append(f"{prefix}started >= ?")
+            params.append(since)
+        return clauses, params
+
+    def query_rows(
+        self,
+        sort_field="throughput_tps",
+        reverse=True,
+        count=None,
+        kind=None,
+        run=None,
+        model=None,
+        since=None,
+        where=None,
+    ):
+        """Return rows across runs as dicts, sorted by *sort_field*.
+
+        *where* maps column names to required values. Indexed columns are
+        compared as numbers, anything else as text.
+        """
+        params = []
+        if sort_field in INDEXED_COLUMNS:
+            sort = f"rows.{sort_field}"
+        else:
+            sort = "json_extract(rows.data, ?)"
+            params.append(f'$."{sort_field}"')
+        sql = f"SELECT rows.data, {sort} AS sort_value FROM rows JOIN runs USING (run_id)"
+        clauses, run_params = self._run_clauses(kind, run, model, since, "runs.")
+        params += run_params
+        for column, value in (where or {}).items():
+            if column in INDEXED_COLUMNS:
+                clauses.append(f"rows.{column} = ?")
+                params.append(_coerce(value))
+            else:
+                clauses.append("CAST(json_extract(rows.data, ?) AS TEXT) = ?")
+                params += [f'$."{column}"', str(value)]
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        # NULLs last either way.
+        direction = "DESC" if reverse else "ASC"
+        sql += f" ORDER BY sort_value IS NULL, sort_value {direction}"
+        if count:
+            sql += f" LIMIT {int(count)}"
+        return [json.loads(row["data"]) for row in self.execute(sql, params)]
+
+    def finalize_stale(self):
+        """Write out runs on this host whose process died before finishing."""
+        host = platform.node()
+        for record in self.execute(
+            "SELECT run_id, pid FROM runs WHERE status = 'running' AND host = ?",
+            (host,),
+        ):
+            if record["pid"] != os.getpid() and not _pid_alive(record["pid"]):
+                ResultsRun(self, record["run_id"]).close(status="interrupted")
+
+
+class ResultsRun:
+    """Rows of one sweep or benchmark run, recorded as they are written.
+
+    :meth:`append` indexes each row right away, so a crash loses nothing;
+    :meth:`close` (also run at exit) writes the run's columnar file:
+    ``runs/kind=<kind>/<run_id>.parquet`` with pyarrow, otherwise
+    ``<run_id>.json.gz`` holding ``{"metadata": ..., "columns": {...}}``.
+    """
+
+    def __init__(self, index, run_id, header=None, tags=None):
+        self.index = index
+        self.run_id = run_id
+        self.header = list(header or [])
+        self.tags = tags or {}
+        self._rows = 0
+        self._closed = False
+
+    @classmethod
+    def start(cls, kind, header, results_path=None, config=None, index=None):
+        """Register a new run and return it, tagged with the current setup."""
+        index = index or ResultsIndex()
+        index.finalize_stale()
+        run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        model_path = resolve_model_path()
+        model_hash = ""
+        if model_path and os.path.isfile(model_path):
+            model_hash = index.cached_model_hash(model_path)
+        info = host_info()
+        full_config = {"env": harness_env(), **(config or {})}
+        tags = {
+            "run_id": run_id,
+            "run_kind": kind,
+            "git_sha": git_revision(),
+            "model_hash": model_hash,
+            "host": info["hostname"],
+        }
+        index.execute(
+            "INSERT INTO runs (run_id, kind, status, started, pid, host, host_info,"
+            " git_sha, model_path, model_hash, config_hash, config, results_csv)"
+            " VALUES (?, ?, 'running', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                kind,
+                time.strftime("%Y-%m-%dT%H:%M:%S"),
+                os.getpid(),
+                info["hostname"],
+                json.dumps(info),
+                tags["git_sha"],
+                model_path,
+                model_hash,
+                config_hash(full_config),
+                json.dumps(full_config, default=str),
+                str(results_path) if results_path else None,
+            ),
+        )
+        run = cls(index, run_id, header, tags)
+        atexit.register(run.close)
+        return run
+
+    def append(self, values):
+        """Record one row, given as a dict or as values matching the header."""
+        if not isinstance(values, dict):
+            values = dict(zip(self.header, values))
+        row = dict(self.tags)
+        row.update((key, _coerce(value)) for key, value in values.items())
+        indexed = [
+            row.get(column) if isinstance(row.get(column), (int, float)) else None
+            for column in INDEXED_COLUMNS
+        ]
+        # The row and the live row count share one transaction (one fsync).
+        self.index.execute_all(
+            [
+                (
+                    f"INSERT INTO rows (run_id, row_index, data,"
+                    f" {', '.join(INDEXED_COLUMNS)})"
+                    f" VALUES (?, ?, ?{', ?' * len(INDEXED_COLUMNS)})",
+                    (self.run_id, self._rows, json.dumps(row, default=str), *indexed),
+                ),
+                (
+                    "UPDATE runs SET row_count = ? WHERE run_id = ?",
+                    (self._rows + 1, self.run_id),
+                ),
+            ]
+        )
+        self._rows += 1
+
+    def tee(self, writer):
+        """Wrap a ``csv.writer`` so every row written is also recorded here."""
+        return _TeeWriter(writer, self)
+
+    def close(self, status="finished"):
+        if self._closed:
+            return
+        self._closed = True
+        records = self.index.runs(run=self.run_id)
+        if not records:
+            return
+        record = records[0]
+        rows = [
+            json.loads(row["data"])
+            for row in self.index.execute(
+                "SELECT data FROM rows WHERE run_id = ? ORDER BY row_index",
+                (self.run_id,),
+            )
+        ]
+        data_path = None
+        if rows:
+            metadata = {
+                key: record[key]
+                for key in (
+                    "run_id",
+                    "kind",
+                    "started",
+                    "host_info",
+                    "git_sha",
+                    "model_path",
+                    "model_hash",
+                    "config",
+                    "results_csv",
+                )
+            }
+            directory = self.index.root / "runs" / f"kind={record['kind']}"
+            data_path = _write_columnar(directory / self.run_id, rows, metadata)
+        self.index.execute(
+            "UPDATE runs SET status = ?, finished = ?, data_path = ?, row_count = ?"
+            " WHERE run_id = ?",
+            (
+                status,
+                time.strftime("%Y-%m-%dT%H:%M:%S"),
+                str(data_path) if data_path else None,
+                len(rows),
+                self.run_id,
+            ),
+        )
+
+
+class _TeeWriter:
+    """``csv.writer`` proxy; a failing store is dropped so the CSV carries on."""
+
+    def __init__(self, writer, run):
+        self._writer = writer
+        self._run = run
+
+    def writerow(self, row):
+        result = self._writer.writerow(row)
+        if self._run is not None:
+            try:
+                self._run.append(row)
+            except (OSError, sqlite3.Error) as exc:
+                print(
+                    f"warning results store disabled for run {self._run.run_id}: {exc}",
+                    file=sys.stderr,
+                )
+                # Skip the exit-time close; the next run marks it interrupted.
+                self._run._closed = True
+                self._run = None
+        return result
+
+
+def _columns(rows):
+    """Column name -> values, in first-seen order, with one type per column."""
+    names = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        present = [value for value in values if value is not None]
+        if not all(isinstance(value, (int, float)) for value in present):
+            values = [None if value is None else str(value) for value in values]
+        elif not all(isinstance(value, int) for value in present):
+            values = [None if value is None else float(value) for value in values]
+        columns[name] = values
+    return columns
+
+
+def _write_columnar(stem, rows, metadata):
+    stem.parent.mkdir(parents=True, exist_ok=True)
+    columns = _columns(rows)
+    if pq is not None:
+        path = stem.with_suffix(".parquet")
+        table = pa.table(columns).replace_schema_metadata(
+            {"llama_run": json.dumps(metadata, default=str)}
+        )
+        pq.write_table(table, path, compression="zstd")
+        return path
+    path = stem.with_suffix(".json.gz")
+    with gzip.open(path, "wt", encoding="utf-8") as handle:
+        json.dump({"metadata": metadata, "columns": columns}, handle, default=str)
+    return path
+
+
+def tee_results_store(writer, kind, header, results_path=None, config=None):
+    """Also record the rows written to *writer* in the results store.
+
+    Returns *writer* unchanged when ``LLAMA_RESULTS_STORE`` is off or the
+    store can't be opened (with a note on stderr), so results still reach
+    the CSV.
+    """
+    if not results_store_enabled():
+        return writer
+    try:
+        run = ResultsRun.start(kind, header, results_path, config)
+    except (OSError, sqlite3.Error) as exc:
+        print(f"warning results store disabled: {exc}", file=sys.stderr)
+        return writer
+    print(f"results_store={run.index.root} run_id={run.run_id}")
+    return run.tee(writer)
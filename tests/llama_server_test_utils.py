@@ -1,20 +1,84 @@
+import atexit
+import collections
 import contextlib
+import http.client
 import json
 import os
 import shlex
 import shutil
+import signal
 import socket
 import subprocess
 import tempfile
+import threading
 import time
 import urllib.error
+import urllib.parse
 import urllib.request
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
 from pathlib import Path
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 8080
 
+# pid -> (role, base_url, process) for every llama-server / nginx process
+# started by this module, so monitors can find them without threading handles
+# through the sweeps.
+_managed_processes = {}
+_managed_processes_lock = threading.Lock()
+# pid -> (base_url, ServerLogWatcher) for the running llama-servers.
+_server_logs = {}
+
+
+def _register_process(role, process, base_url=None, log_watcher=None):
+    with _managed_processes_lock:
+        _managed_processes[process.pid] = (role, base_url, process)
+        if log_watcher is not None:
+            _server_logs[process.pid] = (base_url, log_watcher)
+
+
+def _unregister_process(process):
+    with _managed_processes_lock:
+        _managed_processes.pop(process.pid, None)
+        _server_logs.pop(process.pid, None)
+
+
+def managed_processes():
+    """Return ``[(role, pid), ...]`` for the servers and proxies running now."""
+    with _managed_processes_lock:
+        return [(role, pid) for pid, (role, _, _) in _managed_processes.items()]
+
+
+def managed_server_urls():
+    """Return the base URLs of the llama-server instances running now."""
+    with _managed_processes_lock:
+        return sorted(
+            url
+            for role, url, _ in _managed_processes.values()
+            if role == "llama-server" and url
+        )
+
+
+def _terminate_managed_servers(ports):
+    """Send SIGTERM to the registered llama-servers listening on *ports*."""
+    suffixes = tuple(f":{port}" for port in ports)
+    with _managed_processes_lock:
+        processes = [
+            process
+            for role, url, process in _managed_processes.values()
+            if role == "llama-server" and url and url.endswith(suffixes)
+        ]
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+
+
+def managed_server_logs():
+    """Return ``[(base_url, ServerLogWatcher), ...]`` for the running servers."""
+    with _managed_processes_lock:
+        return sorted(_server_logs.values(), key=lambda item: item[0] or "")
+
 
 def parse_comma_args(raw_args):
     if not raw_args:
@@ -125,15 +189,256 @@ def _pick_port(allow_env_port=True):
         return sock.getsockname()[1]
 
 
-def _wait_for_server(host, port, timeout_s=None):
+# llama-server log lines that mark the listener being bound, and the model
+# being loaded and the slots accepting work.
+_BIND_LOG_MARKERS = ("HTTP server is listening", "server is listening on")
+_READY_LOG_MARKERS = ("model loaded", "server is listening on", "all slots are idle")
+# Startup failures after which the server never becomes ready, even if the
+# process lingers.
+_FATAL_LOG_MARKERS = (
+    "error loading model",
+    "failed to load model",
+    "exiting due to model loading error",
+)
+
+# Readiness probes back off from _PROBE_INITIAL_S to _PROBE_MAX_S; they are
+# the fallback for when the log is silent (e.g. ``--log-disable``).
+_PROBE_INITIAL_S = 0.05
+_PROBE_MAX_S = 0.5
+
+
+# Startup lines kept in memory per server, for the load stats of every cell
+# that reuses it.
+_STARTUP_LOG_LINES = 2000
+
+
+def server_logs_enabled():
+    """Whether ``LLAMA_SERVER_LOGS`` asks for llama-server logs on disk."""
+    return os.environ.get("LLAMA_SERVER_LOGS", "1").lower() not in {"0", "false", "no"}
+
+
+def server_log_dir():
+    """Directory for the per-server log files, or None when not capturing.
+
+    Logs are only written when ``LLAMA_SERVER_LOG_DIR`` is set, which the
+    sweeps do for their own runs; ad-hoc servers (tests, benchmarks) keep
+    nothing on disk unless asked to.
+    """
+    if not server_logs_enabled() or not os.environ.get("LLAMA_SERVER_LOG_DIR"):
+        return None
+    return Path(os.environ["LLAMA_SERVER_LOG_DIR"]).expanduser()
+
+
+def prune_server_logs(log_dir, keep):
+    """Delete all but the newest *keep* per-server logs (and their backups)."""
+    try:
+        logs = sorted(
+            Path(log_dir).glob("llama-server-*.log"),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+    except OSError:
+        return
+    for path in logs[max(0, keep):]:
+        for stale in [path, *path.parent.glob(f"{path.name}.*")]:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+
+
+def _log_max_bytes(name, default_mb):
+    return int(float(os.environ.get(name, default_mb)) * 1024 * 1024)
+
+
+class _LogFile:
+    """Append-only text log capped at *max_bytes*.
+
+    With *backups*, a full file is rotated to ``.1`` (``.1`` to ``.2`` and
+    so on, dropping the oldest); without, writing stops at the cap after a
+    truncation note.
+    """
+
+    def __init__(self, path, max_bytes, backups=0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(1024, max_bytes)
+        self.backups = backups
+        self.truncated = False
+        self._handle = self.path.open("w", encoding="utf-8")
+        self._size = 0
+
+    def write(self, line):
+        data = line + "\n"
+        size = len(data.encode("utf-8", errors="replace"))
+        if self._size + size > self.max_bytes:
+            if not self.backups:
+                if not self.truncated:
+                    self.truncated = True
+                    self._handle.write(f"[log truncated at {self.max_bytes} bytes]\n")
+                    self._handle.flush()
+                return
+            self._rotate()
+        self._handle.write(data)
+        self._handle.flush()
+        self._size += size
+
+    def _rotate(self):
+        self._handle.close()
+        for index in range(self.backups, 0, -1):
+            source = self.path.with_name(
+                self.path.name if index == 1 else f"{self.path.name}.{index - 1}"
+            )
+            if source.exists():
+                source.replace(self.path.with_name(f"{self.path.name}.{index}"))
+        self._handle = self.path.open("w", encoding="utf-8")
+        self._size = 0
+
+    def close(self):
+        self._handle.close()
+
+
+class ServerLogWatcher:
+    """Drain a llama-server's output and flag readiness as its log reports it.
+
+    ``bound`` is set once the HTTP listener is up and ``ready`` once the model
+    is loaded; ``tail`` keeps the last lines for error messages. Reading in a
+    thread also keeps the server from blocking on a full pipe.
+
+    ``bound_s`` and ``ready_s`` record when each flag was first set, in
+    seconds since launch. ``fatal`` holds the first line reporting a failed
+    model load. Lines are prefixed with the same stamp. With *log_path* they
+    are written to a rotating file, and between :meth:`begin_segment` and
+    :meth:`end_segment` also to a capped per-cell file. ``startup`` keeps the
+    lines up to the model being loaded.
+    """
+
+    def __init__(self, stream, log_path=None, tail_lines=20):
+        self.bound = threading.Event()
+        self.ready = threading.Event()
+        self.tail = collections.deque(maxlen=tail_lines)
+        self.startup = []
+        self.bound_s = None
+        self.ready_s = None
+        self.fatal = None
+        self.log_path = log_path
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._log = None
+        if log_path is not None:
+            self._log = _LogFile(
+                log_path,
+                _log_max_bytes("LLAMA_SERVER_LOG_MAX_MB", "16"),
+                backups=int(os.environ.get("LLAMA_SERVER_LOG_BACKUPS", "2")),
+            )
+        self._segment = None
+        self._stream = stream
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        with self._stream:
+            for line in self._stream:
+                line = line.rstrip()
+                self.tail.append(line)
+                elapsed = time.monotonic() - self._started
+                stamped = f"[{elapsed:10.3f}] {line}"
+                with self._lock:
+                    loading = not self.ready.is_set()
+                    if loading and len(self.startup) < _STARTUP_LOG_LINES:
+                        self.startup.append(stamped)
+                    if self._log is not None:
+                        self._log.write(stamped)
+                    if self._segment is not None:
+                        self._segment.write(stamped)
+                bound = any(marker in line for marker in _BIND_LOG_MARKERS)
+                ready = any(marker in line for marker in _READY_LOG_MARKERS)
+                if (bound or ready) and not self.bound.is_set():
+                    self.bound_s = elapsed
+                    self.bound.set()
+                if self.fatal is None and not self.ready.is_set():
+                    if any(marker in line for marker in _FATAL_LOG_MARKERS):
+                        self.fatal = line
+                if ready and not self.ready.is_set():
+                    self.ready_s = elapsed
+                    self.ready.set()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+        self.end_segment()
+
+    def begin_segment(self, path):
+        """Also write the lines from now on to *path*, capped in size."""
+        segment = _LogFile(path, _log_max_bytes("LLAMA_SERVER_LOG_CELL_MAX_MB", "8"))
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+            self._segment = segment
+
+    def end_segment(self):
+        with self._lock:
+            segment, self._segment = self._segment, None
+        if segment is not None:
+            segment.close()
+        return segment
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+
+class _ProbeBackoff:
+    """Pace readiness probes until *timeout_s* runs out.
+
+    :meth:`pause` sleeps with exponential backoff, but returns as soon as
+    *event* (a :class:`ServerLogWatcher` flag) is set, so the next probe runs
+    right after the log says the server is ready.
+    """
+
+    def __init__(self, timeout_s, event=None):
+        self.deadline = time.time() + timeout_s
+        self.event = event
+        self.delay = _PROBE_INITIAL_S
+
+    def pending(self):
+        return time.time() < self.deadline
+
+    def pause(self):
+        pause = min(self.delay, max(0.0, self.deadline - time.time()))
+        self.delay = min(self.delay * 2, _PROBE_MAX_S)
+        if self.event is not None and not self.event.is_set():
+            if self.event.wait(pause):
+                self.delay = _PROBE_INITIAL_S
+        else:
+            time.sleep(pause)
+
+
+def _check_process_alive(process, watcher=None):
+    """Raise once the server has exited or its log reports a fatal error."""
+    if process is not None and process.poll() is not None:
+        message = (
+            f"llama-server exited with code {process.returncode} before becoming ready"
+        )
+        if watcher is not None:
+            watcher.join(timeout=1)
+    elif watcher is not None and watcher.fatal is not None:
+        message = f"llama-server failed to start: {watcher.fatal}"
+    else:
+        return
+    if watcher is not None and watcher.tail:
+        message += ":\n" + "\n".join(watcher.tail)
+    raise RuntimeError(message)
+
+
+def _wait_for_server(host, port, timeout_s=None, process=None, watcher=None):
     if timeout_s is None:
         timeout_s = int(os.environ.get("LLAMA_SERVER_BIND_TIMEOUT", "180"))
-    deadline = time.time() + timeout_s
+    backoff = _ProbeBackoff(timeout_s, watcher.bound if watcher else None)
     last_error = None
     health_url = f"http://{host}:{port}/health"
     models_url = f"http://{host}:{port}/v1/models"
 
-    while time.time() < deadline:
+    while backoff.pending():
+        _check_process_alive(process, watcher)
         try:
             with urllib.request.urlopen(health_url, timeout=2) as resp:
                 if resp.status == 200:
@@ -160,7 +465,10 @@ def _wait_for_server(host, port, timeout_s=None):
         except Exception as exc:
             last_error = exc
 
-        time.sleep(0.5)
+        if watcher is not None and watcher.bound.is_set():
+            # Bound but still loading: wait for the model instead.
+            backoff.event = watcher.ready
+        backoff.pause()
 
     raise RuntimeError(
         f"Server did not become ready at {host}:{port} within {timeout_s}s: {last_error}. "
@@ -169,8 +477,8 @@ def _wait_for_server(host, port, timeout_s=None):
     )
 
 
-def _wait_for_completion_ready(host, port, timeout_s=120):
-    deadline = time.time() + timeout_s
+def _wait_for_completion_ready(host, port, timeout_s=120, process=None, watcher=None):
+    backoff = _ProbeBackoff(timeout_s, watcher.ready if watcher else None)
     last_error = None
     url = f"http://{host}:{port}/completion"
     payload = {
@@ -181,7 +489,8 @@ def _wait_for_completion_ready(host, port, timeout_s=120):
     }
     body = json.dumps(payload).encode("utf-8")
 
-    while time.time() < deadline:
+    while backoff.pending():
+        _check_process_alive(process, watcher)
         request = urllib.request.Request(
             url,
             data=body,
@@ -196,20 +505,25 @@ def _wait_for_completion_ready(host, port, timeout_s=120):
                     return
         except urllib.error.HTTPError as exc:
             if exc.code == 503:
-                time.sleep(0.5)
+                backoff.pause()
                 continue
             with exc:
                 data = exc.read().decode("utf-8", errors="replace")
             raise RuntimeError(f"HTTP error {exc.code}: {data}") from exc
         except Exception as exc:
-            time.sleep(0.5)
             last_error = exc
+            backoff.pause()
 
     raise RuntimeError(f"Model did not become ready: {last_error}")
 
 
-@contextlib.contextmanager
-def start_llama_server(port=None, host=None, extra_args=None, ready_timeout_s=None):
+def server_metrics_enabled():
+    """Whether ``LLAMA_SERVER_METRICS`` asks for the Prometheus endpoint."""
+    return os.environ.get("LLAMA_SERVER_METRICS", "0").lower() in {"1", "true", "yes"}
+
+
+def build_llama_server_cmd(host, port, extra_args):
+    """Return the llama-server command line for one instance."""
     server_bin = resolve_llama_server_bin()
     model_path = resolve_model_path()
     if not os.path.isfile(server_bin):
@@ -226,15 +540,6 @@ def start_llama_server(port=None, host=None, extra_args=None, ready_timeout_s=No
             f"Model not found at {model_path}. Set LLAMA_MODEL_PATH."
         )
 
-    if host is None:
-        host = os.environ.get("LLAMA_SERVER_HOST", DEFAULT_HOST)
-    if port is None:
-        port = _pick_port()
-    else:
-        port = int(port)
-    if extra_args is None:
-        extra_args = parse_comma_args(os.environ.get("LLAMA_SERVER_ARGS", ""))
-
     # Always set --ctx-size so we don't allocate too much memory.
     # ctx_size = ctxsize_per_session * parallel; use n_predict when CTXSIZE_PER_SESSION not set.
     ctxsize_per_session = int(
@@ -263,35 +568,137 @@ def start_llama_server(port=None, host=None, extra_args=None, ready_timeout_s=No
         cmd += ["--ctx-size", str(ctx_size)]
     if not _has_flag(extra_args, "--parallel"):
         cmd += ["--parallel", str(parallel)]
+    if server_metrics_enabled() and not _has_flag(extra_args, "--metrics"):
+        cmd += ["--metrics"]
     cmd += extra_args
+    return cmd
+
+
+def llama_server_launch_key(host=None, extra_args=None):
+    """Identify what a server would load, independent of its port.
+
+    Two instances with the same key are interchangeable, which lets
+    :class:`LlamaServerPool` keep them running between sweep cells.
+    """
+    if host is None:
+        host = os.environ.get("LLAMA_SERVER_HOST", DEFAULT_HOST)
+    if extra_args is None:
+        extra_args = parse_comma_args(os.environ.get("LLAMA_SERVER_ARGS", ""))
+    cmd = build_llama_server_cmd(host, 0, extra_args)
+    return tuple(cmd[:3] + cmd[5:])
+
+
+@contextlib.contextmanager
+def start_llama_server(port=None, host=None, extra_args=None, ready_timeout_s=None):
+    if host is None:
+        host = os.environ.get("LLAMA_SERVER_HOST", DEFAULT_HOST)
+    if port is None:
+        port = _pick_port()
+    else:
+        port = int(port)
+    if extra_args is None:
+        extra_args = parse_comma_args(os.environ.get("LLAMA_SERVER_ARGS", ""))
+    cmd = build_llama_server_cmd(host, port, extra_args)
 
     print(f"[llama-server] {' '.join(shlex.quote(str(arg)) for arg in cmd)}")
+    # Readiness comes from the server's own log; probes only confirm it.
     process = subprocess.Popen(
         cmd,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
         text=True,
+        errors="replace",
     )
+    log_path = None
+    log_dir = server_log_dir()
+    if log_dir is not None:
+        # Leave room for this server's file within LLAMA_SERVER_LOG_KEEP.
+        keep = int(os.environ.get("LLAMA_SERVER_LOG_KEEP", "32"))
+        prune_server_logs(log_dir, keep - 1)
+        log_path = log_dir / f"llama-server-{port}-{process.pid}.log"
+    watcher = ServerLogWatcher(process.stdout, log_path=log_path)
+    _register_process("llama-server", process, f"http://{host}:{port}", watcher)
     try:
         bind_timeout = int(os.environ.get("LLAMA_SERVER_BIND_TIMEOUT", "180"))
-        _wait_for_server(host, port, timeout_s=bind_timeout)
+        _wait_for_server(
+            host, port, timeout_s=bind_timeout, process=process, watcher=watcher
+        )
         completion_timeout = ready_timeout_s
         if completion_timeout is None:
             completion_timeout = int(os.environ.get("LLAMA_READY_TIMEOUT", "120"))
-        _wait_for_completion_ready(host, port, timeout_s=completion_timeout)
+        _wait_for_completion_ready(
+            host, port, timeout_s=completion_timeout, process=process, watcher=watcher
+        )
         yield {
             "host": host,
             "port": port,
             "base_url": f"http://{host}:{port}",
             "process": process,
+            "log": watcher,
         }
     finally:
+        _unregister_process(process)
         process.terminate()
         try:
             process.wait(timeout=10)
         except subprocess.TimeoutExpired:
             process.kill()
             process.wait(timeout=5)
+        watcher.join(timeout=1)
+
+
+def _launch_llama_servers(
+    ports,
+    host=None,
+    extra_args=None,
+    ready_timeout_s=None,
+    startup_delay_s=None,
+    max_parallel_loads=None,
+):
+    """Launch one server per port concurrently; return ``[(cm, server), ...]``.
+
+    Each ``cm`` is the entered :func:`start_llama_server` context; call its
+    ``__exit__`` to stop that instance. If any launch fails, every instance
+    that did come up is stopped before the error propagates.
+    """
+    if max_parallel_loads is None:
+        max_parallel_loads = int(os.environ.get("LLAMA_MAX_PARALLEL_LOADS", "0"))
+    workers = len(ports)
+    if max_parallel_loads > 0:
+        workers = min(workers, max_parallel_loads)
+
+    def launch(port):
+        server_cm = start_llama_server(
+            port=port,
+            host=host,
+            extra_args=extra_args,
+            ready_timeout_s=ready_timeout_s,
+        )
+        return server_cm, server_cm.__enter__()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = []
+    try:
+        for index, port in enumerate(ports):
+            futures.append(executor.submit(launch, port))
+            if startup_delay_s and index < len(ports) - 1:
+                time.sleep(startup_delay_s)
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                raise future.exception()
+    except BaseException:
+        # Kill the servers still loading so their launches fail fast instead
+        # of waiting out the ready timeout, then stop whatever did start.
+        _terminate_managed_servers(ports)
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                server_cm, _ = future.result()
+                server_cm.__exit__(None, None, None)
+        raise
+    executor.shutdown(wait=True)
+    return [future.result() for future in futures]
 
 
 @contextlib.contextmanager
@@ -302,29 +709,101 @@ def start_llama_servers(
     extra_args=None,
     ready_timeout_s=None,
     startup_delay_s=None,
+    max_parallel_loads=None,
 ):
+    """Start *count* servers on consecutive ports and wait for all of them.
+
+    Instances are launched concurrently and their readiness probes run in
+    parallel, so N model loads overlap instead of running back to back.
+    ``max_parallel_loads`` (or ``LLAMA_MAX_PARALLEL_LOADS``; ``0`` means no
+    cap) limits how many servers load at once. If any instance fails, the
+    ones that did come up are torn down before the error propagates.
+    """
     if count < 1:
         raise ValueError("count must be >= 1")
     if base_port is None:
         base_port = _pick_port(allow_env_port=False)
 
-    servers = []
     with contextlib.ExitStack() as stack:
-        for index in range(count):
-            port = base_port + index
-            servers.append(
-                stack.enter_context(
-                    start_llama_server(
-                        port=port,
-                        host=host,
-                        extra_args=extra_args,
-                        ready_timeout_s=ready_timeout_s,
-                    )
-                )
+        launched = _launch_llama_servers(
+            [base_port + index for index in range(count)],
+            host=host,
+            extra_args=extra_args,
+            ready_timeout_s=ready_timeout_s,
+            startup_delay_s=startup_delay_s,
+            max_parallel_loads=max_parallel_loads,
+        )
+        for server_cm, _ in launched:
+            stack.push(server_cm.__exit__)
+        yield [server for _, server in launched]
+
+
+class LlamaServerPool:
+    """Keep llama-server instances alive between sweep cells.
+
+    Running servers are keyed by their effective command line (see
+    :func:`llama_server_launch_key`). :meth:`acquire` reuses them when the
+    key is unchanged, starting only the extra instances needed to grow or
+    stopping surplus ones to shrink; a different key restarts the pool. Model
+    loads therefore only happen when the launch arguments actually change.
+    """
+
+    def __init__(
+        self,
+        base_port,
+        host=None,
+        ready_timeout_s=None,
+        startup_delay_s=None,
+        max_parallel_loads=None,
+    ):
+        self.base_port = base_port
+        self.host = host
+        self.ready_timeout_s = ready_timeout_s
+        self.startup_delay_s = startup_delay_s
+        self.max_parallel_loads = max_parallel_loads
+        self.key = None
+        self._running = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _stop(self, entries):
+        for server_cm, _ in reversed(entries):
+            server_cm.__exit__(None, None, None)
+
+    def acquire(self, count, extra_args=None):
+        """Return *count* running servers for *extra_args* (and current env)."""
+        if count < 1:
+            raise ValueError("count must be >= 1")
+        key = llama_server_launch_key(self.host, extra_args)
+        if key != self.key:
+            self.close()
+            self.key = key
+        if len(self._running) > count:
+            surplus = self._running[count:]
+            self._running = self._running[:count]
+            self._stop(surplus)
+        if len(self._running) < count:
+            ports = [
+                self.base_port + index for index in range(len(self._running), count)
+            ]
+            self._running += _launch_llama_servers(
+                ports,
+                host=self.host,
+                extra_args=extra_args,
+                ready_timeout_s=self.ready_timeout_s,
+                startup_delay_s=self.startup_delay_s,
+                max_parallel_loads=self.max_parallel_loads,
             )
-            if startup_delay_s:
-                time.sleep(startup_delay_s)
-        yield servers
+        return [server for _, server in self._running]
+
+    def close(self):
+        running, self._running = self._running, []
+        self.key = None
+        self._stop(running)
 
 
 def resolve_nginx_bin():
@@ -351,29 +830,137 @@ def _wait_for_port(host, port, timeout_s=20):
     raise RuntimeError(f"Port {port} did not become ready: {last_error}")
 
 
-@contextlib.contextmanager
-def start_nginx_round_robin(upstreams, listen_port, listen_host=None):
-    nginx_bin = resolve_nginx_bin()
-    if not (os.path.isfile(nginx_bin) or shutil.which(nginx_bin)):
-        raise FileNotFoundError(
-            "nginx binary not found. Install nginx or set NGINX_BIN."
+LB_STRATEGIES = ("round_robin", "least_conn", "random_two", "hash_header", "hash_prefix")
+
+
+def resolve_lb_strategy(strategy=None):
+    """Validate *strategy*, defaulting to ``LLAMA_LB_STRATEGY`` (round_robin)."""
+    if strategy is None:
+        strategy = os.environ.get("LLAMA_LB_STRATEGY", "round_robin")
+    strategy = strategy.strip().lower().replace("-", "_") or "round_robin"
+    if strategy not in LB_STRATEGIES:
+        raise ValueError(
+            f"Unknown load-balancing strategy {strategy!r}; "
+            f"expected one of {', '.join(LB_STRATEGIES)}"
         )
+    return strategy
 
-    if listen_host is None:
-        listen_host = DEFAULT_HOST
 
-    temp_dir = tempfile.TemporaryDirectory()
-    conf_path = os.path.join(temp_dir.name, "nginx.conf")
+def _nginx_balancing(strategy):
+    """Return ``(http_lines, upstream_lines)`` selecting the balancing method.
+
+    ``hash_header`` keys on ``LLAMA_LB_HASH_HEADER`` (default
+    ``X-Session-Id``). ``hash_prefix`` keys on the first
+    ``LLAMA_LB_HASH_PREFIX_CHARS`` characters of the JSON ``prompt``, read
+    from the buffered request body, so requests sharing a prompt prefix land
+    on the instance that already has it cached.
+    """
+    if strategy == "least_conn":
+        return [], ["least_conn;"]
+    if strategy == "random_two":
+        return [], ["random two least_conn;"]
+    if strategy == "hash_header":
+        header = os.environ.get("LLAMA_LB_HASH_HEADER", "X-Session-Id")
+        variable = "$http_" + header.strip().lower().replace("-", "_")
+        return [], [f"hash {variable} consistent;"]
+    if strategy == "hash_prefix":
+        chars = int(os.environ.get("LLAMA_LB_HASH_PREFIX_CHARS", "256"))
+        http_lines = [
+            # $request_body is only set when the whole body fits in memory.
+            "client_body_buffer_size 16m;",
+            "client_max_body_size 16m;",
+            "map $request_body $llama_prompt_prefix {",
+            # Escaped characters are matched as pairs so the key cannot run
+            # past the closing quote of the prompt.
+            rf'    "~\"prompt\"\s*:\s*\"(?<llama_key>(?:[^\"\\\\]|\\\\.){{1,{chars}}})"'
+            " $llama_key;",
+            '    default "";',
+            "}",
+        ]
+        return http_lines, ["hash $llama_prompt_prefix consistent;"]
+    return [], []
+
+
+NGINX_TUNING_COLUMNS = [
+    "nginx_workers",
+    "nginx_worker_connections",
+    "nginx_keepalive",
+    "nginx_buffering",
+]
+
+
+def nginx_tuning(workers=None, worker_connections=None, keepalive=None, buffering=None):
+    """Return nginx process/upstream settings, filling unset ones from the env.
+
+    ``LLAMA_NGINX_WORKERS`` (``worker_processes``, a count or ``auto``),
+    ``LLAMA_NGINX_WORKER_CONNECTIONS``, ``LLAMA_NGINX_KEEPALIVE`` (idle
+    upstream connections kept per worker, 0 = none) and
+    ``LLAMA_NGINX_BUFFERING`` (``proxy_buffering``). The defaults reproduce
+    the original fixed config.
+    """
+    if workers is None:
+        workers = os.environ.get("LLAMA_NGINX_WORKERS", "1")
+    if worker_connections is None:
+        worker_connections = os.environ.get("LLAMA_NGINX_WORKER_CONNECTIONS", "1024")
+    if keepalive is None:
+        keepalive = os.environ.get("LLAMA_NGINX_KEEPALIVE", "0")
+    if buffering is None:
+        buffering = os.environ.get("LLAMA_NGINX_BUFFERING", "on")
+    if isinstance(buffering, str):
+        buffering = buffering.strip().lower() not in {"0", "off", "false", "no"}
+    workers = str(workers).strip().lower()
+    if workers != "auto":
+        workers = str(int(workers))
+    return {
+        "workers": workers,
+        "worker_connections": int(worker_connections),
+        "keepalive": int(keepalive),
+        "buffering": bool(buffering),
+    }
+
+
+def nginx_tuning_fields(tuning):
+    """Map a :func:`nginx_tuning` dict onto :data:`NGINX_TUNING_COLUMNS`."""
+    return {
+        "nginx_workers": tuning["workers"],
+        "nginx_worker_connections": tuning["worker_connections"],
+        "nginx_keepalive": tuning["keepalive"],
+        "nginx_buffering": "on" if tuning["buffering"] else "off",
+    }
+
+
+def _write_nginx_conf(
+    conf_path,
+    prefix,
+    upstreams,
+    listen_host,
+    listen_port,
+    strategy="round_robin",
+    tuning=None,
+):
+    if tuning is None:
+        tuning = nginx_tuning()
+    http_lines, balancing_lines = _nginx_balancing(strategy)
+    if tuning["keepalive"] > 0:
+        # Must follow the balancing method directive.
+        balancing_lines = balancing_lines + [f"keepalive {tuning['keepalive']};"]
     upstream_lines = "\n".join(
-        [f"        server {host}:{port};" for host, port in upstreams]
+        [f"        {line}" for line in balancing_lines]
+        + [f"        server {host}:{port};" for host, port in upstreams]
     )
+    http_extra = "".join(f"    {line}\n" for line in http_lines)
+    buffering = "on" if tuning["buffering"] else "off"
+    # Each proxied request holds a client and an upstream connection.
+    nofile = max(1024, tuning["worker_connections"] * 2)
     conf = (
-        "worker_processes 1;\n"
-        f"pid {temp_dir.name}/nginx.pid;\n"
-        f"error_log {temp_dir.name}/error.log;\n"
-        "events { worker_connections 1024; }\n"
+        f"worker_processes {tuning['workers']};\n"
+        f"worker_rlimit_nofile {nofile};\n"
+        f"pid {prefix}/nginx.pid;\n"
+        f"error_log {prefix}/error.log;\n"
+        f"events {{ worker_connections {tuning['worker_connections']}; }}\n"
         "http {\n"
-        f"    access_log {temp_dir.name}/access.log;\n"
+        f"    access_log {prefix}/access.log;\n"
+        f"{http_extra}"
         "    upstream llama_backend {\n"
         f"{upstream_lines}\n"
         "    }\n"
@@ -383,6 +970,7 @@ def start_nginx_round_robin(upstreams, listen_port, listen_host=None):
         "            proxy_pass http://llama_backend;\n"
         "            proxy_http_version 1.1;\n"
         "            proxy_set_header Connection \"\";\n"
+        f"            proxy_buffering {buffering};\n"
         "        }\n"
         "    }\n"
         "}\n"
@@ -390,12 +978,42 @@ def start_nginx_round_robin(upstreams, listen_port, listen_host=None):
     with open(conf_path, "w", encoding="utf-8") as handle:
         handle.write(conf)
 
+
+@contextlib.contextmanager
+def start_nginx_round_robin(
+    upstreams, listen_port, listen_host=None, strategy=None, tuning=None
+):
+    """Run nginx in front of *upstreams*, balanced per ``strategy``.
+
+    ``strategy`` is one of :data:`LB_STRATEGIES` and defaults to
+    ``LLAMA_LB_STRATEGY``; plain round-robin when neither is set.
+    ``tuning`` is a :func:`nginx_tuning` dict (default: from the env).
+    """
+    strategy = resolve_lb_strategy(strategy)
+    if tuning is None:
+        tuning = nginx_tuning()
+    nginx_bin = resolve_nginx_bin()
+    if not (os.path.isfile(nginx_bin) or shutil.which(nginx_bin)):
+        raise FileNotFoundError(
+            "nginx binary not found. Install nginx or set NGINX_BIN."
+        )
+
+    if listen_host is None:
+        listen_host = DEFAULT_HOST
+
+    temp_dir = tempfile.TemporaryDirectory()
+    conf_path = os.path.join(temp_dir.name, "nginx.conf")
+    _write_nginx_conf(
+        conf_path, temp_dir.name, upstreams, listen_host, listen_port, strategy, tuning
+    )
+
     process = subprocess.Popen(
         [nginx_bin, "-c", conf_path, "-p", temp_dir.name, "-g", "daemon off;"],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
         text=True,
     )
+    _register_process("nginx", process)
     try:
         _wait_for_port(listen_host, listen_port)
         yield {
@@ -403,8 +1021,15 @@ def start_nginx_round_robin(upstreams, listen_port, listen_host=None):
             "port": listen_port,
             "base_url": f"http://{listen_host}:{listen_port}",
             "process": process,
+            "prefix": temp_dir.name,
+            "conf_path": conf_path,
+            "upstreams": list(upstreams),
+            "strategy": strategy,
+            "tuning": tuning,
+            "kind": "nginx",
         }
     finally:
+        _unregister_process(process)
         process.terminate()
         try:
             process.wait(timeout=5)
@@ -414,26 +1039,282 @@ def start_nginx_round_robin(upstreams, listen_port, listen_host=None):
         temp_dir.cleanup()
 
 
+def reload_nginx_round_robin(proxy, upstreams, settle_s=0.5, tuning=None):
+    """Point a running :func:`start_nginx_round_robin` proxy at new upstreams.
+
+    The config is rewritten and validated, then nginx is sent ``SIGHUP`` so
+    it swaps workers gracefully without giving up the listening socket.
+    Passing ``tuning`` also applies new worker/keepalive/buffering settings.
+    """
+    upstreams = list(upstreams)
+    if tuning is None:
+        tuning = proxy["tuning"]
+    if upstreams == proxy["upstreams"] and tuning == proxy["tuning"]:
+        return proxy
+    nginx_bin = resolve_nginx_bin()
+    _write_nginx_conf(
+        proxy["conf_path"],
+        proxy["prefix"],
+        upstreams,
+        proxy["host"],
+        proxy["port"],
+        proxy["strategy"],
+        tuning,
+    )
+    subprocess.run(
+        [nginx_bin, "-t", "-q", "-c", proxy["conf_path"], "-p", proxy["prefix"]],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    proxy["process"].send_signal(signal.SIGHUP)
+    # Old workers finish their in-flight requests before exiting; give the
+    # new ones a moment to pick up the listener.
+    time.sleep(settle_s)
+    _wait_for_port(proxy["host"], proxy["port"])
+    proxy["upstreams"] = upstreams
+    proxy["tuning"] = tuning
+    return proxy
+
+
+# Errors from sending on a reused keep-alive socket the server already
+# closed. The request was not (fully) sent, so it's safe to resend on a new
+# socket. Errors while waiting for the response are not retried, except
+# RemoteDisconnected on a reused socket (see HTTPConnectionPool.open).
+_STALE_SEND_ERRORS = (
+    http.client.CannotSendRequest,
+    ConnectionResetError,
+    BrokenPipeError,
+    ConnectionAbortedError,
+)
+
+
+class HTTPConnectionPool:
+    """Thread-safe pool of persistent HTTP/1.1 connections, keyed by host:port.
+
+    Idle sockets are kept per host (up to ``max_size``) and handed back out
+    to the next request, so sweeps stop paying TCP setup/teardown per request
+    and nginx gets reusable upstream connections.
+    """
+
+    def __init__(self, max_size=1024, keep_alive=True):
+        self.max_size = max_size
+        self.keep_alive = keep_alive
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, host, port, timeout):
+        if self.keep_alive:
+            with self._lock:
+                idle = self._idle.get((host, port))
+                if idle:
+                    conn = idle.pop()
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _release(self, host, port, conn):
+        if not self.keep_alive:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault((host, port), [])
+            if len(idle) < self.max_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    @contextlib.contextmanager
+    def open(self, method, url, body=None, headers=None, timeout=120):
+        """Send one request and yield the unread ``http.client.HTTPResponse``.
+
+        The connection goes back to the pool on exit if the body was read to
+        the end; otherwise it is closed.
+        """
+        parsed = urllib.parse.urlsplit(url)
+        host = parsed.hostname
+        port = parsed.port or 80
+        path = parsed.path or "/"
+        if parsed.query:
+            path += f"?{parsed.query}"
+        request_headers = dict(headers or {})
+        if not self.keep_alive:
+            request_headers["Connection"] = "close"
+
+        while True:
+            conn, reused = self._acquire(host, port, timeout)
+            try:
+                conn.request(method, path, body=body, headers=request_headers)
+            except _STALE_SEND_ERRORS:
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            try:
+                resp = conn.getresponse()
+            except http.client.RemoteDisconnected:
+                # Closed before a single response byte on a socket that sat
+                # idle in the pool: the server dropped the idle connection as
+                # the request went out, so it never ran. Any other failure
+                # here may come after the server did the work, and resending
+                # would double-submit it.
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        try:
+            yield resp
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close or not resp.isclosed():
+            conn.close()
+        else:
+            self._release(host, port, conn)
+
+    def request(self, method, url, body=None, headers=None, timeout=120):
+        """Send one request and return ``(status, body_bytes)``."""
+        with self.open(method, url, body, headers, timeout) as resp:
+            return resp.status, resp.read()
+
+    def close(self):
+        with self._lock:
+            idle_lists = list(self._idle.values())
+            self._idle.clear()
+        for idle in idle_lists:
+            for conn in idle:
+                conn.close()
+
+
+_http_pool = None
+_http_pool_lock = threading.Lock()
+
+
+def get_http_pool():
+    """Return the process-wide pool used by :func:`post_json`.
+
+    Sized by ``LLAMA_HTTP_POOL_SIZE``; ``LLAMA_HTTP_KEEPALIVE=0`` restores the
+    old one-connection-per-request behaviour.
+    """
+    global _http_pool
+    with _http_pool_lock:
+        if _http_pool is None:
+            keep_alive = os.environ.get("LLAMA_HTTP_KEEPALIVE", "1").lower() not in {
+                "0",
+                "false",
+                "no",
+            }
+            _http_pool = HTTPConnectionPool(
+                max_size=int(os.environ.get("LLAMA_HTTP_POOL_SIZE", "1024")),
+                keep_alive=keep_alive,
+            )
+            atexit.register(_http_pool.close)
+        return _http_pool
+
+
+class StreamCollector:
+    """Parse llama-server's SSE ``/completion`` stream and timestamp each chunk.
+
+    Feed raw body bytes as they arrive; :meth:`finish` returns the final
+    ``stop`` event (which carries ``timings``) with the streamed content
+    joined back together and a ``client_timings`` dict holding TTFT,
+    inter-token gaps and end-to-end latency in milliseconds.
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.buffer = b""
+        self.token_times = []
+        self.content = []
+        self.final = None
+
+    def feed(self, data, now):
+        self.buffer += data
+        while b"\n" in self.buffer:
+            line, _, self.buffer = self.buffer.partition(b"\n")
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if not data or data == b"[DONE]":
+                continue
+            event = json.loads(data)
+            self.content.append(event.get("content") or "")
+            if event.get("stop"):
+                self.final = event
+            else:
+                self.token_times.append(now)
+
+    def finish(self, end):
+        if self.final is None:
+            raise RuntimeError("Stream ended without a final stop event")
+        response = dict(self.final)
+        response["content"] = "".join(self.content)
+        first = self.token_times[0] if self.token_times else end
+        response["client_timings"] = {
+            "ttft_ms": (first - self.start) * 1000.0,
+            "itl_ms": [
+                (later - earlier) * 1000.0
+                for earlier, later in zip(self.token_times, self.token_times[1:])
+            ],
+            "latency_ms": (end - self.start) * 1000.0,
+        }
+        return response
+
+
+def post_json_stream(url, payload, timeout=120):
+    payload = dict(payload, stream=True)
+    body = json.dumps(payload).encode("utf-8")
+    start = time.perf_counter()
+    with get_http_pool().open(
+        "POST",
+        url,
+        body=body,
+        headers={"Content-Type": "application/json"},
+        timeout=timeout,
+    ) as resp:
+        if resp.status >= 400:
+            data = resp.read().decode("utf-8", errors="replace")
+            raise RuntimeError(f"HTTP error {resp.status}: {data}")
+        collector = StreamCollector(start)
+        while True:
+            chunk = resp.read1(65536)
+            if not chunk:
+                break
+            collector.feed(chunk, time.perf_counter())
+    return collector.finish(time.perf_counter())
+
+
 def post_json(url, payload, timeout=120):
+    if payload.get("stream"):
+        return post_json_stream(url, payload, timeout=timeout)
     body = json.dumps(payload).encode("utf-8")
-    request = urllib.request.Request(
+    start = time.perf_counter()
+    status, data = get_http_pool().request(
+        "POST",
         url,
-        data=body,
-        headers={
-            "Content-Type": "application/json",
-            "Connection": "close",
-        },
-        method="POST",
+        body=body,
+        headers={"Content-Type": "application/json"},
+        timeout=timeout,
     )
-    try:
-        with urllib.request.urlopen(request, timeout=timeout) as resp:
-            data = resp.read().decode("utf-8")
-            resp.close()
-            return json.loads(data)
-    except urllib.error.HTTPError as exc:
-        with exc:
-            data = exc.read().decode("utf-8", errors="replace")
-        raise RuntimeError(f"HTTP error {exc.code}: {data}") from exc
+    text = data.decode("utf-8", errors="replace")
+    if status >= 400:
+        raise RuntimeError(f"HTTP error {status}: {text}")
+    response = json.loads(text)
+    response["client_timings"] = {
+        "latency_ms": (time.perf_counter() - start) * 1000.0,
+    }
+    return response
 
 
 def extract_token_count(response):
@@ -451,6 +1332,19 @@ def extract_token_count(response):
     return 0
 
 
+def extract_prompt_token_count(response):
+    """Prompt tokens the server evaluated for *response* (``timings.prompt_n``)."""
+    timings = response.get("timings") or {}
+    if "prompt_n" in timings:
+        return int(timings["prompt_n"])
+    if "tokens_evaluated" in response:
+        return int(response["tokens_evaluated"])
+    usage = response.get("usage") or {}
+    if "prompt_tokens" in usage:
+        return int(usage["prompt_tokens"])
+    return 0
+
+
 def extract_tokens_per_second(response):
     timings = response.get("timings") or {}
     for key in ("predicted_per_second", "tokens_per_second"):
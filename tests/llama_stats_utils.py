@@ -0,0 +1,114 @@
+"""Compact statistics helpers for per-request measurements."""
+import json
+
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram:
+    """Log-linear (HDR-style) histogram of millisecond values.
+
+    Values are stored as integer microseconds in buckets with 128 linear
+    sub-buckets per power of two, so any recorded value is reproduced within
+    ~0.8% while memory stays bounded by the value range rather than the
+    number of samples.
+    """
+
+    SUB_BUCKET_BITS = 7
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def _index(cls, micros):
+        if micros < cls.SUB_BUCKETS:
+            return micros
+        shift = micros.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return (shift + 1) * cls.SUB_BUCKETS + (micros >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def _bounds(cls, index):
+        """Return the ``[low, high)`` microsecond range covered by *index*."""
+        if index < cls.SUB_BUCKETS:
+            return index, index + 1
+        shift = index // cls.SUB_BUCKETS - 1
+        low = (index % cls.SUB_BUCKETS + cls.SUB_BUCKETS) << shift
+        return low, low + (1 << shift)
+
+    def record(self, value_ms):
+        if value_ms is None:
+            return
+        value_ms = max(0.0, float(value_ms))
+        index = self._index(int(value_ms * 1000.0))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value_ms
+        self.min = value_ms if self.min is None else min(self.min, value_ms)
+        self.max = value_ms if self.max is None else max(self.max, value_ms)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        target = max(1, round(self.count * percent / 100.0))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                low, high = self._bounds(index)
+                value = (low + high - 1) / 2.0 / 1000.0
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "unit": "ms",
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "percentiles": {f"p{p}": self.percentile(p) for p in PERCENTILES},
+            "buckets": [
+                [self._bounds(index)[0] / 1000.0, self.counts[index]]
+                for index in sorted(self.counts)
+            ],
+        }
+
+
+def percentile_columns(name):
+    return [f"{name}_p{p}" for p in PERCENTILES]
+
+
+def percentile_fields(name, histogram):
+    """Map ``<name>_p50``-style keys to *histogram*'s percentiles."""
+    return {
+        f"{name}_p{p}": histogram.percentile(p) for p in PERCENTILES
+    }
+
+
+def append_histograms(path, cell, histograms):
+    """Append one JSON line with *cell*'s labels and serialized *histograms*."""
+    record = dict(cell)
+    record["histograms"] = {
+        name: histogram.to_dict() for name, histogram in histograms.items()
+    }
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write(json.dumps(record) + "\n")
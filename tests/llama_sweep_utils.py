@@ -0,0 +1,271 @@
+"""Search and checkpoint helpers shared by the sweep scripts."""
+import hashlib
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+
+from tests.llama_server_test_utils import nginx_tuning
+
+SWEEP_MODES = ("grid", "adaptive")
+
+
+def parse_int_list(value, default):
+    raw = value or default
+    parts = [item.strip() for item in raw.replace(",", " ").split()]
+    return [int(item) for item in parts if item]
+
+
+def parse_float_list(value, default):
+    raw = value or default
+    parts = [item.strip() for item in raw.replace(",", " ").split()]
+    return [float(item) for item in parts if item]
+
+
+def parse_optional_int_list(value, default):
+    """Like :func:`parse_int_list`, with ``default`` items parsed as None."""
+    raw = value or default
+    parts = [item.strip() for item in raw.replace(",", " ").split()]
+    result = []
+    for item in parts:
+        if not item:
+            continue
+        if item.lower() == "default":
+            result.append(None)
+        else:
+            result.append(int(item))
+    return result or [None]
+
+
+def parse_bool_list(value, default):
+    raw = value or default
+    parts = [item.strip().lower() for item in raw.replace(",", " ").split()]
+    return [item in {"1", "true", "yes", "on"} for item in parts if item]
+
+
+def parse_str_list(value, default):
+    raw = value or default
+    parts = [item.strip() for item in raw.replace(",", " ").split()]
+    return [item for item in parts if item]
+
+
+def init_results_file(subdir, prefix):
+    """Timestamped CSV path under ``<LLAMA_RESULTS_DIR>/<subdir>``."""
+    base_dir = Path(os.environ.get("LLAMA_RESULTS_DIR", "results")).expanduser()
+    results_dir = base_dir / subdir
+    results_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    return results_dir / f"{prefix}_{timestamp}.csv"
+
+
+def resolve_sweep_mode():
+    mode = os.environ.get("LLAMA_SWEEP_MODE", "grid").strip().lower() or "grid"
+    if mode not in SWEEP_MODES:
+        raise ValueError(
+            f"Unknown LLAMA_SWEEP_MODE={mode!r}; expected one of {', '.join(SWEEP_MODES)}"
+        )
+    return mode
+
+
+class PlateauTracker:
+    """Decide when to stop walking one sweep axis.
+
+    Feed observations in axis order with :meth:`update`. The axis is done
+    once ``patience`` consecutive values fail to beat the best so far by more
+    than ``min_gain_pct`` percent, or as soon as a value is marked failed.
+    """
+
+    def __init__(self, min_gain_pct=5.0, patience=2):
+        self.min_gain = min_gain_pct / 100.0
+        self.patience = max(1, patience)
+        self.best = None
+        self.best_key = None
+        self.stale = 0
+        self.stopped = False
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            float(os.environ.get("LLAMA_PLATEAU_PCT", "5")),
+            int(os.environ.get("LLAMA_PLATEAU_PATIENCE", "2")),
+        )
+
+    def update(self, value, key=None, failed=False):
+        """Record one observation; return True once the axis should stop."""
+        if failed:
+            self.stopped = True
+            return True
+        if self.best is None or value > self.best * (1.0 + self.min_gain):
+            self.stale = 0
+        else:
+            self.stale += 1
+        if self.best is None or value > self.best:
+            self.best = value
+            self.best_key = key
+        self.stopped = self.stale >= self.patience
+        return self.stopped
+
+
+def refine_points(tested, center, integer=True):
+    """Midpoints between *center* and its neighbours in *tested*.
+
+    Used to probe the gaps around the best load point of a configuration;
+    points already in *tested* (or that collapse onto one after rounding)
+    are skipped.
+    """
+    ordered = sorted(set(tested))
+    if center not in ordered:
+        return []
+    index = ordered.index(center)
+    points = []
+    for neighbour in ordered[max(0, index - 1):index] + ordered[index + 1:index + 2]:
+        midpoint = (neighbour + center) / 2
+        midpoint = int(midpoint) if integer else round(midpoint, 3)
+        if midpoint not in ordered and midpoint not in points:
+            points.append(midpoint)
+    return sorted(points)
+
+
+def _env_list(name, default):
+    raw = os.environ.get(name) or str(default)
+    return [item for item in raw.replace(",", " ").split() if item]
+
+
+def nginx_tuning_grid():
+    """Every combination of the ``LLAMA_NGINX_*_LIST`` proxy settings.
+
+    Each list defaults to the single value :func:`nginx_tuning` would use, so
+    without any list set the grid is one config and sweeps behave as before.
+    """
+    base = nginx_tuning()
+    return [
+        nginx_tuning(workers, connections, keepalive, buffering)
+        for workers, connections, keepalive, buffering in itertools.product(
+            _env_list("LLAMA_NGINX_WORKERS_LIST", base["workers"]),
+            _env_list("LLAMA_NGINX_WORKER_CONNECTIONS_LIST", base["worker_connections"]),
+            _env_list("LLAMA_NGINX_KEEPALIVE_LIST", base["keepalive"]),
+            _env_list("LLAMA_NGINX_BUFFERING_LIST", "on" if base["buffering"] else "off"),
+        )
+    ]
+
+
+def nginx_tuning_label(tuning):
+    """Compact label such as ``workers=2 conns=4096 keepalive=64 buffering=off``."""
+    return (
+        f"workers={tuning['workers']} "
+        f"conns={tuning['worker_connections']} "
+        f"keepalive={tuning['keepalive']} "
+        f"buffering={'on' if tuning['buffering'] else 'off'}"
+    )
+
+
+def config_hash(config):
+    """Short stable hash of a JSON-serializable sweep configuration."""
+    encoded = json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+class SweepState:
+    """Append-only checkpoint of the cells a sweep has recorded.
+
+    The state file sits next to the sweep CSVs and is named after a hash of
+    the sweep configuration, so rerunning the same sweep finds it, keeps
+    appending to the same CSV and skips cells that already have enough
+    samples. The first line holds the config and CSV path; every following
+    line is one recorded sample. A torn last line from a crash is ignored.
+    """
+
+    def __init__(self, path, results_path, records=None):
+        self.path = Path(path)
+        self.results_path = Path(results_path)
+        self.resumed = records is not None
+        self._samples = {}
+        for record in records or []:
+            self._samples.setdefault(record["cell"], []).append(record)
+
+    @classmethod
+    def open(cls, directory, prefix, config, new_results_path, resume=True):
+        """Load the state for *config*, or start one writing *new_results_path*."""
+        digest = config_hash(config)
+        path = Path(directory) / f"{prefix}_{digest}.state.jsonl"
+        if resume and path.is_file():
+            header, records = cls._read(path)
+            if header and Path(header["results_path"]).is_file():
+                cls._terminate_last_line(path)
+                return cls(path, header["results_path"], records)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        header = {
+            "config_hash": digest,
+            "config": config,
+            "results_path": str(new_results_path),
+        }
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps(header, default=str) + "\n")
+        return cls(path, new_results_path)
+
+    @staticmethod
+    def _read(path):
+        header = None
+        records = []
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if header is None:
+                    header = record
+                else:
+                    records.append(record)
+        return header, records
+
+    @staticmethod
+    def _terminate_last_line(path):
+        # A crash mid-append leaves a partial line; start new records on a
+        # fresh line so they stay parseable.
+        with open(path, "rb+") as handle:
+            handle.seek(0, os.SEEK_END)
+            if handle.tell():
+                handle.seek(-1, os.SEEK_END)
+                if handle.read(1) != b"\n":
+                    handle.write(b"\n")
+
+    @staticmethod
+    def cell_key(*labels):
+        return "|".join(str(label) for label in labels)
+
+    def samples(self, key):
+        return len(self._samples.get(key, ()))
+
+    @property
+    def recorded(self):
+        return sum(len(records) for records in self._samples.values())
+
+    def outcome(self, key):
+        """Return ``(mean throughput, failed)`` over *key*'s samples."""
+        records = self._samples.get(key)
+        if not records:
+            return None, False
+        throughput = sum(record["throughput"] for record in records) / len(records)
+        failed = any(record["failed"] or record["errors"] > 0 for record in records)
+        return throughput, failed
+
+    def records(self):
+        for records in self._samples.values():
+            yield from records
+
+    def record(self, key, throughput, errors, failed, **labels):
+        """Durably append one sample for *key* before moving on."""
+        record = {
+            "cell": key,
+            "throughput": float(throughput),
+            "errors": int(errors),
+            "failed": bool(failed),
+            **labels,
+        }
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(record) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._samples.setdefault(key, []).append(record)
@@ -0,0 +1,185 @@
+"""Request workloads: prompt corpora, length distributions, synthetic prompts."""
+import hashlib
+import json
+import math
+import os
+import random
+from pathlib import Path
+
+# Short common English words; most tokenizers encode each (with its leading
+# space) as a single token, so N words is a close stand-in for N tokens.
+_SYNTHETIC_WORDS = (
+    "the of and to in is for on that with as by at from this be are was it"
+    " an or not have has can will more one all about which their time data"
+    " model server request token cache batch memory system user answer write"
+    " short list three plan step goal test code run load fast slow high low"
+    " new old first last next good best work team day week year part case"
+    " point fact way line page word book note task file road city water food"
+    " light sound color music game story river tree stone cloud rain snow"
+).split()
+
+
+class LengthDistribution:
+    """Integer length sampler parsed from a spec string.
+
+    Specs: ``128`` or ``fixed:128``, ``uniform:64,512``, ``normal:256,64``
+    (mean, stddev), ``lognormal:256,0.5`` (median, sigma) and
+    ``choice:64,128,512``. Samples are clamped to at least 1.
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal", "choice")
+
+    def __init__(self, kind, params):
+        if kind not in self.KINDS:
+            raise ValueError(
+                f"Unknown length distribution {kind!r}; "
+                f"expected one of {', '.join(self.KINDS)}."
+            )
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind in expected and len(params) != expected[kind]:
+            raise ValueError(f"{kind} distribution takes {expected[kind]} value(s)")
+        if kind == "choice" and not params:
+            raise ValueError("choice distribution needs at least one value")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec):
+        spec = spec.strip()
+        kind, _, raw = spec.partition(":")
+        if not raw:
+            kind, raw = "fixed", spec
+        params = [float(value) for value in raw.split(",") if value.strip()]
+        return cls(kind.strip().lower(), params)
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.randint(int(self.params[0]), int(self.params[1]))
+        elif self.kind == "normal":
+            value = rng.gauss(self.params[0], self.params[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        else:
+            value = rng.choice(self.params)
+        return max(1, int(round(value)))
+
+    def __str__(self):
+        return f"{self.kind}:{','.join(f'{value:g}' for value in self.params)}"
+
+
+def load_prompt_corpus(path):
+    """Read a JSONL prompt set: one ``{"prompt": ..., "n_predict": ...}`` per line.
+
+    ``n_predict`` is optional. Blank lines are skipped.
+    """
+    entries = []
+    with open(Path(path).expanduser(), encoding="utf-8") as handle:
+        for line_no, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict) or "prompt" not in record:
+                raise ValueError(f"{path}:{line_no}: expected an object with 'prompt'")
+            entries.append(record)
+    if not entries:
+        raise ValueError(f"{path}: no prompts found")
+    return entries
+
+
+def synthesize_prompt(tokens, rng):
+    """Return a prompt of roughly *tokens* tokens made of random common words."""
+    return " ".join(rng.choice(_SYNTHETIC_WORDS) for _ in range(max(1, tokens)))
+
+
+class Workload:
+    """Per-request prompts and output lengths for a sweep cell.
+
+    Prompts come from a JSONL ``corpus`` (sampled with replacement) or are
+    synthesized from ``prompt_tokens``; ``output_tokens`` overrides the
+    cell's ``n_predict`` per request. The same ``seed`` yields the same
+    request sequence; sweeps use :meth:`for_cell` so each cell draws its own.
+    """
+
+    def __init__(self, corpus=None, prompt_tokens=None, output_tokens=None, seed=0):
+        self.corpus = corpus
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls):
+        """Build the workload from ``LLAMA_WORKLOAD_*``; None when unset."""
+        corpus_path = os.environ.get("LLAMA_WORKLOAD_FILE")
+        prompt_spec = os.environ.get("LLAMA_PROMPT_TOKENS")
+        output_spec = os.environ.get("LLAMA_N_PREDICT_DIST")
+        if not (corpus_path or prompt_spec or output_spec):
+            return None
+        return cls(
+            corpus=load_prompt_corpus(corpus_path) if corpus_path else None,
+            prompt_tokens=LengthDistribution.parse(prompt_spec) if prompt_spec else None,
+            output_tokens=LengthDistribution.parse(output_spec) if output_spec else None,
+            seed=int(os.environ.get("LLAMA_WORKLOAD_SEED", "0")),
+        )
+
+    def for_cell(self, *labels):
+        """Return a copy reseeded from ``seed`` and the cell *labels*.
+
+        Cells then draw different requests from the same distributions, so
+        a server reused from an earlier cell is not sent prompts it already
+        holds in its prompt cache. Reruns of a sweep still repeat exactly.
+        """
+        key = json.dumps([self.seed, *(str(label) for label in labels)])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return Workload(
+            self.corpus, self.prompt_tokens, self.output_tokens, int(digest[:8], 16)
+        )
+
+    def describe(self):
+        corpus_hash = None
+        if self.corpus:
+            encoded = json.dumps(self.corpus, sort_keys=True).encode("utf-8")
+            corpus_hash = hashlib.sha256(encoded).hexdigest()
+        return {
+            "corpus_sha256": corpus_hash,
+            "prompt_tokens": str(self.prompt_tokens) if self.prompt_tokens else None,
+            "output_tokens": str(self.output_tokens) if self.output_tokens else None,
+            "seed": self.seed,
+        }
+
+    def payloads(self, count, prompt, n_predict, temperature, stream):
+        rng = random.Random(self.seed)
+        payloads = []
+        for _ in range(count):
+            request_prompt, request_n_predict = prompt, n_predict
+            if self.corpus:
+                entry = rng.choice(self.corpus)
+                request_prompt = entry["prompt"]
+                request_n_predict = int(entry.get("n_predict", n_predict))
+            elif self.prompt_tokens:
+                request_prompt = synthesize_prompt(self.prompt_tokens.sample(rng), rng)
+            if self.output_tokens:
+                request_n_predict = self.output_tokens.sample(rng)
+            payloads.append(
+                {
+                    "prompt": request_prompt,
+                    "n_predict": request_n_predict,
+                    "temperature": temperature,
+                    "stream": stream,
+                }
+            )
+        return payloads
+
+
+def build_payloads(workload, prompt, n_predict, temperature, stream, count):
+    """Request bodies for one cell: the fixed prompt, or *workload*'s mix."""
+    if workload is None:
+        payload = {
+            "prompt": prompt,
+            "n_predict": n_predict,
+            "temperature": temperature,
+            "stream": stream,
+        }
+        return [payload] * count
+    return workload.payloads(count, prompt, n_predict, temperature, stream)
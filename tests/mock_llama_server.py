@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""Stand-in for ``llama-server`` that needs no model, for offline harness runs.
+
+Point ``LLAMA_SERVER_BIN`` at this file and ``LLAMA_MODEL_PATH`` at any
+existing file. It accepts the llama-server flags the harness passes
+(unknown ones are ignored) and serves ``/health``, ``/v1/models``,
+``/completion`` (streamed and not), ``/metrics`` (with ``--metrics``) and
+``/slots``. Responses carry llama-server's ``timings`` fields and the log
+output mimics its startup, slot and timing lines.
+
+Generation is simulated, so runs are deterministic apart from scheduling:
+
+- ``LLAMA_MOCK_TOKEN_MS``: delay per generated token (default ``0``).
+- ``LLAMA_MOCK_PROMPT_TOKEN_MS``: delay per uncached prompt token (default ``0``).
+- ``LLAMA_MOCK_BATCH_TOKEN_MS``: extra per-token delay for each other busy
+  slot, a crude model of batched decoding slowing down (default ``0``).
+- ``LLAMA_MOCK_SLOTS``: slot count (default ``--parallel``). Requests beyond
+  it wait for a free slot in arrival order.
+- ``LLAMA_MOCK_QUEUE_LIMIT``: waiting requests allowed before new ones get a
+  503 (default ``0`` = unbounded).
+- ``LLAMA_MOCK_LOAD_S``: simulated model load time; ``/health`` and
+  ``/completion`` answer 503 "Loading model" until it has passed.
+
+Prompts are split on whitespace to count tokens, and each slot keeps its
+last prompt so ``cache_prompt`` reuse shows up in ``timings.cache_n``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable"}
+
+
+def _env_float(name, default="0"):
+    return float(os.environ.get(name, default))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--model", "-m", default="")
+    parser.add_argument("--ctx-size", "-c", type=int, default=4096)
+    parser.add_argument("--parallel", "-np", type=int, default=1)
+    parser.add_argument("--batch-size", "-b", type=int, default=2048)
+    parser.add_argument("--ubatch-size", "--ubatch", "-ub", type=int, default=512)
+    parser.add_argument("--metrics", action="store_true")
+    parser.add_argument("--no-slots", action="store_true")
+    parser.add_argument("--log-disable", action="store_true")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
+class MockLlamaServer:
+    def __init__(self, args):
+        self.args = args
+        self.n_slots = int(os.environ.get("LLAMA_MOCK_SLOTS") or max(1, args.parallel))
+        self.token_s = _env_float("LLAMA_MOCK_TOKEN_MS") / 1000.0
+        self.prompt_token_s = _env_float("LLAMA_MOCK_PROMPT_TOKEN_MS") / 1000.0
+        self.batch_token_s = _env_float("LLAMA_MOCK_BATCH_TOKEN_MS") / 1000.0
+        self.queue_limit = int(os.environ.get("LLAMA_MOCK_QUEUE_LIMIT", "0"))
+        self.load_s = _env_float("LLAMA_MOCK_LOAD_S")
+        self.ready = False
+        self.free_slots = None
+        self.slot_prompts = {}
+        self.processing = set()
+        self.deferred = 0
+        self.next_task = 0
+        self.prompt_tokens_total = 0
+        self.tokens_predicted_total = 0
+
+    def log(self, message):
+        if not self.args.log_disable:
+            print(message, file=sys.stderr, flush=True)
+
+    async def load(self):
+        args = self.args
+        n_ctx_slot = args.ctx_size // self.n_slots
+        self.log(f"main: loading model '{args.model}'")
+        if self.load_s > 0:
+            await asyncio.sleep(self.load_s)
+        self.log("load_tensors: CPU_Mapped model buffer size = 0.00 MiB")
+        self.log(f"llama_context: n_ctx = {args.ctx_size}")
+        self.log(f"llama_context: n_batch = {args.batch_size}")
+        self.log(f"llama_context: n_ubatch = {args.ubatch_size}")
+        self.log("llama_kv_cache: CPU KV buffer size = 0.00 MiB")
+        self.log(f"srv init: initializing slots, n_slots = {self.n_slots}")
+        for slot in range(self.n_slots):
+            self.log(
+                f"slot init: id {slot:2d} | task -1 | new slot n_ctx_slot = {n_ctx_slot}"
+            )
+        self.free_slots = asyncio.Queue()
+        for slot in range(self.n_slots):
+            self.free_slots.put_nowait(slot)
+        self.ready = True
+        self.log("main: model loaded")
+        self.log(
+            f"main: server is listening on http://{args.host}:{args.port}"
+            " - starting the main loop"
+        )
+        self.log("srv update_slots: all slots are idle")
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0"))
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+                path = target.split("?", 1)[0]
+                await self.route(method, path, body, writer, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def send(self, writer, status, body, keep_alive, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        writer.write(
+            (
+                f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n"
+            ).encode("latin-1")
+            + body
+        )
+
+    def send_error(self, writer, status, message, keep_alive):
+        error = {"error": {"code": status, "message": message}}
+        self.send(writer, status, error, keep_alive)
+
+    async def route(self, method, path, body, writer, keep_alive):
+        if path == "/health":
+            if self.ready:
+                self.send(writer, 200, {"status": "ok"}, keep_alive)
+            else:
+                self.send_error(writer, 503, "Loading model", keep_alive)
+        elif not self.ready:
+            self.send_error(writer, 503, "Loading model", keep_alive)
+        elif path == "/v1/models":
+            model = os.path.basename(self.args.model)
+            models = {"object": "list", "data": [{"id": model}]}
+            self.send(writer, 200, models, keep_alive)
+        elif path == "/metrics" and self.args.metrics:
+            text = self.metrics().encode("utf-8")
+            self.send(writer, 200, text, keep_alive, "text/plain; version=0.0.4")
+        elif path == "/slots" and not self.args.no_slots:
+            self.send(writer, 200, self.slots(), keep_alive)
+        elif path in ("/completion", "/completions") and method == "POST":
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                self.send_error(writer, 400, "Invalid JSON", keep_alive)
+                return
+            await self.completion(payload, writer, keep_alive)
+        else:
+            self.send_error(writer, 404, "File Not Found", keep_alive)
+
+    def kv_tokens(self):
+        return sum(len(self.slot_prompts.get(slot, ())) for slot in self.processing)
+
+    def metrics(self):
+        values = {
+            "prompt_tokens_total": ("counter", self.prompt_tokens_total),
+            "tokens_predicted_total": ("counter", self.tokens_predicted_total),
+            "kv_cache_usage_ratio": (
+                "gauge",
+                min(1.0, self.kv_tokens() / max(1, self.args.ctx_size)),
+            ),
+            "kv_cache_tokens": ("gauge", self.kv_tokens()),
+            "requests_processing": ("gauge", len(self.processing)),
+            "requests_deferred": ("gauge", self.deferred),
+        }
+        lines = []
+        for name, (kind, value) in values.items():
+            lines.append(f"# HELP llamacpp:{name} {name.replace('_', ' ')}")
+            lines.append(f"# TYPE llamacpp:{name} {kind}")
+            lines.append(f"llamacpp:{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def slots(self):
+        n_ctx = self.args.ctx_size // self.n_slots
+        return [
+            {"id": slot, "n_ctx": n_ctx, "is_processing": slot in self.processing}
+            for slot in range(self.n_slots)
+        ]
+
+    async def acquire_slot(self):
+        if not self.free_slots.empty():
+            return self.free_slots.get_nowait()
+        if self.queue_limit and self.deferred >= self.queue_limit:
+            return None
+        self.deferred += 1
+        try:
+            return await self.free_slots.get()
+        finally:
+            self.deferred -= 1
+
+    async def completion(self, payload, writer, keep_alive):
+        prompt = payload.get("prompt", "")
+        prompt_tokens = prompt.split() if isinstance(prompt, str) else list(prompt)
+        n_predict = int(payload.get("n_predict", -1))
+        if n_predict < 0:
+            n_predict = 16
+        stream = bool(payload.get("stream", False))
+
+        slot = await self.acquire_slot()
+        if slot is None:
+            self.send_error(writer, 503, "Too many queued requests", keep_alive)
+            return
+        task = self.next_task
+        self.next_task += 1
+        self.processing.add(slot)
+        self.log(f"slot launch_slot_: id {slot:2d} | task {task} | processing task")
+        try:
+            cache_n = 0
+            if payload.get("cache_prompt", True):
+                for cached, token in zip(self.slot_prompts.get(slot, ()), prompt_tokens):
+                    if cached != token:
+                        break
+                    cache_n += 1
+            prompt_n = max(1, len(prompt_tokens) - cache_n)
+            self.slot_prompts[slot] = prompt_tokens
+
+            start = time.perf_counter()
+            if self.prompt_token_s > 0:
+                await asyncio.sleep(self.prompt_token_s * prompt_n)
+            prompt_ms = (time.perf_counter() - start) * 1000.0
+
+            if stream:
+                writer.write(
+                    (
+                        "HTTP/1.1 200 OK\r\n"
+                        "Content-Type: text/event-stream\r\n"
+                        "Transfer-Encoding: chunked\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                        "\r\n"
+                    ).encode("latin-1")
+                )
+            pieces = []
+            decode_start = time.perf_counter()
+            for index in range(n_predict):
+                delay = self.token_s + self.batch_token_s * (len(self.processing) - 1)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                piece = f" t{index}"
+                if stream:
+                    self.write_event(writer, {"content": piece, "stop": False})
+                    await writer.drain()
+                else:
+                    pieces.append(piece)
+            predicted_ms = (time.perf_counter() - decode_start) * 1000.0
+
+            self.prompt_tokens_total += prompt_n
+            self.tokens_predicted_total += n_predict
+            self.log_timing(slot, task, prompt_n, prompt_ms, n_predict, predicted_ms)
+            final = {
+                "content": "".join(pieces),
+                "stop": True,
+                "id_slot": slot,
+                "model": os.path.basename(self.args.model),
+                "tokens_predicted": n_predict,
+                "tokens_evaluated": len(prompt_tokens),
+                "tokens_cached": cache_n,
+                "timings": {
+                    "cache_n": cache_n,
+                    "prompt_n": prompt_n,
+                    "prompt_ms": prompt_ms,
+                    "prompt_per_second": _per_second(prompt_n, prompt_ms),
+                    "predicted_n": n_predict,
+                    "predicted_ms": predicted_ms,
+                    "predicted_per_second": _per_second(n_predict, predicted_ms),
+                },
+            }
+            if stream:
+                self.write_event(writer, final)
+                writer.write(b"0\r\n\r\n")
+            else:
+                self.send(writer, 200, final, keep_alive)
+        finally:
+            self.processing.discard(slot)
+            self.free_slots.put_nowait(slot)
+            self.log(f"slot release: id {slot:2d} | task {task} | stop processing")
+            if not self.processing:
+                self.log("srv update_slots: all slots are idle")
+
+    def log_timing(self, slot, task, prompt_n, prompt_ms, n_predict, predicted_ms):
+        if self.args.log_disable:
+            return
+        self.log(
+            f"slot print_timing: id {slot:2d} | task {task} | \n"
+            + _timing_line("prompt eval time", prompt_ms, prompt_n)
+            + "\n"
+            + _timing_line("eval time", predicted_ms, n_predict)
+            + "\n"
+            + f"{'total time':>17} = {prompt_ms + predicted_ms:10.2f} ms / "
+            f"{prompt_n + n_predict:5d} tokens"
+        )
+
+    @staticmethod
+    def write_event(writer, data):
+        event = f"data: {json.dumps(data)}\n\n".encode("utf-8")
+        writer.write(f"{len(event):x}\r\n".encode("latin-1") + event + b"\r\n")
+
+
+def _per_second(tokens, ms):
+    return tokens / (ms / 1000.0) if ms > 0 else 0.0
+
+
+def _timing_line(label, ms, tokens):
+    per_token = ms / tokens if tokens else 0.0
+    return (
+        f"{label:>17} = {ms:10.2f} ms / {tokens:5d} tokens "
+        f"({per_token:8.2f} ms per token, "
+        f"{_per_second(tokens, ms):8.2f} tokens per second)"
+    )
+
+
+async def serve(args):
+    server = MockLlamaServer(args)
+    listener = await asyncio.start_server(
+        server.handle, args.host, args.port, backlog=4096
+    )
+    server.log(
+        f"main: HTTP server is listening, hostname: {args.host}, port: {args.port}"
+    )
+    await server.load()
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    try:
+        asyncio.run(serve(parse_args(sys.argv[1:] if argv is None else argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+import urllib.request
+from pathlib import Path
+
+from tests.llama_load_utils import (
+    _AsyncConnection,
+    _post_json_async,
+    run_batch_processes,
+)
+
+MOCK_SERVER = Path(__file__).resolve().parent / "mock_llama_server.py"
+
+
+class _ScriptedServer:
+    """Serve keep-alive requests, acting out one scripted reply per request.
+
+    ``"ok"`` answers normally, ``"drop"`` closes without a response byte,
+    ``"cut"`` closes halfway through the body.
+    """
+
+    def __init__(self, script, stream=False):
+        self.script = list(script)
+        self.stream = stream
+        self.requests = 0
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode("latin-1").split("\r\n"):
+                    name, _, value = line.partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                self.requests += 1
+                action = self.script.pop(0)
+                if action == "drop":
+                    break
+                writer.write(self.response(cut=action == "cut"))
+                await writer.drain()
+                if action == "cut":
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    def response(self, cut):
+        if self.stream:
+            events = [
+                {"content": "a", "stop": False},
+                {"content": "b", "stop": True, "timings": {"predicted_n": 2}},
+            ]
+            body = b"".join(
+                b"data: " + json.dumps(event).encode("utf-8") + b"\n\n"
+                for event in events
+            )
+            chunked = f"{len(body):x}\r\n".encode("latin-1") + body + b"\r\n0\r\n\r\n"
+            if cut:
+                chunked = chunked[: len(chunked) // 2]
+            return b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n" + chunked
+        body = json.dumps({"content": "ab", "stop": True}).encode("utf-8")
+        head = f"HTTP/1.1 200 OK\r\nContent-Length: {len(body)}\r\n\r\n"
+        return head.encode("latin-1") + (body[: len(body) // 2] if cut else body)
+
+
+class AsyncConnectionRetryTest(unittest.TestCase):
+    def run_script(self, script, payload, stream=False):
+        async def main():
+            async with _ScriptedServer(script, stream) as server:
+                conn = _AsyncConnection("127.0.0.1", server.port)
+                results = []
+                try:
+                    for _ in range(2):
+                        try:
+                            results.append(
+                                await _post_json_async(conn, "/completion", payload, 5)
+                            )
+                        except Exception as exc:
+                            results.append(exc)
+                finally:
+                    conn.close()
+                return results, server.requests
+
+        return asyncio.run(main())
+
+    def test_idle_close_is_resent(self):
+        results, requests = self.run_script(["ok", "drop", "ok"], {"prompt": "x"})
+        self.assertEqual([result["content"] for result in results], ["ab", "ab"])
+        self.assertEqual(requests, 3)
+
+    def test_close_mid_body_is_not_resent(self):
+        results, requests = self.run_script(["ok", "cut"], {"prompt": "x"})
+        self.assertEqual(results[0]["content"], "ab")
+        self.assertIsInstance(results[1], asyncio.IncompleteReadError)
+        self.assertEqual(requests, 2)
+
+    def test_streamed_close_mid_body_is_not_resent(self):
+        payload = {"prompt": "x", "stream": True}
+        results, requests = self.run_script(["ok", "cut"], payload, stream=True)
+        self.assertEqual(results[0]["content"], "ab")
+        self.assertIsInstance(results[1], asyncio.IncompleteReadError)
+        self.assertEqual(requests, 2)
+
+    def test_resent_stream_starts_a_fresh_collector(self):
+        payload = {"prompt": "x", "stream": True}
+        results, requests = self.run_script(["ok", "drop", "ok"], payload, stream=True)
+        self.assertEqual([result["content"] for result in results], ["ab", "ab"])
+        self.assertEqual(requests, 3)
+
+
+
+class ProcessWorkerCrashTest(unittest.TestCase):
+    def setUp(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/completion"
+        server = subprocess.Popen(
+            [sys.executable, str(MOCK_SERVER), "--port", str(port), "--parallel", "4"],
+            env={**os.environ, "LLAMA_MOCK_TOKEN_MS": "20"},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.addCleanup(server.wait)
+        self.addCleanup(server.terminate)
+        deadline = time.time() + 10
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health"):
+                    break
+            except OSError:
+                if time.time() > deadline:
+                    self.fail("mock server did not become healthy")
+                time.sleep(0.05)
+
+    def test_killed_worker_is_counted_while_others_run(self):
+        def kill_first_worker():
+            time.sleep(0.5)
+            os.kill(multiprocessing.active_children()[0].pid, signal.SIGKILL)
+
+        threading.Thread(target=kill_first_worker, daemon=True).start()
+        payloads = [{"prompt": "hi", "n_predict": 8}] * 40
+        result = run_batch_processes(self.url, payloads, 4, processes=2)
+        completed = result["total_tokens"] // 8
+        self.assertGreater(result["errors"], 0)
+        self.assertEqual(completed + result["errors"], len(payloads))
+        self.assertIn("exited with code -9", str(result["last_error"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
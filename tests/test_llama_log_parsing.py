@@ -0,0 +1,103 @@
+import json
+import unittest
+
+from tests.llama_monitor_utils import parse_server_log
+from tests.llama_server_test_utils import StreamCollector
+
+STARTUP_LOG = [
+    "[     0.012] build: 4567 (abcdef1) with cc for x86_64-linux-gnu",
+    "[     0.410] load_tensors:        CUDA0 model buffer size =  3000.50 MiB",
+    "[     0.410] load_tensors:   CPU_Mapped model buffer size =   100.00 MiB",
+    "[     0.900] llama_context: n_ctx         = 8192",
+    "[     0.900] llama_context: n_batch       = 2048",
+    "[     0.900] llama_context: n_ubatch      = 512",
+    "[     0.950] llama_kv_cache_unified:      CUDA0 KV buffer size =  1024.00 MiB",
+    "[     1.200] srv    load_model: initializing slots, n_slots = 4",
+    "[     1.250] main: model loaded",
+    "[     1.251] main: server is listening on http://127.0.0.1:9000",
+]
+
+CELL_LOG = [
+    "slot launch_slot_: id  0 | task 1 | processing task",
+    "slot launch_slot_: id  1 | task 2 | processing task",
+    "srv  update_slots: decoding batch, n_tokens = 12",
+    "slot print_timing: id  0 | task 1 | prompt eval time = 5.00 ms",
+    "slot      release: id  0 | task 1 | stop processing: n_past = 40",
+    "slot launch_slot_: id  0 | task 3 | processing task",
+    "srv  update_slots: decoding batch, n_tokens = 4",
+    "slot print_timing: id  1 | task 2 | prompt eval time = 4.00 ms",
+    "slot      release: id  1 | task 2 | stop processing: n_past = 41",
+    "W warning: context shift is disabled",
+    "E srv  send_error: task id = 3, error: context size exceeded",
+]
+
+
+class ParseServerLogTest(unittest.TestCase):
+    def test_startup_stats(self):
+        stats = parse_server_log(STARTUP_LOG)
+        self.assertEqual(stats["model_mib"], 3100.5)
+        self.assertEqual(stats["kv_cache_mib"], 1024.0)
+        self.assertEqual(
+            (stats["n_ctx"], stats["n_batch"], stats["n_ubatch"], stats["n_slots"]),
+            (8192, 2048, 512, 4),
+        )
+        self.assertEqual(stats["load_s"], 1.25)
+        self.assertEqual((stats["warnings"], stats["errors"]), (0, 0))
+
+    def test_cell_stats(self):
+        stats = parse_server_log(CELL_LOG)
+        self.assertEqual(stats["tasks"], 2)
+        self.assertEqual(stats["slots_peak"], 2)
+        self.assertEqual(stats["batch_tokens_avg"], 8.0)
+        self.assertEqual((stats["warnings"], stats["errors"]), (1, 1))
+        self.assertEqual(stats["last_warning"], "W warning: context shift is disabled")
+
+    def test_unstamped_and_unknown_lines(self):
+        stats = parse_server_log(["main: model loaded", "something else entirely"])
+        self.assertNotIn("load_s", stats)
+        self.assertEqual(stats, {"tasks": 0, "warnings": 0, "errors": 0})
+
+
+def _sse(event):
+    return b"data: " + json.dumps(event).encode("utf-8") + b"\n\n"
+
+
+class StreamCollectorTest(unittest.TestCase):
+    def test_timings_from_chunk_arrival(self):
+        collector = StreamCollector(start=10.0)
+        collector.feed(_sse({"content": "Hel", "stop": False}), now=10.1)
+        # An event split across reads is only parsed once complete.
+        second = _sse({"content": "lo", "stop": False})
+        collector.feed(second[:7], now=10.2)
+        collector.feed(second[7:], now=10.3)
+        final = {"content": "", "stop": True, "timings": {"predicted_n": 2}}
+        collector.feed(_sse(final) + b"data: [DONE]\n\n", now=10.35)
+        response = collector.finish(end=10.4)
+
+        self.assertEqual(response["content"], "Hello")
+        self.assertEqual(response["timings"], {"predicted_n": 2})
+        client = response["client_timings"]
+        self.assertAlmostEqual(client["ttft_ms"], 100.0)
+        self.assertEqual(len(client["itl_ms"]), 1)
+        self.assertAlmostEqual(client["itl_ms"][0], 200.0)
+        self.assertAlmostEqual(client["latency_ms"], 400.0)
+
+    def test_ignores_comments_and_blank_data(self):
+        collector = StreamCollector(start=0.0)
+        collector.feed(b": keep-alive\n\ndata:\n\n", now=0.1)
+        collector.feed(_sse({"content": "x", "stop": True}), now=0.2)
+        response = collector.finish(end=0.3)
+        self.assertEqual(response["content"], "x")
+        # No token chunks: TTFT falls back to the end of the stream.
+        self.assertAlmostEqual(response["client_timings"]["ttft_ms"], 300.0)
+        self.assertEqual(response["client_timings"]["itl_ms"], [])
+
+    def test_missing_stop_event(self):
+        collector = StreamCollector(start=0.0)
+        collector.feed(_sse({"content": "x", "stop": False}), now=0.1)
+        with self.assertRaises(RuntimeError):
+            collector.finish(end=0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
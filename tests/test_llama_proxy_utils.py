@@ -0,0 +1,212 @@
+import http.server
+import json
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+from tests.llama_proxy_utils import (
+    HashHeaderPolicy,
+    HashPrefixPolicy,
+    LeastConnPolicy,
+    ProxyRequest,
+    RandomTwoPolicy,
+    RoundRobinPolicy,
+    reload_round_robin_proxy,
+    start_python_round_robin,
+)
+
+MOCK_SERVER = Path(__file__).resolve().parent / "mock_llama_server.py"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _upstreams(count):
+    return [SimpleNamespace(name=f"127.0.0.1:{9000 + i}", active=0) for i in range(count)]
+
+
+def _request(headers=None, prompt=None):
+    body = json.dumps({"prompt": prompt}).encode("utf-8") if prompt is not None else b""
+    return ProxyRequest("POST", "/completion", headers or {}, body)
+
+
+class BalancingPolicyTest(unittest.TestCase):
+    def test_round_robin_cycles(self):
+        upstreams = _upstreams(3)
+        policy = RoundRobinPolicy()
+        picks = [policy.choose(upstreams, _request()).name for _ in range(6)]
+        self.assertEqual(picks, [upstream.name for upstream in upstreams] * 2)
+
+    def test_least_conn_prefers_idle_and_rotates_ties(self):
+        upstreams = _upstreams(3)
+        upstreams[0].active = 2
+        policy = LeastConnPolicy()
+        picks = {policy.choose(upstreams, _request()).name for _ in range(4)}
+        self.assertEqual(picks, {upstreams[1].name, upstreams[2].name})
+
+    def test_random_two_picks_less_loaded(self):
+        upstreams = _upstreams(2)
+        upstreams[0].active = 5
+        policy = RandomTwoPolicy(seed=1)
+        for _ in range(10):
+            self.assertIs(policy.choose(upstreams, _request()), upstreams[1])
+        self.assertIs(policy.choose(upstreams[:1], _request()), upstreams[0])
+
+    def test_hash_header_is_sticky(self):
+        upstreams = _upstreams(4)
+        policy = HashHeaderPolicy("X-Session-Id")
+        request = _request({"x-session-id": "abc"})
+        first = policy.choose(upstreams, request)
+        for _ in range(5):
+            self.assertIs(policy.choose(upstreams, request), first)
+
+    def test_hash_keys_only_move_with_their_upstream(self):
+        upstreams = _upstreams(4)
+        policy = HashHeaderPolicy()
+        keys = [f"session-{index}" for index in range(200)]
+        before = {
+            key: policy.choose(upstreams, _request({"x-session-id": key})) for key in keys
+        }
+        removed = upstreams[1]
+        remaining = [upstream for upstream in upstreams if upstream is not removed]
+        for key in keys:
+            after = policy.choose(remaining, _request({"x-session-id": key}))
+            if before[key] is not removed:
+                self.assertIs(after, before[key])
+
+    def test_hash_prefix_uses_prompt_start(self):
+        upstreams = _upstreams(8)
+        policy = HashPrefixPolicy(chars=16)
+        self.assertEqual(policy.key(_request(prompt="x" * 16 + "tail one")), "x" * 16)
+        first = policy.choose(upstreams, _request(prompt="x" * 16 + "tail one"))
+        again = policy.choose(upstreams, _request(prompt="x" * 16 + "other"))
+        self.assertIs(again, first)
+        self.assertEqual(policy.key(ProxyRequest("POST", "/", {}, b"not json")), "")
+
+
+class _StatusHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        status = int(self.path.strip("/") or 200)
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class PythonProxyStatsTest(unittest.TestCase):
+    def test_relayed_5xx_counts_as_error(self):
+        backend = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _StatusHandler)
+        threading.Thread(target=backend.serve_forever, daemon=True).start()
+        self.addCleanup(backend.server_close)
+        self.addCleanup(backend.shutdown)
+
+        upstreams = [("127.0.0.1", backend.server_port)]
+        with start_python_round_robin(upstreams, _free_port()) as proxy:
+            statuses = []
+            for status in (200, 404, 500, 503):
+                try:
+                    with urllib.request.urlopen(f"{proxy['base_url']}/{status}") as resp:
+                        statuses.append(resp.status)
+                except urllib.error.HTTPError as exc:
+                    statuses.append(exc.code)
+            # The proxy records a request after relaying its response.
+            deadline = time.time() + 5
+            while time.time() < deadline:
+                stats = proxy["balancer"].stats()[f"127.0.0.1:{backend.server_port}"]
+                if stats["requests"] == 4:
+                    break
+                time.sleep(0.01)
+
+        self.assertEqual(statuses, [200, 404, 500, 503])
+        self.assertEqual((stats["requests"], stats["errors"]), (4, 2))
+
+
+
+def _start_mock(port):
+    process = subprocess.Popen(
+        [sys.executable, str(MOCK_SERVER), "--port", str(port), "--log-disable"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("mock server did not become healthy")
+
+
+def _complete(base_url):
+    request = urllib.request.Request(
+        f"{base_url}/completion",
+        data=json.dumps({"prompt": "x", "n_predict": 2}).encode("utf-8"),
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+class PythonProxyRestartTest(unittest.TestCase):
+    """A server restarted on the same port leaves stale pooled connections."""
+
+    def setUp(self):
+        self.port = _free_port()
+        self.server = _start_mock(self.port)
+        self.addCleanup(self._stop_server)
+
+    def _stop_server(self):
+        self.server.terminate()
+        self.server.wait()
+
+    def _fill_pool(self, base_url):
+        with ThreadPoolExecutor(4) as executor:
+            statuses = list(executor.map(_complete, [base_url] * 16))
+        self.assertEqual(statuses, [200] * 16)
+
+    def _restart_server(self):
+        self._stop_server()
+        self.server = _start_mock(self.port)
+
+    def test_stale_connections_are_retried_on_a_fresh_one(self):
+        with start_python_round_robin([("127.0.0.1", self.port)], _free_port()) as proxy:
+            self._fill_pool(proxy["base_url"])
+            self._restart_server()
+            self._fill_pool(proxy["base_url"])
+            stats = proxy["balancer"].stats()[f"127.0.0.1:{self.port}"]
+        self.assertEqual(stats["errors"], 0)
+
+    def test_reload_after_relaunch_drops_idle_connections(self):
+        upstreams = [("127.0.0.1", self.port)]
+        with start_python_round_robin(upstreams, _free_port()) as proxy:
+            self._fill_pool(proxy["base_url"])
+            (upstream,) = proxy["balancer"]._upstreams
+            self.assertTrue(upstream._idle)
+            reload_round_robin_proxy(proxy, upstreams)
+            self.assertTrue(upstream._idle)
+            reload_round_robin_proxy(proxy, upstreams, relaunched=True)
+            self.assertEqual(upstream._idle, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
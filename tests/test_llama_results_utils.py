@@ -0,0 +1,176 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tests.llama_results_utils import ResultsIndex, ResultsRun
+
+ANALYZE_DATA = Path(__file__).resolve().parent.parent / "analyze-data.py"
+HEADER = ["instances", "parallel", "concurrency", "throughput_tps", "errors", "note"]
+
+
+class ResultsIndexTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        model = self.root / "model.gguf"
+        model.write_bytes(b"gguf" * 1024)
+        env = mock.patch.dict(os.environ, {"LLAMA_MODEL_PATH": str(model)})
+        env.start()
+        self.addCleanup(env.stop)
+        self.index = ResultsIndex(self.root / "store")
+        self.addCleanup(self.index.close)
+
+    def _run(self, kind, rows):
+        run = ResultsRun.start(kind, HEADER, index=self.index)
+        for row in rows:
+            run.append(row)
+        run.close()
+        return run
+
+    def test_sort_filter_and_tags(self):
+        first = self._run(
+            "full_sweep",
+            [
+                [1, 4, 8, "120.5", "0", ""],
+                [1, 4, 16, "240.0", "2", "x"],
+                [2, 4, 16, "", "0", ""],
+            ],
+        )
+        self._run("round_robin_sweep", [[1, 1, 16, "999.0", "0", ""]])
+
+        rows = self.index.query_rows(kind="full_sweep")
+        # Rows without a throughput sort last.
+        self.assertEqual([row["throughput_tps"] for row in rows], [240.0, 120.5, None])
+        self.assertEqual(rows[0]["run_id"], first.run_id)
+        self.assertEqual(rows[0]["run_kind"], "full_sweep")
+        self.assertEqual(rows[0]["model_hash"], first.tags["model_hash"])
+
+        rows = self.index.query_rows(where={"concurrency": "16"}, reverse=False)
+        self.assertEqual([row["throughput_tps"] for row in rows], [240.0, 999.0, None])
+        rows = self.index.query_rows(where={"note": "x"})
+        self.assertEqual([row["concurrency"] for row in rows], [16])
+        rows = self.index.query_rows(sort_field="errors", count=1)
+        self.assertEqual(rows[0]["errors"], 2)
+        rows = self.index.query_rows(run=first.run_id[:20], where={"instances": 2})
+        self.assertEqual(len(rows), 1)
+
+    def test_indexed_columns_use_an_index(self):
+        self._run("full_sweep", [[1, 4, 8, "1.0", "0", ""]])
+        plan = self.index.execute(
+            "EXPLAIN QUERY PLAN SELECT data FROM rows WHERE concurrency = 8"
+        )
+        self.assertIn("rows_concurrency", plan[0]["detail"])
+
+    def test_runs_are_finalized_with_a_columnar_file(self):
+        run = self._run("full_sweep", [[1, 4, 8, "1.0", "0", ""]])
+        (record,) = self.index.runs(kind="full_sweep")
+        self.assertEqual(record["run_id"], run.run_id)
+        self.assertEqual(record["status"], "finished")
+        self.assertEqual(record["row_count"], 1)
+        self.assertTrue(Path(record["data_path"]).is_file())
+        self.assertEqual(self.index.runs(kind="other"), [])
+
+    def test_dead_runs_are_marked_interrupted(self):
+        run = ResultsRun.start("full_sweep", HEADER, index=self.index)
+        run.append([1, 1, 1, "1.0", "0", ""])
+        # Pretend its process died: no exit-time close, and a pid past pid_max.
+        run._closed = True
+        self.index.execute(
+            "UPDATE runs SET pid = ? WHERE run_id = ?", (2**22 + 1, run.run_id)
+        )
+        self.index.finalize_stale()
+        (record,) = self.index.runs(run=run.run_id)
+        self.assertEqual(record["status"], "interrupted")
+        self.assertEqual(record["row_count"], 1)
+
+    def test_old_stores_get_the_indexed_columns(self):
+        old_root = self.root / "old"
+        old_root.mkdir()
+        db = sqlite3.connect(old_root / "index.sqlite")
+        db.execute(
+            "CREATE TABLE rows (run_id TEXT NOT NULL, row_index INTEGER NOT NULL,"
+            " throughput_tps REAL, errors INTEGER, data TEXT NOT NULL,"
+            " PRIMARY KEY (run_id, row_index))"
+        )
+        db.execute(
+            "INSERT INTO rows VALUES ('r', 0, 5.0, 0, ?)",
+            (json.dumps({"concurrency": 4, "parallel": 2, "instances": 1}),),
+        )
+        db.commit()
+        db.close()
+        index = ResultsIndex(old_root)
+        self.addCleanup(index.close)
+        (row,) = index.execute("SELECT concurrency, parallel, instances FROM rows")
+        self.assertEqual(tuple(row), (4, 2, 1))
+
+    def test_tee_keeps_writing_the_csv_when_the_store_fails(self):
+        run = ResultsRun.start("full_sweep", HEADER, index=self.index)
+        buffer = io.StringIO()
+        writer = run.tee(csv.writer(buffer))
+        writer.writerow([1, 1, 1, "1.0", "0", ""])
+        self.index.close()
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            writer.writerow([1, 1, 2, "2.0", "0", ""])
+            writer.writerow([1, 1, 4, "3.0", "0", ""])
+        self.assertEqual(len(buffer.getvalue().splitlines()), 3)
+        self.assertEqual(stderr.getvalue().count("results store disabled"), 1)
+
+
+class AnalyzeStoreTest(unittest.TestCase):
+    """``analyze-data.py --store`` reading a store from outside the repo."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        env = mock.patch.dict(os.environ, {"LLAMA_MODEL_PATH": ""})
+        env.start()
+        self.addCleanup(env.stop)
+        self.store = self.root / "store"
+        index = ResultsIndex(self.store)
+        self.addCleanup(index.close)
+        self.run = ResultsRun.start("full_sweep", HEADER, index=index)
+        self.run.append([1, 4, 8, "120.5", "0", ""])
+        self.run.append([1, 4, 16, "240.0", "0", ""])
+        self.run.close()
+
+    def analyze(self, *args):
+        result = subprocess.run(
+            [sys.executable, str(ANALYZE_DATA), "--store", str(self.store), *args],
+            cwd=self.root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return result.stdout.splitlines()
+
+    def test_runs(self):
+        header, _, line = self.analyze("--runs")
+        self.assertTrue(header.startswith("run_id"))
+        self.assertIn(self.run.run_id, line)
+        self.assertIn("finished", line)
+
+    def test_rows_with_where_and_columns(self):
+        lines = self.analyze(
+            "--where", "concurrency=16", "--columns", "concurrency,throughput_tps"
+        )
+        # Header, separator, then the one matching row.
+        self.assertEqual(lines[0].split(), ["concurrency", "|", "throughput_tps"])
+        self.assertEqual([line.split() for line in lines[2:]], [["16", "|", "240.0"]])
+        self.assertEqual(self.analyze("--where", "concurrency=3"), ["No matching rows."])
+        self.assertIn("expects column=value", self.analyze("--where", "oops")[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,12 +7,12 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 # Suppress ResourceWarning for unclosed sockets in threaded urllib use (Python 3.12)
 warnings.filterwarnings("ignore", category=ResourceWarning, message="unclosed .*socket")
 
+from tests.llama_proxy_utils import start_round_robin_proxy
 from tests.llama_server_test_utils import (
     extract_token_count,
     extract_tokens_per_second,
     post_json,
     start_llama_servers,
-    start_nginx_round_robin,
 )
 
 
@@ -53,7 +53,7 @@ class LlamaServerRoundRobinTest(unittest.TestCase):
             base_port=base_port,
         ) as servers:
             upstreams = [(server["host"], server["port"]) for server in servers]
-            with start_nginx_round_robin(
+            with start_round_robin_proxy(
                 upstreams,
                 listen_port=nginx_port,
                 listen_host=servers[0]["host"],
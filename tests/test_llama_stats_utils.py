@@ -0,0 +1,65 @@
+import unittest
+
+from tests.llama_stats_utils import LatencyHistogram, percentile_fields
+
+
+def _histogram(values):
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    return histogram
+
+
+class LatencyHistogramTest(unittest.TestCase):
+    def test_percentiles_within_bucket_precision(self):
+        values = [float(value) for value in range(1, 1001)]
+        histogram = _histogram(values)
+        for percent, exact in ((50, 500.0), (90, 900.0), (99, 990.0)):
+            value = histogram.percentile(percent)
+            self.assertAlmostEqual(value, exact, delta=exact * 0.01)
+        self.assertEqual(histogram.percentile(100), 1000.0)
+        self.assertEqual((histogram.min, histogram.max), (1.0, 1000.0))
+        self.assertAlmostEqual(histogram.mean, 500.5)
+
+    def test_small_values_are_exact(self):
+        histogram = _histogram([0.01, 0.02, 0.03])
+        self.assertAlmostEqual(histogram.percentile(50), 0.02, places=3)
+
+    def test_percentiles_clamped_to_observed_range(self):
+        histogram = _histogram([123.456])
+        for percent in (1, 50, 99):
+            self.assertEqual(histogram.percentile(percent), 123.456)
+
+    def test_empty_and_missing_values(self):
+        histogram = LatencyHistogram()
+        histogram.record(None)
+        self.assertEqual(histogram.count, 0)
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+        self.assertEqual(
+            percentile_fields("ttft_ms", histogram),
+            {"ttft_ms_p50": None, "ttft_ms_p90": None, "ttft_ms_p99": None},
+        )
+
+    def test_merge_matches_single_histogram(self):
+        values = [0.5 * index for index in range(1, 401)]
+        merged = _histogram(values[::2]).merge(_histogram(values[1::2]))
+        whole = _histogram(values)
+        self.assertEqual(merged.counts, whole.counts)
+        self.assertEqual((merged.count, merged.min, merged.max), (400, 0.5, 200.0))
+        self.assertAlmostEqual(merged.total, whole.total)
+        self.assertEqual(merged.percentile(90), whole.percentile(90))
+
+    def test_merge_into_empty(self):
+        merged = LatencyHistogram().merge(_histogram([5.0, 7.0]))
+        self.assertEqual((merged.min, merged.max, merged.count), (5.0, 7.0, 2))
+
+    def test_to_dict(self):
+        data = _histogram([1.0, 2.0, 2.0]).to_dict()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(sum(count for _, count in data["buckets"]), 3)
+        self.assertEqual(set(data["percentiles"]), {"p50", "p90", "p99"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import unittest
+
+from tests.llama_server_test_utils import StreamCollector
+
+
+def _sse(event):
+    return b"data: " + json.dumps(event).encode("utf-8") + b"\n\n"
+
+
+class StreamCollectorTest(unittest.TestCase):
+    def test_timings_from_chunk_arrival(self):
+        collector = StreamCollector(start=10.0)
+        collector.feed(_sse({"content": "Hel", "stop": False}), now=10.1)
+        # An event split across reads is only parsed once complete.
+        second = _sse({"content": "lo", "stop": False})
+        collector.feed(second[:7], now=10.2)
+        collector.feed(second[7:], now=10.3)
+        final = {"content": "", "stop": True, "timings": {"predicted_n": 2}}
+        collector.feed(_sse(final) + b"data: [DONE]\n\n", now=10.35)
+        response = collector.finish(end=10.4)
+
+        self.assertEqual(response["content"], "Hello")
+        self.assertEqual(response["timings"], {"predicted_n": 2})
+        client = response["client_timings"]
+        self.assertAlmostEqual(client["ttft_ms"], 100.0)
+        self.assertEqual(len(client["itl_ms"]), 1)
+        self.assertAlmostEqual(client["itl_ms"][0], 200.0)
+        self.assertAlmostEqual(client["latency_ms"], 400.0)
+
+    def test_ignores_comments_and_blank_data(self):
+        collector = StreamCollector(start=0.0)
+        collector.feed(b": keep-alive\n\ndata:\n\n", now=0.1)
+        collector.feed(_sse({"content": "x", "stop": True}), now=0.2)
+        response = collector.finish(end=0.3)
+        self.assertEqual(response["content"], "x")
+        # No token chunks: TTFT falls back to the end of the stream.
+        self.assertAlmostEqual(response["client_timings"]["ttft_ms"], 300.0)
+        self.assertEqual(response["client_timings"]["itl_ms"], [])
+
+    def test_missing_stop_event(self):
+        collector = StreamCollector(start=0.0)
+        collector.feed(_sse({"content": "x", "stop": False}), now=0.1)
+        with self.assertRaises(RuntimeError):
+            collector.finish(end=0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.llama_sweep_utils import (
+    PlateauTracker,
+    SweepState,
+    config_hash,
+    parse_bool_list,
+    parse_optional_int_list,
+    refine_points,
+)
+
+
+class ConfigHashTest(unittest.TestCase):
+    def test_ignores_key_order(self):
+        self.assertEqual(
+            config_hash({"a": 1, "b": [1, 2]}), config_hash({"b": [1, 2], "a": 1})
+        )
+
+    def test_changes_with_values(self):
+        self.assertNotEqual(config_hash({"a": 1}), config_hash({"a": 2}))
+        self.assertEqual(len(config_hash({})), 12)
+
+
+class SweepStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = Path(self.tmp.name)
+        self.csv = self.dir / "full_sweep_1.csv"
+        self.csv.write_text("header\n", encoding="utf-8")
+        self.config = {"parallel": [1, 2]}
+
+    def test_resume_finds_recorded_cells(self):
+        state = SweepState.open(self.dir, "full_sweep", self.config, self.csv)
+        self.assertFalse(state.resumed)
+        key = SweepState.cell_key(1, 2, "default")
+        state.record(key, 10.0, 0, False)
+        state.record(key, 20.0, 0, False)
+
+        resumed = SweepState.open(
+            self.dir, "full_sweep", self.config, self.dir / "full_sweep_2.csv"
+        )
+        self.assertTrue(resumed.resumed)
+        self.assertEqual(resumed.results_path, self.csv)
+        self.assertEqual(resumed.samples(key), 2)
+        self.assertEqual(resumed.recorded, 2)
+        self.assertEqual(resumed.outcome(key), (15.0, False))
+        self.assertEqual(resumed.outcome("missing"), (None, False))
+
+    def test_errors_mark_a_cell_failed(self):
+        state = SweepState.open(self.dir, "full_sweep", self.config, self.csv)
+        state.record("a", 5.0, 3, False)
+        state.record("b", 0.0, 0, True)
+        self.assertEqual(state.outcome("a"), (5.0, True))
+        self.assertEqual(state.outcome("b"), (0.0, True))
+
+    def test_other_config_starts_fresh(self):
+        state = SweepState.open(self.dir, "full_sweep", self.config, self.csv)
+        state.record("a", 1.0, 0, False)
+        other = SweepState.open(
+            self.dir, "full_sweep", {"parallel": [4]}, self.dir / "other.csv"
+        )
+        self.assertFalse(other.resumed)
+        self.assertEqual(other.samples("a"), 0)
+
+    def test_resume_disabled_overwrites(self):
+        state = SweepState.open(self.dir, "full_sweep", self.config, self.csv)
+        state.record("a", 1.0, 0, False)
+        fresh = SweepState.open(
+            self.dir, "full_sweep", self.config, self.csv, resume=False
+        )
+        self.assertFalse(fresh.resumed)
+        self.assertEqual(fresh.recorded, 0)
+
+    def test_torn_last_line_is_skipped(self):
+        state = SweepState.open(self.dir, "full_sweep", self.config, self.csv)
+        state.record("a", 1.0, 0, False)
+        with open(state.path, "a", encoding="utf-8") as handle:
+            handle.write('{"cell": "b", "throu')
+
+        resumed = SweepState.open(self.dir, "full_sweep", self.config, self.csv)
+        self.assertEqual(resumed.recorded, 1)
+        resumed.record("c", 2.0, 0, False)
+        lines = state.path.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(json.loads(lines[-1])["cell"], "c")
+        self.assertEqual(
+            SweepState.open(self.dir, "full_sweep", self.config, self.csv).recorded, 2
+        )
+
+
+class PlateauTrackerTest(unittest.TestCase):
+    def test_stops_after_patience_flat_steps(self):
+        tracker = PlateauTracker(min_gain_pct=5.0, patience=2)
+        self.assertFalse(tracker.update(100.0, key=1))
+        self.assertFalse(tracker.update(120.0, key=2))
+        # +2% is not progress, but still the new best.
+        self.assertFalse(tracker.update(122.0, key=4))
+        self.assertTrue(tracker.update(121.0, key=8))
+        self.assertEqual((tracker.best, tracker.best_key), (122.0, 4))
+
+    def test_gain_resets_patience(self):
+        tracker = PlateauTracker(min_gain_pct=5.0, patience=2)
+        tracker.update(100.0)
+        tracker.update(101.0)
+        self.assertFalse(tracker.update(200.0))
+        self.assertEqual(tracker.stale, 0)
+
+    def test_failure_stops_at_once(self):
+        tracker = PlateauTracker()
+        tracker.update(100.0)
+        self.assertTrue(tracker.update(0.0, failed=True))
+        self.assertTrue(tracker.stopped)
+        self.assertEqual(tracker.best, 100.0)
+
+
+class RefinePointsTest(unittest.TestCase):
+    def test_midpoints_around_center(self):
+        self.assertEqual(refine_points([1, 4, 16, 64], 16), [10, 40])
+
+    def test_edges_and_collisions(self):
+        self.assertEqual(refine_points([1, 4, 16], 1), [2])
+        self.assertEqual(refine_points([1, 2, 3], 2), [])
+        self.assertEqual(refine_points([1, 4], 8), [])
+
+    def test_float_points(self):
+        self.assertEqual(refine_points([0.5, 1.0, 2.0], 1.0, integer=False), [0.75, 1.5])
+
+
+class ParseListTest(unittest.TestCase):
+    def test_optional_int_list(self):
+        parsed = parse_optional_int_list("default, 256 512", "")
+        self.assertEqual(parsed, [None, 256, 512])
+        self.assertEqual(parse_optional_int_list("", ""), [None])
+
+    def test_bool_list(self):
+        self.assertEqual(parse_bool_list(None, "0,1,yes,off"), [False, True, True, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from tests.llama_workload_utils import (
+    LengthDistribution,
+    Workload,
+    build_payloads,
+    load_prompt_corpus,
+)
+
+
+class LengthDistributionTest(unittest.TestCase):
+    def test_parse_specs(self):
+        self.assertEqual(str(LengthDistribution.parse("128")), "fixed:128")
+        uniform = LengthDistribution.parse(" uniform:64,512 ")
+        self.assertEqual(str(uniform), "uniform:64,512")
+        self.assertEqual(LengthDistribution.parse("choice:1,2,3").params, [1.0, 2.0, 3.0])
+
+    def test_invalid_specs(self):
+        for spec in ("gamma:1,2", "uniform:64", "normal:1,2,3", "choice:"):
+            with self.assertRaises(ValueError, msg=spec):
+                LengthDistribution.parse(spec)
+
+    def test_samples_stay_in_range(self):
+        rng = random.Random(1)
+        uniform = LengthDistribution.parse("uniform:10,20")
+        self.assertTrue(all(10 <= uniform.sample(rng) <= 20 for _ in range(200)))
+        choice = LengthDistribution.parse("choice:3,7")
+        self.assertEqual({choice.sample(rng) for _ in range(200)}, {3, 7})
+        # Negative draws are clamped to one token.
+        normal = LengthDistribution.parse("normal:1,50")
+        self.assertTrue(all(normal.sample(rng) >= 1 for _ in range(200)))
+
+    def test_lognormal_median(self):
+        rng = random.Random(2)
+        distribution = LengthDistribution.parse("lognormal:256,0.5")
+        samples = sorted(distribution.sample(rng) for _ in range(2001))
+        self.assertAlmostEqual(samples[1000], 256, delta=256 * 0.1)
+
+
+class BuildPayloadsTest(unittest.TestCase):
+    def test_without_workload_repeats_the_prompt(self):
+        payloads = build_payloads(None, "hi", 16, 0.2, True, 3)
+        self.assertEqual(len(payloads), 3)
+        self.assertEqual(
+            payloads[0],
+            {"prompt": "hi", "n_predict": 16, "temperature": 0.2, "stream": True},
+        )
+
+    def test_synthetic_workload_is_seeded(self):
+        workload = Workload(
+            prompt_tokens=LengthDistribution.parse("uniform:4,8"),
+            output_tokens=LengthDistribution.parse("choice:5,9"),
+            seed=3,
+        )
+        first = build_payloads(workload, "unused", 16, 0.0, False, 20)
+        self.assertEqual(first, build_payloads(workload, "unused", 16, 0.0, False, 20))
+        for payload in first:
+            self.assertTrue(4 <= len(payload["prompt"].split()) <= 8)
+            self.assertIn(payload["n_predict"], {5, 9})
+
+    def test_cells_draw_their_own_requests(self):
+        workload = Workload(prompt_tokens=LengthDistribution.parse("16"), seed=3)
+
+        def prompts(cell_workload):
+            payloads = build_payloads(cell_workload, "unused", 16, 0.0, False, 5)
+            return [payload["prompt"] for payload in payloads]
+
+        cell = workload.for_cell("1|2", 0)
+        self.assertEqual(prompts(cell), prompts(workload.for_cell("1|2", 0)))
+        self.assertNotEqual(prompts(cell), prompts(workload.for_cell("1|2", 1)))
+        self.assertNotEqual(prompts(cell), prompts(workload.for_cell("1|4", 0)))
+        self.assertNotEqual(cell.seed, workload.for_cell("1|2", 0, "direct").seed)
+        self.assertEqual(workload.seed, 3)
+
+    def test_corpus_workload(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "prompts.jsonl")
+            with open(path, "w", encoding="utf-8") as handle:
+                handle.write(json.dumps({"prompt": "a", "n_predict": 4}) + "\n\n")
+                handle.write(json.dumps({"prompt": "b"}) + "\n")
+            corpus = load_prompt_corpus(path)
+        payloads = build_payloads(Workload(corpus=corpus), "x", 32, 0.0, False, 50)
+        self.assertEqual({payload["prompt"] for payload in payloads}, {"a", "b"})
+        for payload in payloads:
+            self.assertEqual(payload["n_predict"], 4 if payload["prompt"] == "a" else 32)
+
+    def test_from_env(self):
+        with mock.patch.dict(os.environ, {"LLAMA_PROMPT_TOKENS": "64"}, clear=True):
+            workload = Workload.from_env()
+        self.assertEqual(workload.describe()["prompt_tokens"], "fixed:64")
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(Workload.from_env())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+MOCK_SERVER = Path(__file__).resolve().parent / "mock_llama_server.py"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url, timeout=10):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.read()
+
+
+def _post(url, payload, timeout=10):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    return _get(request, timeout)
+
+
+class MockServerTestCase(unittest.TestCase):
+    args = ["--parallel", "2", "--metrics"]
+    env = {}
+
+    def setUp(self):
+        port = _free_port()
+        self.base_url = f"http://127.0.0.1:{port}"
+        env = {
+            key: value for key, value in os.environ.items()
+            if not key.startswith("LLAMA_MOCK_")
+        }
+        env.update(self.env)
+        self.process = subprocess.Popen(
+            [sys.executable, str(MOCK_SERVER), "--port", str(port), *self.args],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.addCleanup(self.process.wait, 10)
+        self.addCleanup(self.process.terminate)
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.time() > deadline or self.process.poll() is not None:
+                    self.fail("mock server did not start listening")
+                time.sleep(0.05)
+
+    def wait_healthy(self, timeout=10):
+        deadline = time.time() + timeout
+        while _get(f"{self.base_url}/health")[0] != 200:
+            if time.time() > deadline:
+                self.fail("mock server did not become healthy")
+            time.sleep(0.05)
+
+
+class MockServerEndpointsTest(MockServerTestCase):
+    def test_health_and_models(self):
+        self.wait_healthy()
+        status, body = _get(f"{self.base_url}/health")
+        self.assertEqual((status, json.loads(body)), (200, {"status": "ok"}))
+        status, body = _get(f"{self.base_url}/v1/models")
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)["data"]), 1)
+        self.assertEqual(_get(f"{self.base_url}/nope")[0], 404)
+
+    def test_completion(self):
+        self.wait_healthy()
+        payload = {"prompt": "a b c d", "n_predict": 5, "cache_prompt": True}
+        status, body = _post(f"{self.base_url}/completion", payload)
+        self.assertEqual(status, 200)
+        response = json.loads(body)
+        self.assertTrue(response["stop"])
+        self.assertEqual(response["content"], " t0 t1 t2 t3 t4")
+        timings = response["timings"]
+        self.assertEqual((timings["prompt_n"], timings["predicted_n"]), (4, 5))
+
+        # Idle slots are handed out in turn, so the third request lands on the
+        # first slot again and reuses its cached prompt.
+        _, body = _post(f"{self.base_url}/completion", payload)
+        self.assertEqual(json.loads(body)["timings"]["cache_n"], 0)
+        _, body = _post(f"{self.base_url}/completion", payload)
+        self.assertEqual(json.loads(body)["timings"]["cache_n"], 4)
+
+    def test_streamed_completion(self):
+        self.wait_healthy()
+        payload = {"prompt": "hello", "n_predict": 3, "stream": True}
+        status, body = _post(f"{self.base_url}/completion", payload)
+        self.assertEqual(status, 200)
+        events = [
+            json.loads(line[len(b"data: "):])
+            for line in body.splitlines()
+            if line.startswith(b"data: ")
+        ]
+        self.assertEqual([event["stop"] for event in events], [False] * 3 + [True])
+        self.assertEqual("".join(event["content"] for event in events), " t0 t1 t2")
+        self.assertEqual(events[-1]["timings"]["predicted_n"], 3)
+
+    def test_metrics_and_slots(self):
+        self.wait_healthy()
+        _post(f"{self.base_url}/completion", {"prompt": "x y", "n_predict": 4})
+        status, body = _get(f"{self.base_url}/metrics")
+        self.assertEqual(status, 200)
+        metrics = dict(
+            line.split(" ", 1)
+            for line in body.decode("utf-8").splitlines()
+            if line and not line.startswith("#")
+        )
+        self.assertEqual(metrics["llamacpp:tokens_predicted_total"], "4")
+        self.assertEqual(metrics["llamacpp:prompt_tokens_total"], "2")
+        status, body = _get(f"{self.base_url}/slots")
+        self.assertEqual(status, 200)
+        self.assertEqual([slot["id"] for slot in json.loads(body)], [0, 1])
+
+
+class MockServerLoadingTest(MockServerTestCase):
+    env = {"LLAMA_MOCK_LOAD_S": "1"}
+
+    def test_loading_answers_503(self):
+        status, body = _get(f"{self.base_url}/health")
+        self.assertEqual(status, 503)
+        self.assertEqual(json.loads(body)["error"]["message"], "Loading model")
+        self.assertEqual(_post(f"{self.base_url}/completion", {"prompt": "x"})[0], 503)
+        self.wait_healthy()
+
+
+class MockServerLatencyTest(MockServerTestCase):
+    env = {"LLAMA_MOCK_TOKEN_MS": "20", "LLAMA_MOCK_PROMPT_TOKEN_MS": "10"}
+
+    def test_token_delays(self):
+        self.wait_healthy()
+        start = time.perf_counter()
+        payload = {"prompt": "a b c d e", "n_predict": 10}
+        _, body = _post(f"{self.base_url}/completion", payload)
+        elapsed = time.perf_counter() - start
+        timings = json.loads(body)["timings"]
+        self.assertGreaterEqual(timings["prompt_ms"], 5 * 10 * 0.9)
+        self.assertGreaterEqual(timings["predicted_ms"], 10 * 20 * 0.9)
+        self.assertGreaterEqual(elapsed, 0.25 * 0.9)
+
+
+class MockServerQueueLimitTest(MockServerTestCase):
+    args = ["--parallel", "1"]
+    env = {"LLAMA_MOCK_TOKEN_MS": "50", "LLAMA_MOCK_QUEUE_LIMIT": "1"}
+
+    def test_requests_beyond_the_queue_get_503(self):
+        self.wait_healthy()
+        statuses = []
+
+        def send():
+            payload = {"prompt": "x", "n_predict": 10}
+            statuses.append(_post(f"{self.base_url}/completion", payload)[0])
+
+        # One request runs, one waits for the slot, the third is turned away.
+        threads = []
+        for _ in range(3):
+            thread = threading.Thread(target=send)
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.1)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(statuses), [200, 200, 503])
+
+
+if __name__ == "__main__":
+    unittest.main()